@@ -0,0 +1,233 @@
+"""
+Caches of agent answers.
+
+Semantic cache: a question whose embedding is close enough (cosine similarity
+above a threshold) to an earlier question on the same product and the same set
+of insurers reuses that question's retrieval results and comparison. Entries
+expire after a TTL and are ignored as soon as the index version changes
+(new upsert, deletion, other embedding model or dimensions).
+
+Comparison cache: a comparison is reused when another question retrieves
+exactly the same chunks for every insurer, whatever its phrasing. The key
+combines the sorted chunk ids per insurer, the product, the prompt version,
+the model and the index version; the least recently used entries are evicted
+beyond a maximum size.
+
+The index version is derived from the upsert manifests under
+data/processed/*/manifests, relative to the working directory. Both caches
+are therefore only invalidated by upserts run from the same checkout as the
+agent. When the index is upserted elsewhere (another machine, CI), set
+INDEX_VERSION to a value that changes with each upsert (e.g. the upsert
+commit or date). Otherwise cached answers keep being served from the old
+index until their TTL expires.
+
+Environment variables:
+    SEMANTIC_CACHE_PATH       SQLite file (default data/processed/semantic_cache.sqlite)
+    SEMANTIC_CACHE_THRESHOLD  minimum cosine similarity for a hit (default 0.95)
+    SEMANTIC_CACHE_TTL        entry lifetime in seconds (default 86400)
+    COMPARISON_CACHE_PATH     SQLite file (default data/processed/comparison_cache.sqlite)
+    COMPARISON_CACHE_SIZE     maximum number of cached comparisons (default 1000)
+    COMPARISON_CACHE_TTL      entry lifetime in seconds (default 604800)
+    INDEX_VERSION             index version to use instead of the local manifests
+"""
+
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from src.vectorization.index_settings import IndexSettings, get_index_settings
+from src.vectorization.manifest import manifests_version
+
+DEFAULT_SEMANTIC_CACHE_PATH = "data/processed/semantic_cache.sqlite"
+DEFAULT_THRESHOLD = 0.95
+DEFAULT_TTL_SECONDS = 24 * 3600
+DEFAULT_COMPARISON_CACHE_PATH = "data/processed/comparison_cache.sqlite"
+DEFAULT_COMPARISON_CACHE_SIZE = 1000
+DEFAULT_COMPARISON_TTL_SECONDS = 7 * 24 * 3600
+
+
+def index_version(settings: Optional[IndexSettings] = None) -> str:
+    """
+    Version of the searchable index: embedding model and dimensions plus
+    INDEX_VERSION, or else the manifests found in the working directory.
+    """
+    settings = settings or get_index_settings()
+    return f"{settings.model}-{settings.dimensions}-{os.getenv('INDEX_VERSION') or manifests_version()}"
+
+
+def insurers_key(insurers: List[str]) -> str:
+    return ",".join(sorted({insurer.lower() for insurer in insurers}))
+
+
+class SemanticCache:
+    """
+    Cached answers in a SQLite table, looked up by embedding similarity within
+    a (product, insurers, index version) partition.
+    """
+
+    def __init__(self, path: str = DEFAULT_SEMANTIC_CACHE_PATH, threshold: float = DEFAULT_THRESHOLD,
+                 ttl: float = DEFAULT_TTL_SECONDS):
+        self.path = path
+        self.threshold = threshold
+        self.ttl = ttl
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, product TEXT, insurers TEXT, index_version TEXT, "
+                "created_at REAL, query TEXT, embedding BLOB, result TEXT)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS answers_partition ON answers (product, insurers, index_version)")
+
+    def lookup(self, embedding: List[float], product: str, insurers: List[str], version: str) -> Optional[Dict[str, Any]]:
+        """
+        Return the cached entry most similar to `embedding` as
+        {"query", "similarity", "result"}, or None below the threshold.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT query, embedding, result FROM answers "
+                "WHERE product = ? AND insurers = ? AND index_version = ? AND created_at >= ?",
+                (product, insurers_key(insurers), version, time.time() - self.ttl)
+            ).fetchall()
+        if not rows:
+            return None
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        matrix = np.stack([np.frombuffer(row["embedding"], dtype=np.float32) for row in rows])
+        similarities = matrix @ query / np.maximum(np.linalg.norm(matrix, axis=1), 1e-12)
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.threshold:
+            return None
+        return {
+            "query": rows[best]["query"],
+            "similarity": float(similarities[best]),
+            "result": json.loads(rows[best]["result"])
+        }
+
+    def store(self, query: str, embedding: List[float], product: str, insurers: List[str], version: str,
+              result: Dict[str, Any]) -> None:
+        """Cache `result` (JSON-serializable) and drop expired or outdated entries."""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM answers WHERE created_at < ? OR index_version != ?",
+                (now - self.ttl, version)
+            )
+            self._conn.execute(
+                "INSERT INTO answers (product, insurers, index_version, created_at, query, embedding, result) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (product, insurers_key(insurers), version, now, query,
+                 np.asarray(embedding, dtype=np.float32).tobytes(), json.dumps(result, ensure_ascii=False))
+            )
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM answers")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def evidence_key(evidence: Dict[str, List[str]], product: str, prompt_version: str, model: str, version: str) -> str:
+    """Cache key of a comparison: the retrieved chunk ids per insurer, sorted, and what shapes the answer."""
+    payload = {
+        "evidence": {insurer.lower(): sorted(ids) for insurer, ids in evidence.items()},
+        "product": product,
+        "prompt_version": prompt_version,
+        "model": model,
+        "index_version": version
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class ComparisonCache:
+    """
+    Comparisons keyed by `evidence_key` in a SQLite table, with TTL expiry and
+    least-recently-used eviction beyond `max_entries`.
+    """
+
+    def __init__(self, path: str = DEFAULT_COMPARISON_CACHE_PATH, max_entries: int = DEFAULT_COMPARISON_CACHE_SIZE,
+                 ttl: float = DEFAULT_COMPARISON_TTL_SECONDS):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS comparisons ("
+                "key TEXT PRIMARY KEY, created_at REAL, last_used REAL, comparison TEXT)"
+            )
+
+    def get(self, key: str) -> Optional[str]:
+        """The cached comparison for `key`, or None when absent or expired."""
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT comparison FROM comparisons WHERE key = ? AND created_at >= ?", (key, now - self.ttl)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE comparisons SET last_used = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def put(self, key: str, comparison: str) -> None:
+        """Cache a comparison, then drop expired entries and the least recently used beyond the maximum size."""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO comparisons (key, created_at, last_used, comparison) VALUES (?, ?, ?, ?)",
+                (key, now, now, comparison)
+            )
+            self._conn.execute("DELETE FROM comparisons WHERE created_at < ?", (now - self.ttl,))
+            self._conn.execute(
+                "DELETE FROM comparisons WHERE key NOT IN "
+                "(SELECT key FROM comparisons ORDER BY last_used DESC LIMIT ?)",
+                (self.max_entries,)
+            )
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM comparisons")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM comparisons").fetchone()[0]
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def create_semantic_cache() -> SemanticCache:
+    """Semantic cache configured from the environment."""
+    return SemanticCache(
+        os.getenv("SEMANTIC_CACHE_PATH", DEFAULT_SEMANTIC_CACHE_PATH),
+        threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", DEFAULT_THRESHOLD)),
+        ttl=float(os.getenv("SEMANTIC_CACHE_TTL", DEFAULT_TTL_SECONDS))
+    )
+
+
+def create_comparison_cache() -> ComparisonCache:
+    """Comparison cache configured from the environment."""
+    return ComparisonCache(
+        os.getenv("COMPARISON_CACHE_PATH", DEFAULT_COMPARISON_CACHE_PATH),
+        max_entries=int(os.getenv("COMPARISON_CACHE_SIZE", DEFAULT_COMPARISON_CACHE_SIZE)),
+        ttl=float(os.getenv("COMPARISON_CACHE_TTL", DEFAULT_COMPARISON_TTL_SECONDS))
+    )
@@ -0,0 +1,311 @@
+"""
+Vector store backends for RAGChain.
+
+A backend takes a query embedding and returns the best matches for one
+insurer/product as plain dicts (`id`, `score`, `metadata`), so RAGChain can
+format results the same way whatever the store.
+
+Every query accepts `categories`: when given, only chunks of those taxonomy
+categories (see `agent.chains.router`) are searched.
+"""
+
+import asyncio
+from abc import ABC, abstractmethod
+from typing import List, Dict, Any, Optional, Callable
+
+import numpy as np
+
+from .quantization import QuantizedMatrix
+
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+
+class VectorBackend(ABC):
+    """
+    Interface for the vector stores RAGChain can search.
+    """
+
+    @abstractmethod
+    def query(self, vector: List[float], insurer: str, product: str, top_k: int = 10,
+              categories: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Best `top_k` matches of one insurer/product partition, best first."""
+
+    async def aquery(self, vector: List[float], insurer: str, product: str, top_k: int = 10,
+                     categories: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Async `query`; stores without an async client run the query in a worker thread."""
+        return await asyncio.to_thread(self.query, vector, insurer, product, top_k, categories)
+
+    def query_many(self, vector: List[float], insurers: List[str], product: str, top_k: int = 10,
+                   categories: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Best `top_k` matches over several insurers, as one ranking. Stores that
+        cannot search several partitions at once run one query per insurer.
+        """
+        matches = [
+            match for insurer in insurers
+            for match in self.query(vector, insurer, product, top_k=top_k, categories=categories)
+        ]
+        return sorted(matches, key=lambda match: match["score"], reverse=True)[:top_k]
+
+
+class PineconeBackend(VectorBackend):
+    """
+    Pinecone index. With the partitioned namespace layout a query only hits the
+    insurer/product namespace; the legacy shared layout filters on metadata.
+    """
+
+    def __init__(self, index, settings=None, metric: str = "cosine", async_index_factory: Optional[Callable] = None):
+        from src.vectorization.index_settings import get_index_settings
+        self.index = index
+        self.settings = settings or get_index_settings()
+        self.metric = metric
+        # Coroutine function awaited by each async query, inside the event loop that uses the client
+        self.async_index_factory = async_index_factory
+
+    @staticmethod
+    def _category_filter(categories: Optional[List[str]]) -> Dict[str, Any]:
+        return {"category": {"$in": list(categories)}} if categories else {}
+
+    def _query_params(self, vector: List[float], insurer: str, product: str, top_k: int,
+                      categories: Optional[List[str]] = None) -> Dict[str, Any]:
+        params = {"vector": vector, "top_k": top_k, "include_metadata": True}
+        metadata_filter = self._category_filter(categories)
+        if self.settings.namespace_layout == "shared":
+            metadata_filter.update({"insurer": insurer, "product": product})
+        else:
+            params["namespace"] = self.settings.namespace(insurer, product)
+        if metadata_filter:
+            params["filter"] = metadata_filter
+        return params
+
+    @staticmethod
+    def _matches(results) -> List[Dict[str, Any]]:
+        return [
+            {"id": match.id, "score": match.score, "metadata": match.metadata or {}}
+            for match in results.matches
+        ]
+
+    def query(self, vector: List[float], insurer: str, product: str, top_k: int = 10,
+              categories: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        return self._matches(self.index.query(**self._query_params(vector, insurer, product, top_k, categories)))
+
+    async def aquery(self, vector: List[float], insurer: str, product: str, top_k: int = 10,
+                     categories: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        if self.async_index_factory is None:
+            return await super().aquery(vector, insurer, product, top_k, categories)
+        async_index = await self.async_index_factory()
+        return self._matches(await async_index.query(**self._query_params(vector, insurer, product, top_k, categories)))
+
+    def query_many(self, vector: List[float], insurers: List[str], product: str, top_k: int = 10,
+                   categories: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Shared layout: a single query filtered with `insurer $in [...]`.
+        Partitioned layout: one `query_namespaces` call, which queries the
+        namespaces in parallel and merges them into one ranking.
+        """
+        if self.settings.namespace_layout == "shared":
+            results = self.index.query(
+                vector=vector, top_k=top_k, include_metadata=True,
+                filter=dict(self._category_filter(categories), insurer={"$in": list(insurers)}, product=product)
+            )
+        elif hasattr(self.index, "query_namespaces"):
+            results = self.index.query_namespaces(
+                vector=vector, top_k=top_k, include_metadata=True, metric=self.metric,
+                namespaces=[self.settings.namespace(insurer, product) for insurer in insurers],
+                **({"filter": self._category_filter(categories)} if categories else {})
+            )
+        else:
+            return super().query_many(vector, insurers, product, top_k=top_k, categories=categories)
+        return self._matches(results)
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.ascontiguousarray(matrix / np.maximum(norms, 1e-12), dtype=np.float32)
+
+
+def _top_rows(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """Indices of the `top_k` highest scores, best first."""
+    if top_k < len(scores):
+        rows = np.argpartition(-scores, top_k - 1)[:top_k]
+    else:
+        rows = np.arange(len(scores))
+    return rows[np.argsort(-scores[rows])]
+
+
+class _Partition:
+    """
+    Vectors of a single insurer/product, L2-normalised for cosine scoring.
+
+    With `quantization`, only the quantized codes stay in memory; the best
+    `top_k * rescore_factor` candidates are re-scored with exact vectors read
+    through `exact_vectors(rows)` (e.g. from the memory-mapped embedding cache).
+    Without `exact_vectors`, re-scoring keeps the float32 matrix resident too,
+    and `bytes_per_vector` counts it.
+    """
+
+    def __init__(self, ids: List[str], matrix: np.ndarray, metadata: List[Dict[str, Any]], ann_threshold: Optional[int],
+                 quantization: Optional[str] = None, rescore_factor: int = 4, exact_vectors=None):
+        self.ids = ids
+        self.metadata = metadata
+        self.matrix = None
+        self.quantized = None
+        self.ann = None
+        self.rescore_factor = rescore_factor
+        self._resident_exact = None
+        category_rows: Dict[str, List[int]] = {}
+        for row, item in enumerate(metadata):
+            category_rows.setdefault(item.get("category") or "", []).append(row)
+        self.category_rows = {category: np.asarray(rows, dtype=np.int64) for category, rows in category_rows.items()}
+        matrix = _normalize(matrix)
+        if quantization:
+            self.quantized = QuantizedMatrix(matrix, quantization)
+            if exact_vectors is not None:
+                self.exact_vectors = exact_vectors
+            elif rescore_factor:
+                self._resident_exact = matrix
+                self.exact_vectors = lambda rows: matrix[rows]
+            else:
+                self.exact_vectors = self.quantized.dequantize
+            return
+        self.matrix = matrix
+        if faiss is not None and ann_threshold is not None and len(ids) >= ann_threshold:
+            self.ann = faiss.IndexHNSWFlat(self.matrix.shape[1], 32, faiss.METRIC_INNER_PRODUCT)
+            self.ann.add(self.matrix)
+
+    @property
+    def bytes_per_vector(self) -> float:
+        """Bytes held in memory per vector (quantized codes plus any resident float32 copy)."""
+        if self.quantized is not None:
+            resident = self.quantized.nbytes
+            if self._resident_exact is not None:
+                resident += self._resident_exact.nbytes
+            return resident / max(len(self.ids), 1)
+        return self.matrix.nbytes / max(len(self.ids), 1)
+
+    def rows_of(self, categories: List[str]) -> np.ndarray:
+        """Rows of the chunks of the given categories, in row order."""
+        rows = [self.category_rows[category] for category in categories if category in self.category_rows]
+        return np.sort(np.concatenate(rows)) if rows else np.empty(0, dtype=np.int64)
+
+    def search(self, query: np.ndarray, top_k: int, categories: Optional[List[str]] = None):
+        if categories:
+            return self._search_rows(query, top_k, self.rows_of(categories))
+        top_k = min(top_k, len(self.ids))
+        if self.quantized is not None:
+            scores = self.quantized.scores(query)
+            if not self.rescore_factor:
+                rows = _top_rows(scores, top_k)
+                return [(int(row), float(scores[row])) for row in rows]
+            candidates = _top_rows(scores, min(top_k * self.rescore_factor, len(self.ids)))
+            exact = _normalize(np.asarray(self.exact_vectors(candidates), dtype=np.float32)) @ query
+            order = _top_rows(exact, top_k)
+            return [(int(candidates[i]), float(exact[i])) for i in order]
+        if self.ann is not None:
+            scores, rows = self.ann.search(query[None, :], top_k)
+            return [(int(row), float(score)) for row, score in zip(rows[0], scores[0]) if row >= 0]
+        scores = self.matrix @ query
+        rows = _top_rows(scores, top_k)
+        return [(int(row), float(scores[row])) for row in rows]
+
+    def _search_rows(self, query: np.ndarray, top_k: int, rows: np.ndarray):
+        """Exact search restricted to `rows` (a category subset, small enough for brute force)."""
+        top_k = min(top_k, len(rows))
+        if not top_k:
+            return []
+        if self.quantized is not None:
+            vectors = _normalize(np.asarray(self.exact_vectors(rows), dtype=np.float32))
+        else:
+            vectors = self.matrix[rows]
+        scores = vectors @ query
+        order = _top_rows(scores, top_k)
+        return [(int(rows[i]), float(scores[i])) for i in order]
+
+
+class LocalBackend(VectorBackend):
+    """
+    In-process exact search with NumPy, pre-partitioned by insurer and product.
+
+    For our corpus (a few thousand chunks per product) a brute-force matrix
+    product answers in well under a millisecond. When faiss is installed and
+    `ann_threshold` is set, partitions at least that large use an HNSW index.
+    `quantization` ("int8" or "float16") keeps only compressed vectors in memory
+    and re-scores the top candidates exactly.
+    """
+
+    def __init__(self, ann_threshold: Optional[int] = None, quantization: Optional[str] = None, rescore_factor: int = 4):
+        self.ann_threshold = ann_threshold
+        self.quantization = quantization
+        self.rescore_factor = rescore_factor
+        self.partitions: Dict[tuple, _Partition] = {}
+
+    @staticmethod
+    def _key(insurer: str, product: str) -> tuple:
+        return (insurer.lower(), product.lower())
+
+    def add_partition(self, insurer: str, product: str, ids: List[str], matrix, metadata: List[Dict[str, Any]],
+                      exact_vectors=None):
+        """Register (or replace) the vectors of one insurer/product."""
+        if len(ids) != len(matrix) or len(ids) != len(metadata):
+            raise ValueError("ids, matrix and metadata must have the same length")
+        if ids:
+            self.partitions[self._key(insurer, product)] = _Partition(
+                list(ids), np.asarray(matrix, dtype=np.float32), list(metadata), self.ann_threshold,
+                quantization=self.quantization, rescore_factor=self.rescore_factor, exact_vectors=exact_vectors
+            )
+
+    def __len__(self) -> int:
+        return sum(len(partition.ids) for partition in self.partitions.values())
+
+    async def aquery(self, vector: List[float], insurer: str, product: str, top_k: int = 10,
+                     categories: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        # In-process search takes well under a millisecond: no need for a thread
+        return self.query(vector, insurer, product, top_k, categories)
+
+    def query(self, vector: List[float], insurer: str, product: str, top_k: int = 10,
+              categories: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        partition = self.partitions.get(self._key(insurer, product))
+        if partition is None:
+            return []
+        query = np.asarray(vector, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        return [
+            {"id": partition.ids[row], "score": score, "metadata": partition.metadata[row]}
+            for row, score in partition.search(query, top_k, categories)
+        ]
+
+    @classmethod
+    def from_embedding_cache(cls, cache, doc_store, ann_threshold: Optional[int] = None,
+                             quantization: Optional[str] = None, rescore_factor: int = 4) -> "LocalBackend":
+        """
+        Build the backend from the local document store and the on-disk embedding cache.
+
+        Every chunk of the store whose vector is cached is loaded, with the same
+        ids and compact metadata as the Pinecone vectors.
+        """
+        backend = cls(ann_threshold=ann_threshold, quantization=quantization, rescore_factor=rescore_factor)
+        for insurer, product in doc_store.partitions():
+            ids, rows, metadata = [], [], []
+            for chunk in doc_store.partition(insurer, product):
+                row = cache.row(cache.key(chunk["content"]))
+                if row is None:
+                    continue
+                ids.append(chunk["id"])
+                rows.append(row)
+                metadata.append({
+                    "insurer": insurer.capitalize(),
+                    "product": product,
+                    "section": chunk["section"],
+                    "subsection": chunk["subsection"],
+                    "category": chunk["category"],
+                    "content_hash": chunk["content_hash"]
+                })
+            cache_rows = np.asarray(rows, dtype=np.int64)
+            backend.add_partition(
+                insurer, product, ids, cache.matrix[cache_rows], metadata,
+                exact_vectors=lambda candidates, cache_rows=cache_rows: cache.matrix[cache_rows[candidates]]
+            )
+        return backend
@@ -0,0 +1,107 @@
+"""
+Token-budgeted context packing for the comparison prompt.
+
+Instead of cutting every retrieved chunk to a fixed number of characters, the
+chunks of one insurer are split into sentences, overlapping sentences (chunk
+overlap, repeated boilerplate) are dropped, and the sentences matching the
+query terms (plus their direct neighbours) are kept, best first, until the
+token budget is spent. Each chunk keeps a citation tag ("AXA-2") so the
+comparison can point back to its evidence.
+"""
+
+import re
+from typing import Any, Dict, List
+
+from .lexical import tokenize
+from src.vectorization.batching import estimate_tokens
+
+DEFAULT_TOKEN_BUDGET = 500
+
+# Sentence fragments at least this long are dropped when contained in an earlier sentence
+MIN_OVERLAP_CHARS = 20
+
+# Below this many tokens left, a sentence that does not fit is skipped rather than trimmed
+MIN_TRIM_TOKENS = 20
+
+_SENTENCE_END = re.compile(r"(?<=[.!?;])\s+|\n+")
+_SPACES = re.compile(r"\s+")
+
+
+def split_sentences(text: str) -> List[str]:
+    """Sentences (or lines) of a chunk, whitespace collapsed."""
+    return [sentence for sentence in (_SPACES.sub(" ", part).strip() for part in _SENTENCE_END.split(text)) if sentence]
+
+
+def citation_tag(insurer: str, rank: int) -> str:
+    return f"{insurer.upper()}-{rank}"
+
+
+def _trim(sentence: str, max_tokens: int) -> str:
+    """Cut a sentence to about `max_tokens` tokens on a word boundary."""
+    words = sentence.split()
+    ratio = max_tokens / max(estimate_tokens(sentence), 1)
+    return " ".join(words[:max(int(len(words) * ratio), 1)]) + " …"
+
+
+def pack_context(insurer: str, results: List[Dict[str, Any]], query: str,
+                 token_budget: int = DEFAULT_TOKEN_BUDGET) -> List[Dict[str, Any]]:
+    """
+    Select the query-relevant sentences of an insurer's results within `token_budget`.
+
+    Sentences score by the share of query terms they contain, plus half the
+    score of a matching neighbour and a small bonus for better-ranked chunks.
+    Returns the results that kept at least one sentence, in rank order, each
+    with a citation `tag` and an `excerpt` (selected sentences in document
+    order, " … " marking skipped text).
+    """
+    query_terms = set(tokenize(query))
+    seen = set()
+    candidates = []
+    sentences_by_result = []
+    for rank, result in enumerate(results):
+        sentences = []
+        for sentence in split_sentences(result.get("content", "")):
+            key = " ".join(tokenize(sentence)) or sentence.lower()
+            # Overlapping chunks repeat sentences, possibly cut at the chunk
+            # boundary: keep the first (best-ranked) occurrence
+            if key in seen or (len(key) >= MIN_OVERLAP_CHARS and any(key in other for other in seen)):
+                continue
+            seen.add(key)
+            sentences.append(sentence)
+        matches = [
+            len(query_terms & set(tokenize(sentence))) / len(query_terms) if query_terms else 0.0
+            for sentence in sentences
+        ]
+        for position, sentence in enumerate(sentences):
+            neighbours = [matches[i] for i in (position - 1, position + 1) if 0 <= i < len(sentences)]
+            score = matches[position] + 0.5 * max(neighbours, default=0.0) + 0.1 / (rank + 1)
+            candidates.append((score, rank, position, sentence))
+        sentences_by_result.append(sentences)
+
+    selected: Dict[int, Dict[int, str]] = {}
+    remaining = token_budget
+    for score, rank, position, sentence in sorted(candidates, key=lambda item: (-item[0], item[1], item[2])):
+        tokens = estimate_tokens(sentence)
+        if tokens > remaining:
+            if remaining < MIN_TRIM_TOKENS:
+                continue
+            sentence, tokens = _trim(sentence, remaining), remaining
+        selected.setdefault(rank, {})[position] = sentence
+        remaining -= tokens
+        if remaining <= 0:
+            break
+
+    packed = []
+    for rank, result in enumerate(results):
+        if rank not in selected:
+            continue
+        positions = sorted(selected[rank])
+        excerpt = ""
+        for i, position in enumerate(positions):
+            if i and position != positions[i - 1] + 1:
+                excerpt += " …"
+            excerpt += (" " if excerpt else "") + selected[rank][position]
+        if positions[-1] < len(sentences_by_result[rank]) - 1:
+            excerpt += " …"
+        packed.append(dict(result, tag=citation_tag(insurer, rank + 1), excerpt=excerpt))
+    return packed
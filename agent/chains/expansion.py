@@ -0,0 +1,182 @@
+"""
+Multilingual query expansion.
+
+Insurers word the same clause differently ("Selbstbehalt", "franchise",
+"deductible"), so a single query vector misses some of them. The expander
+produces a few reformulations of the query, either from a local synonym table
+(instant, no network) or from a cheap chat model bounded by its own timeout,
+falling back to the synonym table when the model is too slow or fails.
+The variants are then embedded and searched alongside the original query and
+the rankings merged by reciprocal rank fusion (see `RAGChain`); variant
+searches still running `budget_ms` after the query's own search are dropped.
+
+Environment variables:
+    QUERY_EXPANSION            "off" (default), "synonyms" or "model"
+    QUERY_EXPANSION_VARIANTS   maximum number of reformulations (default 3)
+    QUERY_EXPANSION_BUDGET_MS  time variant searches may take past the query's own search (default 400)
+    QUERY_EXPANSION_MODEL      chat model of the "model" mode (default gpt-4o-mini)
+    QUERY_EXPANSION_MODEL_TIMEOUT_MS  timeout of the "model" mode call, no retry (default 2000)
+"""
+
+import os
+import re
+from typing import Dict, List, Optional
+
+from .lexical import fold
+from ..tracing import span, usage_tokens
+
+# Equivalent policy terms per language; a query mentioning one of them gets
+# one variant per language, every known term translated
+SYNONYMS: List[Dict[str, str]] = [
+    {"de": "selbstbehalt", "fr": "franchise", "en": "deductible"},
+    {"de": "parkschaden", "fr": "dommages de parking", "en": "parking damage"},
+    {"de": "grobfahrlassigkeit", "fr": "faute grave", "en": "gross negligence"},
+    {"de": "glasbruch", "fr": "bris de glace", "en": "glass breakage"},
+    {"de": "diebstahl", "fr": "vol", "en": "theft"},
+    {"de": "haftpflicht", "fr": "responsabilite civile", "en": "liability"},
+    {"de": "teilkasko", "fr": "casco partielle", "en": "partial cover"},
+    {"de": "vollkasko", "fr": "casco complete", "en": "comprehensive cover"},
+    {"de": "kollision", "fr": "collision", "en": "collision"},
+    {"de": "marderschaden", "fr": "degats de martres", "en": "marten damage"},
+    {"de": "elementarschaden", "fr": "dommages naturels", "en": "natural hazards"},
+    {"de": "bonusschutz", "fr": "protection du bonus", "en": "bonus protection"},
+    {"de": "ersatzfahrzeug", "fr": "vehicule de remplacement", "en": "replacement vehicle"},
+    {"de": "pannenhilfe", "fr": "assistance depannage", "en": "roadside assistance"},
+    {"de": "schlussel", "fr": "cles", "en": "keys"},
+    {"de": "reifen", "fr": "pneus", "en": "tires"},
+    {"de": "rechtsschutz", "fr": "protection juridique", "en": "legal protection"},
+    {"de": "annullierung", "fr": "annulation", "en": "cancellation"},
+    {"de": "reiseabbruch", "fr": "interruption de voyage", "en": "trip interruption"},
+    {"de": "gepack", "fr": "bagages", "en": "baggage"},
+    {"de": "heilungskosten", "fr": "frais de guerison", "en": "medical expenses"},
+    {"de": "wartefrist", "fr": "delai de carence", "en": "waiting period"},
+    {"de": "versicherungssumme", "fr": "somme d'assurance", "en": "sum insured"},
+    {"de": "ausschluss", "fr": "exclusion", "en": "exclusion"},
+    {"de": "pramie", "fr": "prime", "en": "premium"},
+    {"de": "kundigung", "fr": "resiliation", "en": "termination"},
+]
+
+DEFAULT_MAX_VARIANTS = 3
+DEFAULT_BUDGET_MS = 400
+DEFAULT_EXPANSION_MODEL = "gpt-4o-mini"
+# A chat completion rarely answers within the variant budget: the model call gets its own timeout
+DEFAULT_MODEL_TIMEOUT_MS = 2000
+
+_BULLET = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s*")
+
+
+def _term_pattern(term: str) -> re.Pattern:
+    # Matches inflected and compound forms starting with the term ("selbstbehalts");
+    # short terms ("vol") only as whole words
+    suffix = r"\w*" if len(term) > 4 else r"\b"
+    return re.compile(r"\b" + re.escape(term) + suffix, re.IGNORECASE)
+
+
+_SYNONYM_PATTERNS = [
+    {language: _term_pattern(term) for language, term in group.items()}
+    for group in SYNONYMS
+]
+
+
+def synonym_variants(query: str, max_variants: int = DEFAULT_MAX_VARIANTS) -> List[str]:
+    """
+    Reformulations of `query` with every known policy term replaced by its
+    German, French and English equivalent (one variant per language).
+    The query is accent-folded; an empty list when no term is known.
+    """
+    folded = fold(query)
+    matched = [
+        index for index, patterns in enumerate(_SYNONYM_PATTERNS)
+        if any(pattern.search(folded) for pattern in patterns.values())
+    ]
+    if not matched:
+        return []
+    variants = []
+    for language in ("de", "fr", "en"):
+        variant = folded
+        for index in matched:
+            for pattern in _SYNONYM_PATTERNS[index].values():
+                variant = pattern.sub(SYNONYMS[index][language], variant)
+        if variant != folded and variant not in variants:
+            variants.append(variant)
+    return variants[:max_variants]
+
+
+class QueryExpander:
+    """
+    Produce up to `max_variants` reformulations of a search query, from the
+    synonym table (mode "synonyms") or a chat model (mode "model") called with
+    `model_timeout_ms` as timeout and no retry. `budget_ms` bounds how long
+    the variant searches may run past the query's own search.
+    """
+
+    def __init__(self, mode: str = "synonyms", max_variants: int = DEFAULT_MAX_VARIANTS,
+                 budget_ms: float = DEFAULT_BUDGET_MS, openai_client=None, model: str = DEFAULT_EXPANSION_MODEL,
+                 model_timeout_ms: float = DEFAULT_MODEL_TIMEOUT_MS):
+        if mode not in ("synonyms", "model"):
+            raise ValueError(f"Unknown query expansion mode: {mode}")
+        self.mode = mode
+        self.max_variants = max_variants
+        self.budget_ms = budget_ms
+        self.openai_client = openai_client
+        self.model = model
+        self.model_timeout_ms = model_timeout_ms
+
+    def expand(self, query: str) -> List[str]:
+        """Reformulations of `query` (the query itself excluded)."""
+        with span("query_expansion", "expansion", mode=self.mode) as record:
+            variants = []
+            if self.mode == "model":
+                try:
+                    variants = self._model_variants(query, record)
+                except Exception as e:
+                    # Too slow or failed: the synonym table is the fallback
+                    record["fallback"] = f"{type(e).__name__}: {e}"
+            if not variants:
+                variants = synonym_variants(query, self.max_variants)
+            variants = [variant for variant in variants if fold(variant) != fold(query)][:self.max_variants]
+            record["variants"] = len(variants)
+        return variants
+
+    def _model_variants(self, query: str, record: Dict) -> List[str]:
+        client = self.openai_client
+        if client is None:
+            from ..clients import get_openai_client
+            client = get_openai_client()
+        if hasattr(client, "with_options"):
+            client = client.with_options(timeout=self.model_timeout_ms / 1000, max_retries=0)
+        response = client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": (
+                    "You rewrite search queries over Swiss insurance policy wordings. Give up to "
+                    f"{self.max_variants} reformulations of the query, mixing German, French and English and using "
+                    "the terms policy wordings use. One per line, nothing else."
+                )},
+                {"role": "user", "content": query}
+            ],
+            temperature=0,
+            max_tokens=120
+        )
+        record.update(usage_tokens(getattr(response, "usage", None)))
+        lines = [_BULLET.sub("", line).strip() for line in (response.choices[0].message.content or "").splitlines()]
+        variants = []
+        for line in lines:
+            if line and line not in variants:
+                variants.append(line)
+        return variants
+
+
+def create_expander(openai_client=None) -> Optional[QueryExpander]:
+    """Query expander configured from the environment, or None when expansion is off."""
+    mode = os.getenv("QUERY_EXPANSION", "off").lower()
+    if mode in ("", "0", "off", "none"):
+        return None
+    return QueryExpander(
+        mode,
+        max_variants=int(os.getenv("QUERY_EXPANSION_VARIANTS", DEFAULT_MAX_VARIANTS)),
+        budget_ms=float(os.getenv("QUERY_EXPANSION_BUDGET_MS", DEFAULT_BUDGET_MS)),
+        openai_client=openai_client,
+        model=os.getenv("QUERY_EXPANSION_MODEL", DEFAULT_EXPANSION_MODEL),
+        model_timeout_ms=float(os.getenv("QUERY_EXPANSION_MODEL_TIMEOUT_MS", DEFAULT_MODEL_TIMEOUT_MS))
+    )
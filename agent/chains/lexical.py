@@ -0,0 +1,174 @@
+"""
+Local lexical retrieval over the chunk store.
+
+A BM25 inverted index per insurer/product catches the exact terms dense
+embeddings tend to blur ("Parkschaden", "Grobfahrlässigkeit", "franchise").
+Tokenization folds case and accents, splits on non-word characters and drops
+German, French and English stop words. Section identifiers ("B12", "24.3")
+can also be looked up directly, without any embedding.
+"""
+
+import re
+import math
+import unicodedata
+from collections import Counter, defaultdict
+from typing import List, Dict, Any, Optional
+
+STOP_WORDS = frozenset("""
+    der die das den dem des ein eine einer eines einem einen und oder aber nicht ist sind wird werden wurde
+    mit von zu zum zur im in an am auf aus bei für fur über uber unter nach vor wie was wer welche welcher
+    le la les un une des du de d l et ou mais ne pas est sont sera au aux en dans par pour sur avec sans
+    qui que quoi quel quelle quels quelles ce cet cette ces se sa son ses leur leurs
+    the a an and or but not is are was were be been of to in on at by for with without from as what which
+    who how do does my your their this that these those
+""".split())
+
+# Section identifiers: letter + number ("B12", "C2.1") or dotted numbers ("24.3")
+SECTION_ID = re.compile(r"\b([A-Za-z]{1,2}\d{1,3}(?:\.\d+)*|\d{1,3}(?:\.\d+)+)\b")
+# A purely numeric id ("24", "24.3") is only a section lookup after a keyword:
+# on its own it is more likely an amount or a duration
+_SECTION_QUERY = re.compile(
+    r"^\s*(?:(?:section|sub-?section|article|art\.?|chapitre|ziffer|abschnitt|§)\s*"
+    r"([A-Za-z]{0,2}\d{1,3}(?:\.\d+)*)|([A-Za-z]{1,2}\d{1,3}(?:\.\d+)*))\s*[?.]?\s*$",
+    re.IGNORECASE
+)
+_WORD = re.compile(r"\w+")
+
+
+def fold(text: str) -> str:
+    """Lowercase and strip accents (ä -> a, é -> e), mapping ß to ss."""
+    text = unicodedata.normalize("NFKD", text.lower().replace("ß", "ss"))
+    return "".join(char for char in text if not unicodedata.combining(char))
+
+
+def tokenize(text: str) -> List[str]:
+    """Folded word tokens without stop words; a trailing plural "s" is dropped from long words."""
+    tokens = []
+    for token in _WORD.findall(fold(text)):
+        if token in STOP_WORDS or len(token) < 2:
+            continue
+        if len(token) > 4 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def section_query(query: str) -> Optional[str]:
+    """The section identifier when the query is only an id lookup ("section B12"), else None."""
+    match = _SECTION_QUERY.match(query)
+    return (match.group(1) or match.group(2)).upper() if match else None
+
+
+def section_of(subsection: str) -> str:
+    """Identifier at the start of a subsection title ("B12 - Parkschaden" -> "B12")."""
+    subsection = subsection.strip()
+    return subsection.split()[0].rstrip(".-").upper() if subsection else ""
+
+
+class _LexicalPartition:
+    """BM25 postings of the chunks of one insurer/product."""
+
+    def __init__(self, chunks: List[Dict[str, Any]], k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.ids = [chunk["id"] for chunk in chunks]
+        self.metadata = [
+            {
+                "insurer": chunk["insurer"].capitalize(),
+                "product": chunk["product"],
+                "section": chunk["section"],
+                "subsection": chunk["subsection"],
+                "category": chunk["category"],
+                "content_hash": chunk["content_hash"]
+            }
+            for chunk in chunks
+        ]
+        self.postings: Dict[str, List[tuple]] = defaultdict(list)
+        self.lengths = []
+        self.sections: Dict[str, List[int]] = defaultdict(list)
+        for row, chunk in enumerate(chunks):
+            tokens = tokenize(f"{chunk['section']} {chunk['subsection']} {chunk['content']}")
+            self.lengths.append(len(tokens))
+            for term, count in Counter(tokens).items():
+                self.postings[term].append((row, count))
+            if section_of(chunk["subsection"]):
+                self.sections[section_of(chunk["subsection"])].append(row)
+        self.average_length = sum(self.lengths) / max(len(self.lengths), 1)
+
+    def search(self, query: str, top_k: int) -> List[tuple]:
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (len(self.ids) - len(postings) + 0.5) / (len(postings) + 0.5))
+            for row, count in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[row] / max(self.average_length, 1e-9))
+                scores[row] += idf * count * (self.k1 + 1) / (count + norm)
+        # Chunks whose subsection id is cited in the query come first
+        for section in {match.upper() for match in SECTION_ID.findall(query)}:
+            for row in self.sections.get(section, []):
+                scores[row] += 100.0
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+
+class LexicalIndex:
+    """
+    BM25 inverted index over the chunk store, partitioned by insurer and product.
+    Returns matches in the same format as the vector backends.
+    """
+
+    def __init__(self):
+        self.partitions: Dict[tuple, _LexicalPartition] = {}
+
+    @classmethod
+    def from_doc_store(cls, doc_store) -> "LexicalIndex":
+        index = cls()
+        for insurer, product in doc_store.partitions():
+            chunks = doc_store.partition(insurer, product)
+            if chunks:
+                index.partitions[(insurer.lower(), product.lower())] = _LexicalPartition(chunks)
+        return index
+
+    def __len__(self) -> int:
+        return sum(len(partition.ids) for partition in self.partitions.values())
+
+    def _matches(self, partition: _LexicalPartition, scored: List[tuple]) -> List[Dict[str, Any]]:
+        return [{"id": partition.ids[row], "score": score, "metadata": partition.metadata[row]} for row, score in scored]
+
+    def query(self, text: str, insurer: str, product: str, top_k: int = 10,
+              categories: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        partition = self.partitions.get((insurer.lower(), product.lower()))
+        if partition is None:
+            return []
+        if not categories:
+            return self._matches(partition, partition.search(text, top_k))
+        scored = [
+            (row, score) for row, score in partition.search(text, len(partition.ids))
+            if partition.metadata[row]["category"] in categories
+        ]
+        return self._matches(partition, scored[:top_k])
+
+    def lookup_section(self, section: str, insurer: str, product: str, top_k: int = 10) -> List[Dict[str, Any]]:
+        """Chunks whose subsection starts with `section` (e.g. "B12"), in document order."""
+        partition = self.partitions.get((insurer.lower(), product.lower()))
+        if partition is None:
+            return []
+        rows = partition.sections.get(section.upper(), [])[:top_k]
+        return self._matches(partition, [(row, 1.0) for row in rows])
+
+
+def reciprocal_rank_fusion(rankings: List[List[Dict[str, Any]]], top_k: int, k: int = 60) -> List[Dict[str, Any]]:
+    """
+    Fuse several ranked match lists: each match scores sum(1 / (k + rank)),
+    stored as `rrf_score`. `score` and metadata come from the first list
+    holding the match (the vector similarity when the vector rankings come first).
+    """
+    fused: Dict[str, Dict[str, Any]] = {}
+    scores: Dict[str, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, match in enumerate(ranking, 1):
+            fused.setdefault(match["id"], match)
+            scores[match["id"]] += 1.0 / (k + rank)
+    order = sorted(scores, key=scores.get, reverse=True)[:top_k]
+    return [dict(fused[match_id], rrf_score=scores[match_id]) for match_id in order]
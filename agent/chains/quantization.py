@@ -0,0 +1,66 @@
+"""
+Scalar-quantized vector storage for the local search backend.
+
+Vectors are stored either as float16 or as int8 codes with one float32 scale
+per vector (symmetric quantization on max |x|). Scores computed on the codes
+are approximate; callers re-score the best candidates with exact vectors.
+"""
+
+from typing import Optional
+
+import numpy as np
+
+QUANTIZATION_KINDS = ("float16", "int8")
+
+# Rows upcast to float32 per matmul block, to bound temporary memory
+_BLOCK_ROWS = 2048
+
+
+class QuantizedMatrix:
+    """
+    Quantized copy of a float32 matrix (one vector per row).
+    """
+
+    def __init__(self, matrix: np.ndarray, kind: str = "int8"):
+        if kind not in QUANTIZATION_KINDS:
+            raise ValueError(f"Unknown quantization: {kind} (expected one of {', '.join(QUANTIZATION_KINDS)})")
+        self.kind = kind
+        matrix = np.asarray(matrix, dtype=np.float32)
+        self.shape = matrix.shape
+        if kind == "float16":
+            self.codes = matrix.astype(np.float16)
+            self.scales = None
+        else:
+            scales = np.abs(matrix).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            self.codes = np.round(matrix / scales[:, None]).astype(np.int8)
+            self.scales = scales.astype(np.float32)
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    @property
+    def bytes_per_vector(self) -> float:
+        return self.nbytes / max(len(self), 1)
+
+    def dequantize(self, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        codes = self.codes if rows is None else self.codes[rows]
+        vectors = codes.astype(np.float32)
+        if self.scales is not None:
+            vectors *= (self.scales if rows is None else self.scales[rows])[:, None]
+        return vectors
+
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        """Approximate inner products between every stored vector and `query`."""
+        query = np.asarray(query, dtype=np.float32)
+        scores = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), _BLOCK_ROWS):
+            block = self.codes[start:start + _BLOCK_ROWS].astype(np.float32)
+            scores[start:start + len(block)] = block @ query
+        if self.scales is not None:
+            scores *= self.scales
+        return scores
@@ -1,70 +1,567 @@
 """
-RAG chains for vector search in Pinecone.
+RAG chains for vector search in Pinecone or in a local vector backend.
 """
 
 import os
-from typing import List, Dict, Any, Optional
+import time
+import asyncio
+import threading
+import contextvars
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
 from dotenv import load_dotenv
-from openai import OpenAI
-from pinecone import Pinecone
+from openai import OpenAI, AsyncOpenAI
+from .backends import VectorBackend, PineconeBackend, LocalBackend
+from .lexical import LexicalIndex, reciprocal_rank_fusion, section_query
+from .expansion import QueryExpander, create_expander
+from .router import CategoryRouter, create_router
+from src.vectorization.doc_store import DocStore, DEFAULT_DOC_STORE_PATH
+from src.vectorization.index_settings import IndexSettings, get_index_settings
+from src.vectorization.manifest import manifests_version
+from src.vectorization.align_clauses import DEFAULT_ALIGNMENT_DIR, load_alignment_index
+from ..clients import get_openai_client, get_async_openai_client, get_pinecone_index, aget_async_pinecone_index, get_doc_store
+from ..tracing import span, usage_tokens
 
 # Load environment variables
 load_dotenv()
 
+class QueryEmbeddingCache:
+    """
+    Thread-safe in-process LRU of query embeddings keyed by (text, model, dimensions).
+    """
+
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self._entries: "OrderedDict[Tuple[str, str, int], List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple[str, str, int]) -> Optional[List[float]]:
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return embedding
+
+    def put(self, key: Tuple[str, str, int], embedding: List[float]) -> None:
+        with self._lock:
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+def create_doc_store() -> DocStore:
+    """Open the local chunk store (DOC_STORE_PATH env var or the default path)."""
+    return DocStore(os.getenv("DOC_STORE_PATH", DEFAULT_DOC_STORE_PATH))
+
+def create_backend(kind: Optional[str] = None, doc_store: Optional[DocStore] = None,
+                   settings: Optional[IndexSettings] = None) -> VectorBackend:
+    """
+    Create the vector backend selected by `kind` or the VECTOR_BACKEND env var
+    ("pinecone", the default, or "local").
+    """
+    kind = (kind or os.getenv("VECTOR_BACKEND", "pinecone")).lower()
+    settings = settings or get_index_settings()
+    if kind == "local":
+        from src.vectorization.embedding_cache import EmbeddingCache
+        cache = EmbeddingCache(settings.model, settings.dimensions, dtype=os.getenv("EMBEDDING_CACHE_DTYPE", "float32"), readonly=True)
+        ann_threshold = os.getenv("LOCAL_ANN_THRESHOLD")
+        return LocalBackend.from_embedding_cache(
+            cache,
+            doc_store or get_doc_store(),
+            ann_threshold=int(ann_threshold) if ann_threshold else None,
+            quantization=os.getenv("LOCAL_QUANTIZATION") or None
+        )
+    if kind == "pinecone":
+        return PineconeBackend(get_pinecone_index(), settings=settings, async_index_factory=aget_async_pinecone_index)
+    raise ValueError(f"Unknown vector backend: {kind}")
+
 class RAGChain:
     """
-    RAG chain for search in Pinecone vector database.
+    RAG chain for search in a vector database (Pinecone by default).
+    Clients default to the shared ones from `agent.clients`; use
+    `get_rag_chain()` to reuse a single chain across requests.
+
+    With `hybrid` (HYBRID_SEARCH env var, on by default), vector results are
+    fused with a local BM25 index of the chunk store by reciprocal rank fusion,
+    and section lookups ("section B12") are answered lexically without any
+    embedding call.
+
+    With an `expander` (QUERY_EXPANSION env var, off by default), reformulations
+    of the query are embedded in the same call as the query, searched in
+    parallel and fused with its results; variant searches still running once
+    the expansion budget has elapsed after the query's own search are dropped.
+
+    With a `router` (CATEGORY_ROUTING env var, off by default), the query is
+    routed to one or two taxonomy categories and both the vector and BM25
+    searches are restricted to their chunks; a partition with no chunk in
+    those categories is searched whole.
+
+    Section lookups for an insurer that numbers its clauses differently
+    ("section B3" on Generali) return the clauses aligned on the other
+    insurers' section, from the precomputed alignment index
+    (`src.vectorization.align_clauses`, ALIGNMENT_DIR env var).
     """
     
-    def __init__(self):
+    def __init__(self, backend: Optional[VectorBackend] = None, openai_client: Optional[OpenAI] = None,
+                 doc_store: Optional[DocStore] = None, settings: Optional[IndexSettings] = None,
+                 hybrid: Optional[bool] = None, async_openai_client: Optional[AsyncOpenAI] = None,
+                 expander: Optional[QueryExpander] = None, router: Optional[CategoryRouter] = None):
         """Initialize the RAG chain with necessary connections."""
-        self.pinecone_client = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-        self.openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        self.index_name = os.getenv("PINECONE_INDEX_NAME")
-        self.index = self.pinecone_client.Index(self.index_name)
+        self.settings = settings or get_index_settings()
+        self.openai_client = openai_client or get_openai_client()
+        self._async_openai_client = async_openai_client
+        self.doc_store = doc_store or get_doc_store()
+        self.backend = backend or create_backend(doc_store=self.doc_store, settings=self.settings)
+        self.query_cache = QueryEmbeddingCache(int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "256")))
+        self.hybrid = hybrid if hybrid is not None else os.getenv("HYBRID_SEARCH", "1") != "0"
+        self.expander = expander or create_expander(self.openai_client)
+        self.router = router or create_router(self.embed_queries)
+        self._lexical: Optional[LexicalIndex] = None
+        self._lexical_version: Optional[str] = None
+        self._lexical_lock = threading.Lock()
+
+    @property
+    def async_openai_client(self) -> AsyncOpenAI:
+        """Async OpenAI client, created on first use in the shared event loop."""
+        if self._async_openai_client is None:
+            self._async_openai_client = get_async_openai_client()
+        return self._async_openai_client
+
+    def lexical_index(self) -> LexicalIndex:
+        """
+        BM25 index of the chunk store, rebuilt when the local manifests change
+        (i.e. after an upsert).
+        """
+        version = manifests_version()
+        with self._lexical_lock:
+            if self._lexical is None or version != self._lexical_version:
+                self._lexical = LexicalIndex.from_doc_store(self.doc_store)
+                self._lexical_version = version
+            return self._lexical
+
+    def fuse(self, query: str, matches: List[Dict[str, Any]], insurer: str, product: str,
+             top_k: int, variant_rankings: List[List[Dict[str, Any]]] = (),
+             categories: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Reciprocal rank fusion of vector matches (and those of the query
+        variants) with the BM25 matches of the same partition (and categories).
+        Matches keep their cosine `score`; those found only by BM25 get
+        `score` None and their BM25 score as `bm25_score`.
+        """
+        rankings = [matches, *variant_rankings]
+        with span("bm25", "lexical", insurer=insurer):
+            lexical = self.lexical_index().query(query, insurer, product, top_k=max(top_k * 2, len(matches)),
+                                                 categories=categories)
+        if lexical:
+            # BM25 scores are unbounded (+100 for a cited section id): never report them as `score`
+            rankings.append([dict(match, score=None, bm25_score=match["score"]) for match in lexical])
+        if len(rankings) == 1:
+            return matches[:top_k]
+        return reciprocal_rank_fusion(rankings, top_k)
+
+    def route(self, query: str, embedding: Optional[List[float]] = None) -> List[str]:
+        """Taxonomy categories to restrict the search to ([] without router or when none applies)."""
+        return self.router.route(query, embedding) if self.router else []
+
+    def expand_query(self, query: str) -> Dict[str, List[float]]:
+        """Embedded reformulations of `query` ({variant: embedding}, empty without expander)."""
+        return self.prepare_query(query, embed_original=False)[1]
+
+    def prepare_query(self, query: str, embed_original: bool = True) -> Tuple[Optional[List[float]], Dict[str, List[float]]]:
+        """
+        Embedding of the query and of its reformulations, computed with a single
+        embeddings call. Returns (query embedding, {variant: embedding}).
+        """
+        variants = self.expander.expand(query) if self.expander else []
+        if not variants:
+            return (self.embed_query(query) if embed_original else None), {}
+        texts = ([query] if embed_original else []) + variants
+        embeddings = self.embed_queries(texts)
+        if not embed_original:
+            return None, dict(zip(variants, embeddings))
+        return embeddings[0], dict(zip(variants, embeddings[1:]))
+
+    async def aprepare_query(self, query: str) -> Tuple[List[float], Dict[str, List[float]]]:
+        """Async variant of `prepare_query`."""
+        if not self.expander:
+            return await self.aembed_query(query), {}
+        return await asyncio.to_thread(contextvars.copy_context().run, self.prepare_query, query)
+
+    def embed_query(self, query: str) -> List[float]:
+        """
+        Embed a search query, reusing the cached vector for a query already seen
+        with the same model and dimensions.
+        """
+        key = (query, self.settings.model, self.settings.dimensions)
+        with span("embed_query", "embedding", model=self.settings.model) as record:
+            embedding = self.query_cache.get(key)
+            record["cache_hit"] = embedding is not None
+            if embedding is None:
+                response = self.openai_client.embeddings.create(
+                    input=query,
+                    **self.settings.embedding_params()
+                )
+                record.update(usage_tokens(getattr(response, "usage", None)))
+                embedding = response.data[0].embedding
+                self.query_cache.put(key, embedding)
+        return embedding
+
+    async def aembed_query(self, query: str) -> List[float]:
+        """Async variant of `embed_query`, sharing the same LRU."""
+        key = (query, self.settings.model, self.settings.dimensions)
+        with span("embed_query", "embedding", model=self.settings.model) as record:
+            embedding = self.query_cache.get(key)
+            record["cache_hit"] = embedding is not None
+            if embedding is None:
+                response = await self.async_openai_client.embeddings.create(
+                    input=query,
+                    **self.settings.embedding_params()
+                )
+                record.update(usage_tokens(getattr(response, "usage", None)))
+                embedding = response.data[0].embedding
+                self.query_cache.put(key, embedding)
+        return embedding
+
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """
+        Embed several queries with a single embeddings call (queries already in
+        the LRU are not re-embedded). Embeddings are returned in input order.
+        """
+        keys = [(query, self.settings.model, self.settings.dimensions) for query in queries]
+        embeddings = [self.query_cache.get(key) for key in keys]
+        missing = sorted({query for query, embedding in zip(queries, embeddings) if embedding is None})
+        with span("embed_queries", "embedding", model=self.settings.model, queries=len(queries)) as record:
+            record["cache_hit"] = not missing
+            if missing:
+                response = self.openai_client.embeddings.create(input=missing, **self.settings.embedding_params())
+                record.update(usage_tokens(getattr(response, "usage", None)))
+                computed = {query: item.embedding for query, item in zip(missing, response.data)}
+                for key in keys:
+                    if key[0] in computed:
+                        self.query_cache.put(key, computed[key[0]])
+                embeddings = [embedding if embedding is not None else computed[query]
+                              for query, embedding in zip(queries, embeddings)]
+        return embeddings
+
+    def search_batch(self, queries: List[str], insurers: List[str], product: str, top_k: int = 4,
+                     max_workers: int = 16) -> Dict[Tuple[int, str], List[Dict[str, Any]]]:
+        """
+        Search every (query, insurer) pair: the queries (and their reformulations,
+        with an expander) are embedded in one call, then the searches run
+        concurrently on `max_workers` threads.
+        Returns {(query index, insurer): results}, keyed by the insurer names as given.
+        """
+        variant_lists = [self.expander.expand(query) if self.expander else [] for query in queries]
+        embeddings = self.embed_queries(list(queries) + [variant for variants in variant_lists for variant in variants])
+        variant_embeddings, offset = [], len(queries)
+        for variants in variant_lists:
+            variant_embeddings.append(dict(zip(variants, embeddings[offset:offset + len(variants)])))
+            offset += len(variants)
+        pairs = [(i, insurer) for i in range(len(queries)) for insurer in insurers]
+
+        def run(pair):
+            i, insurer = pair
+            return self.search(queries[i], insurer.capitalize(), product, top_k=top_k, embedding=embeddings[i],
+                               variants=variant_embeddings[i])
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(pairs)))) as executor:
+            futures = [executor.submit(contextvars.copy_context().run, run, pair) for pair in pairs]
+            return {pair: future.result() for pair, future in zip(pairs, futures)}
+
+    def hydrate(self, matches: List[Dict[str, Any]]) -> Dict[str, str]:
+        """
+        Return {id: content} for the given matches, fetching the texts that are
+        not in the vector metadata from the document store in one lookup.
+        """
+        contents = {match["id"]: match["metadata"]["content"] for match in matches if match["metadata"].get("content")}
+        missing = [match["id"] for match in matches if match["id"] not in contents]
+        if missing:
+            with span("hydrate", "doc_store", chunks=len(missing)):
+                contents.update({chunk_id: chunk["content"] for chunk_id, chunk in self.doc_store.get_many(missing).items()})
+        return contents
         
-    def search(self, query: str, insurer: str, product: str, top_k: int = 10) -> List[Dict[str, Any]]:
+    def search(self, query: str, insurer: str, product: str, top_k: int = 10,
+               embedding: Optional[List[float]] = None,
+               variants: Optional[Dict[str, List[float]]] = None) -> List[Dict[str, Any]]:
         """
-        Perform vector search in Pinecone index for a given insurer and product.
+        Perform vector search in the backend for a given insurer and product.
         Args:
             query: The search query
             insurer: The insurer to search for ("Axa" or "Generali")
             product: The insurance product to filter on ("car" or "travel")
             top_k: Number of results to return
+            embedding: Precomputed query embedding (e.g. from the embed_query node)
+            variants: Precomputed {reformulation: embedding}; computed here when
+                None and query expansion is enabled
         Returns:
             List of results with metadata
         """
         try:
-            # Create query embedding
-            embedding = self.openai_client.embeddings.create(
-                input=query,
-                model="text-embedding-3-small"
-            ).data[0].embedding
+            # Section lookups are answered from the lexical index alone
+            results = self._section_results(query, insurer, product, top_k)
+            if results:
+                return results
+
+            # Create query embedding unless it was computed upstream
+            if embedding is None:
+                embedding, variants = self.prepare_query(query)
+            elif variants is None:
+                variants = self.expand_query(query)
             
-            # Prepare filter for insurer and product
-            filter_dict = {"insurer": insurer, "product": product}
+            # Search the insurer/product partition of the backend, restricted
+            # to the routed categories when any
+            categories = self.route(query, embedding)
+            rankings = self._vector_rankings(embedding, variants, insurer, product, self._candidates(top_k), categories)
+            if categories and not rankings[0]:
+                # No chunk of the partition in those categories (e.g. not categorized yet)
+                categories = []
+                rankings = self._vector_rankings(embedding, variants, insurer, product, self._candidates(top_k))
+            matches = self._rank(query, rankings, insurer, product, top_k, categories)
             
-            # Search in Pinecone without namespace
-            results = self.index.query(
-                vector=embedding,
-                filter=filter_dict,
-                top_k=top_k,
-                include_metadata=True
-            )
+            # Fetch the full texts of the returned hits only
+            contents = self.hydrate(matches)
             
             # Format results
-            formatted_results = []
-            for match in results.matches:
-                formatted_results.append({
-                    "score": match.score,
-                    "content": match.metadata.get("content", ""),
-                    "section": match.metadata.get("section", ""),
-                    "subsection": match.metadata.get("subsection", ""),
-                    "category": match.metadata.get("category", ""),
-                    "insurer": match.metadata.get("insurer", ""),
-                    "product": match.metadata.get("product", "")
-                })
-            return formatted_results
+            return [self._format(match, contents) for match in matches]
+        except Exception as e:
+            print(f"Error during RAG search for {insurer}: {e}")
+            return []
+
+    async def asearch(self, query: str, insurer: str, product: str, top_k: int = 10,
+                      embedding: Optional[List[float]] = None,
+                      variants: Optional[Dict[str, List[float]]] = None) -> List[Dict[str, Any]]:
+        """
+        Async variant of `search`: the embedding and vector store calls are
+        awaited; the section lookup, the category routing (which may embed the
+        query with the sync client), the BM25 fusion and the chunk store lookup
+        run in worker threads so they never block the event loop.
+        """
+        try:
+            if self.hybrid and section_query(query):
+                return await asyncio.to_thread(contextvars.copy_context().run, self._section_results,
+                                               query, insurer, product, top_k)
+            if embedding is None:
+                embedding, variants = await self.aprepare_query(query)
+            elif variants is None and self.expander:
+                variants = await asyncio.to_thread(contextvars.copy_context().run, self.expand_query, query)
+            categories = []
+            if self.router:
+                categories = await asyncio.to_thread(contextvars.copy_context().run, self.route, query, embedding)
+            rankings = await self._avector_rankings(embedding, variants, insurer, product, self._candidates(top_k),
+                                                    categories)
+            if categories and not rankings[0]:
+                categories = []
+                rankings = await self._avector_rankings(embedding, variants, insurer, product, self._candidates(top_k))
+
+            def rank_and_hydrate():
+                matches = self._rank(query, rankings, insurer, product, top_k, categories)
+                contents = self.hydrate(matches)
+                return [self._format(match, contents) for match in matches]
+
+            return await asyncio.to_thread(contextvars.copy_context().run, rank_and_hydrate)
         except Exception as e:
             print(f"Error during RAG search for {insurer}: {e}")
-            return [] 
\ No newline at end of file
+            return []
+
+    def _section_results(self, query: str, insurer: str, product: str, top_k: int) -> List[Dict[str, Any]]:
+        """Results of a section lookup query ("section B12"), or [] for any other query."""
+        section = section_query(query) if self.hybrid else None
+        if not section:
+            return []
+        with span("section_lookup", "lexical", insurer=insurer, section=section) as record:
+            matches = self.lookup_section(section, insurer, product, top_k)
+            record["matches"] = len(matches)
+        contents = self.hydrate(matches) if matches else {}
+        return [self._format(match, contents) for match in matches]
+
+    def lookup_section(self, section: str, insurer: str, product: str, top_k: int) -> List[Dict[str, Any]]:
+        """
+        Chunks of the insurer's section `section`; when the insurer has no such
+        section, its clauses aligned on that section of the other insurers.
+        """
+        matches = self.lexical_index().lookup_section(section, insurer, product, top_k=top_k)
+        if matches:
+            return matches
+        alignments = load_alignment_index(product, os.getenv("ALIGNMENT_DIR", DEFAULT_ALIGNMENT_DIR))
+        return alignments.section_matches(section, insurer, top_k=top_k) if alignments else []
+
+    def _candidates(self, top_k: int) -> int:
+        """Number of vector matches to fetch: twice as many when they are fused with BM25."""
+        return top_k * 2 if self.hybrid else top_k
+
+    def _variant_deadline(self) -> float:
+        """Deadline of the variant searches, called when the query's own search is done."""
+        return time.perf_counter() + (self.expander.budget_ms / 1000 if self.expander else 0.0)
+
+    def _vector_rankings(self, embedding: List[float], variants: Optional[Dict[str, List[float]]], insurer: str,
+                         product: str, top_k: int, categories: Optional[List[str]] = None) -> List[List[Dict[str, Any]]]:
+        """
+        Vector matches of the query, then of each variant that finished within
+        the expansion budget after the query's own search; variant searches run
+        in parallel with the query's.
+        """
+        def query(vector, variant=None):
+            with span("vector_query", "vector", insurer=insurer, variant=variant, categories=categories) as record:
+                matches = self.backend.query(vector, insurer=insurer, product=product, top_k=top_k,
+                                             categories=categories)
+                record["matches"] = len(matches)
+            return matches
+
+        if not variants:
+            return [query(embedding)]
+        executor = ThreadPoolExecutor(max_workers=len(variants))
+        try:
+            futures = [
+                executor.submit(contextvars.copy_context().run, query, vector, variant)
+                for variant, vector in variants.items()
+            ]
+            rankings = [query(embedding)]
+            deadline = self._variant_deadline()
+            for future in futures:
+                try:
+                    rankings.append(future.result(timeout=max(0.0, deadline - time.perf_counter())))
+                except Exception:
+                    # Over budget or failed: the variant is dropped
+                    pass
+            return rankings
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _avector_rankings(self, embedding: List[float], variants: Optional[Dict[str, List[float]]], insurer: str,
+                                product: str, top_k: int,
+                                categories: Optional[List[str]] = None) -> List[List[Dict[str, Any]]]:
+        """Async variant of `_vector_rankings`."""
+        async def query(vector, variant=None):
+            with span("vector_query", "vector", insurer=insurer, variant=variant, categories=categories) as record:
+                matches = await self.backend.aquery(vector, insurer=insurer, product=product, top_k=top_k,
+                                                    categories=categories)
+                record["matches"] = len(matches)
+            return matches
+
+        if not variants:
+            return [await query(embedding)]
+        tasks = [asyncio.ensure_future(query(vector, variant)) for variant, vector in variants.items()]
+        rankings = [await query(embedding)]
+        timeout = self._variant_deadline() - time.perf_counter()
+        if timeout > 0:
+            await asyncio.wait(tasks, timeout=timeout)
+        for task in tasks:
+            if task.done() and not task.cancelled() and task.exception() is None:
+                rankings.append(task.result())
+            else:
+                # Over budget or failed: the variant is dropped
+                task.cancel()
+        return rankings
+
+    def _rank(self, query: str, rankings: List[List[Dict[str, Any]]], insurer: str, product: str,
+              top_k: int, categories: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Fuse the vector rankings (query first, then variants) and, in hybrid mode, the BM25 ranking."""
+        matches, variant_rankings = rankings[0], rankings[1:]
+        if self.hybrid:
+            return self.fuse(query, matches, insurer, product, top_k, variant_rankings, categories)
+        if not variant_rankings:
+            return matches[:top_k]
+        return reciprocal_rank_fusion(rankings, top_k)
+
+    def search_many(self, query: str, insurers: List[str], product: str, top_k: int = 4,
+                    embedding: Optional[List[float]] = None, overfetch: int = 2) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Search several insurers with one backend query and group the hits per insurer.
+
+        The shared query asks for `top_k * len(insurers) * overfetch` matches;
+        each insurer keeps its best `top_k`. An insurer left with fewer than
+        `top_k` hits (crowded out by the others) gets a targeted fallback query,
+        so every insurer is guaranteed its quota when it has enough chunks.
+        Returns {insurer: results}, keyed by the insurer names as given.
+        """
+        grouped: Dict[str, List[Dict[str, Any]]] = {insurer: [] for insurer in insurers}
+        try:
+            # Section lookups are answered lexically when every insurer has the section (or aligned clauses)
+            section = section_query(query) if self.hybrid else None
+            if section:
+                lookups = {insurer: self.lookup_section(section, insurer, product, top_k) for insurer in insurers}
+                if all(lookups.values()):
+                    contents = self.hydrate([match for matches in lookups.values() for match in matches])
+                    return {
+                        insurer: [self._format(match, contents) for match in matches]
+                        for insurer, matches in lookups.items()
+                    }
+
+            if embedding is None:
+                embedding = self.embed_query(query)
+            categories = self.route(query, embedding)
+            by_key = {insurer.lower(): insurer for insurer in insurers}
+            with span("vector_query_many", "vector", insurers=len(insurers), categories=categories) as record:
+                pool = self.backend.query_many(embedding, [insurer.capitalize() for insurer in insurers], product,
+                                               top_k=top_k * len(insurers) * overfetch, categories=categories)
+                if categories and not pool:
+                    categories = []
+                    pool = self.backend.query_many(embedding, [insurer.capitalize() for insurer in insurers], product,
+                                                   top_k=top_k * len(insurers) * overfetch)
+                record["matches"] = len(pool)
+            for match in pool:
+                insurer = by_key.get(str(match["metadata"].get("insurer", "")).lower())
+                if insurer is not None and len(grouped[insurer]) < top_k:
+                    grouped[insurer].append(match)
+
+            # Targeted fallback queries for under-represented insurers, in parallel
+            short = [insurer for insurer, matches in grouped.items() if len(matches) < top_k]
+            if short:
+                def fallback(insurer):
+                    with span("vector_query", "vector", insurer=insurer, fallback=True, categories=categories):
+                        matches = self.backend.query(embedding, insurer=insurer.capitalize(), product=product,
+                                                     top_k=top_k, categories=categories)
+                        if categories and not matches:
+                            matches = self.backend.query(embedding, insurer=insurer.capitalize(), product=product,
+                                                         top_k=top_k)
+                        return matches
+
+                with ThreadPoolExecutor(max_workers=len(short)) as executor:
+                    # Each worker runs in a copy of the caller's context so its spans reach the trace
+                    futures = [executor.submit(contextvars.copy_context().run, fallback, insurer) for insurer in short]
+                    fallbacks = [future.result() for future in futures]
+                    for insurer, extra in zip(short, fallbacks):
+                        seen = {match["id"] for match in grouped[insurer]}
+                        merged = grouped[insurer] + [match for match in extra if match["id"] not in seen]
+                        grouped[insurer] = sorted(merged, key=lambda match: match["score"], reverse=True)[:top_k]
+
+            if self.hybrid:
+                grouped = {
+                    insurer: self.fuse(query, matches, insurer.capitalize(), product, top_k, categories=categories)
+                    for insurer, matches in grouped.items()
+                }
+
+            # One document store lookup for every insurer
+            contents = self.hydrate([match for matches in grouped.values() for match in matches])
+            return {
+                insurer: [self._format(match, contents) for match in matches]
+                for insurer, matches in grouped.items()
+            }
+        except Exception as e:
+            print(f"Error during grouped RAG search for {', '.join(insurers)}: {e}")
+            return {insurer: [] for insurer in insurers}
+
+    @staticmethod
+    def _format(match: Dict[str, Any], contents: Dict[str, str]) -> Dict[str, Any]:
+        metadata = match["metadata"]
+        return {
+            "id": match["id"],
+            "score": match["score"],
+            "rrf_score": match.get("rrf_score"),
+            "bm25_score": match.get("bm25_score"),
+            "content": contents.get(match["id"], ""),
+            "section": metadata.get("section", ""),
+            "subsection": metadata.get("subsection", ""),
+            "category": metadata.get("category", ""),
+            "insurer": metadata.get("insurer", ""),
+            "product": metadata.get("product", "")
+        }
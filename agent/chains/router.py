@@ -0,0 +1,156 @@
+"""
+Query routing to the categories of the chunk taxonomy.
+
+Chunks carry one TAXONOMY category (see `src.processors.categorize_chunks`).
+The router predicts the one or two categories a question is about, so
+retrieval only searches those chunks: a smaller search space and more
+relevant chunks at the same top_k. Two modes:
+- "keywords": German/French/English keyword rules per category (no network);
+- "embedding": nearest category descriptions to the query embedding.
+
+A question matching no category is not routed (unfiltered search).
+
+Environment variables:
+    CATEGORY_ROUTING                 "off" (default), "keywords" or "embedding"
+    CATEGORY_ROUTING_MIN_SIMILARITY  minimum cosine similarity of the "embedding" mode (default 0.25)
+"""
+
+import os
+import re
+import threading
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from .lexical import fold
+from ..tracing import span
+from src.processors.categorize_chunks import TAXONOMY
+
+# Folded keywords of each category; keywords longer than 4 characters also
+# match longer words ("selbstbehalt" -> "selbstbehalts")
+CATEGORY_KEYWORDS: Dict[str, List[str]] = {
+    TAXONOMY[0]: ["definition", "begriff", "geltungsbereich", "validite territoriale", "territorial", "vertragsbeginn",
+                  "duree du contrat", "contract term", "allgemeine bestimmung", "conditions generales"],
+    TAXONOMY[1]: ["kontrollschild", "nummernschild", "wechselschild", "plaque", "immatriculation", "license plate",
+                  "registration"],
+    TAXONOMY[2]: ["pramie", "prime", "premium", "selbstbehalt", "franchise", "deductible", "zahlung", "paiement",
+                  "payment", "bonus", "rabatt", "rabais", "discount"],
+    TAXONOMY[3]: ["kundigung", "resiliation", "cancel", "termination", "vertragsanderung", "modification du contrat",
+                  "contract change", "rucktritt", "widerruf"],
+    TAXONOMY[4]: ["haftpflicht", "responsabilite civile", "liability", "third party", "geschadigte", "lese"],
+    TAXONOMY[5]: ["kasko", "casco", "kollision", "collision", "diebstahl", "vol", "theft", "glasbruch", "bris de glace",
+                  "glass", "parkschaden", "parking", "marder", "martre", "marten", "elementar", "hagel", "grele", "hail",
+                  "feuer", "incendie", "fire", "vandal"],
+    TAXONOMY[6]: ["unfall", "accident", "invaliditat", "invalidite", "disability", "todesfall", "deces", "death",
+                  "heilungskosten", "frais de guerison", "medical", "injur", "verletz"],
+    TAXONOMY[7]: ["assistance", "pannenhilfe", "panne", "breakdown", "abschlepp", "remorquage", "towing",
+                  "ersatzfahrzeug", "vehicule de remplacement", "replacement vehicle", "rental", "mietwagen", "hotline",
+                  "reparatur", "repair"],
+    TAXONOMY[8]: ["zusatzdeckung", "complementaire", "additional cover", "mitgefuhrte sachen", "effets personnels",
+                  "personal belongings", "rechtsschutz", "protection juridique", "legal protection", "schlussel", "cles",
+                  "keys", "wallbox", "batterie", "battery", "cyber"],
+    TAXONOMY[9]: ["obliegenheit", "pflicht", "obligation", "duty", "duties", "anzeigepflicht", "declaration", "notify",
+                  "schadenmeldung", "grobfahrlassig", "faute grave", "gross negligence", "regress", "recours"],
+    TAXONOMY[10]: ["datenschutz", "donnees", "data protection", "privacy", "gerichtsstand", "for juridique",
+                   "jurisdiction", "anwendbares recht", "droit applicable", "applicable law"],
+    TAXONOMY[11]: ["besondere bestimmung", "dispositions specifiques", "specific provisions", "sonderbedingung"],
+}
+
+DEFAULT_MAX_CATEGORIES = 2
+DEFAULT_MIN_SIMILARITY = 0.25
+# A second category is kept when its score is at least this share of the best one ("keywords" mode)
+SECOND_CATEGORY_RATIO = 0.5
+# ... or when its similarity is within this margin of the best one ("embedding" mode)
+SECOND_CATEGORY_MARGIN = 0.05
+
+
+def _keyword_pattern(keyword: str) -> re.Pattern:
+    suffix = r"\w*" if len(keyword) > 4 else r"\b"
+    return re.compile(r"\b" + re.escape(keyword) + suffix)
+
+
+_KEYWORD_PATTERNS = {
+    category: [_keyword_pattern(keyword) for keyword in keywords]
+    for category, keywords in CATEGORY_KEYWORDS.items()
+}
+
+
+def keyword_scores(query: str) -> Dict[str, int]:
+    """Number of distinct keywords of each category found in the query (categories without any are left out)."""
+    folded = fold(query)
+    scores = {
+        category: sum(1 for pattern in patterns if pattern.search(folded))
+        for category, patterns in _KEYWORD_PATTERNS.items()
+    }
+    return {category: score for category, score in scores.items() if score}
+
+
+class CategoryRouter:
+    """
+    Predict up to `max_categories` TAXONOMY categories for a question.
+    The "embedding" mode needs `embed` (texts -> embeddings) to embed the
+    category descriptions once.
+    """
+
+    def __init__(self, mode: str = "keywords", max_categories: int = DEFAULT_MAX_CATEGORIES,
+                 min_similarity: float = DEFAULT_MIN_SIMILARITY,
+                 embed: Optional[Callable[[List[str]], List[List[float]]]] = None):
+        if mode not in ("keywords", "embedding"):
+            raise ValueError(f"Unknown category routing mode: {mode}")
+        self.mode = mode
+        self.max_categories = max_categories
+        self.min_similarity = min_similarity
+        self.embed = embed
+        self._category_matrix: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+
+    def route(self, query: str, embedding: Optional[List[float]] = None) -> List[str]:
+        """The predicted categories, best first; [] when the question matches none."""
+        with span("route_categories", "router", mode=self.mode) as record:
+            if self.mode == "embedding" and embedding is not None:
+                categories = self._nearest_categories(embedding)
+            else:
+                categories = self._keyword_categories(query)
+            record["categories"] = categories
+        return categories
+
+    def _keyword_categories(self, query: str) -> List[str]:
+        scores = keyword_scores(query)
+        if not scores:
+            return []
+        ranked = sorted(scores, key=lambda category: (-scores[category], TAXONOMY.index(category)))
+        best = scores[ranked[0]]
+        return [category for category in ranked if scores[category] >= best * SECOND_CATEGORY_RATIO][:self.max_categories]
+
+    def category_matrix(self) -> np.ndarray:
+        """Normalized embeddings of the category descriptions (name and keywords), computed once."""
+        with self._lock:
+            if self._category_matrix is None:
+                descriptions = [f"{category}: {', '.join(CATEGORY_KEYWORDS[category])}" for category in TAXONOMY]
+                matrix = np.asarray(self.embed(descriptions), dtype=np.float32)
+                self._category_matrix = matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+            return self._category_matrix
+
+    def _nearest_categories(self, embedding: List[float]) -> List[str]:
+        query = np.asarray(embedding, dtype=np.float32)
+        similarities = self.category_matrix() @ (query / max(float(np.linalg.norm(query)), 1e-12))
+        order = np.argsort(-similarities)
+        best = float(similarities[order[0]])
+        if best < self.min_similarity:
+            return []
+        return [
+            TAXONOMY[row] for row in order[:self.max_categories]
+            if similarities[row] >= best - SECOND_CATEGORY_MARGIN
+        ]
+
+
+def create_router(embed: Optional[Callable[[List[str]], List[List[float]]]] = None) -> Optional[CategoryRouter]:
+    """Category router configured from the environment, or None when routing is off."""
+    mode = os.getenv("CATEGORY_ROUTING", "off").lower()
+    if mode in ("", "0", "off", "none"):
+        return None
+    return CategoryRouter(
+        mode,
+        min_similarity=float(os.getenv("CATEGORY_ROUTING_MIN_SIMILARITY", DEFAULT_MIN_SIMILARITY)),
+        embed=embed
+    )
@@ -0,0 +1,197 @@
+"""
+Batch criteria checklist: answer every criterion of a product for every insurer in one run.
+
+The criteria are the leaf fields of the extraction models of `fill_in_excel`
+(`CarCriteria` for car, `TravelInsuranceProduct` for travel); each field
+description becomes a retrieval question. All questions are embedded in a
+single embeddings call, retrieval runs concurrently for every
+(criterion, insurer) pair, and the answers are generated on a bounded pool of
+workers. The result is a grid of criteria by insurers, written to CSV or Excel:
+
+    python -m agent.checklist --product car --insurers axa generali --output data/checklists/car.xlsx
+"""
+
+import os
+import re
+import csv
+import argparse
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, get_args
+
+from pydantic import BaseModel
+
+from fill_in_excel.models import CarCriteria, TravelInsuranceProduct
+from .clients import get_openai_client, get_rag_chain
+from .insurers import DEFAULT_INSURERS, insurer_label, selected_insurers
+from .chains.context import pack_context
+from .tracing import span, usage_tokens
+
+CRITERIA_MODELS = {
+    "car": CarCriteria,
+    "travel": TravelInsuranceProduct,
+}
+
+DEFAULT_MODEL = "gpt-4o-mini"
+DEFAULT_GENERATION_WORKERS = 8
+DEFAULT_RETRIEVAL_WORKERS = 16
+# Context per (criterion, insurer) answer
+CONTEXT_TOKEN_BUDGET = 300
+NOT_FOUND = "Not specified"
+
+_EXAMPLE = re.compile(r"\s*(?:Example:\s*|\(e\.g\.,?\s*)(.*?)\)?\.?\s*$")
+
+
+def _model_in(annotation) -> Optional[type]:
+    """The Pydantic model of a field annotation (also inside Optional[...]), or None."""
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return annotation
+    return next((arg for arg in get_args(annotation) if isinstance(arg, type) and issubclass(arg, BaseModel)), None)
+
+
+def _title(name: str) -> str:
+    return name.replace("_", " ").title()
+
+
+def criteria_questions(model_class: type, prefix: str = "", section: str = "") -> List[Dict[str, str]]:
+    """
+    Leaf fields of an extraction model, in declaration order, as
+    {"key", "section", "criterion", "example", "question"}.
+    """
+    criteria = []
+    for name, field in model_class.model_fields.items():
+        key = f"{prefix}.{name}" if prefix else name
+        nested = _model_in(field.annotation)
+        if nested is not None:
+            criteria.extend(criteria_questions(nested, prefix=key, section=section or _title(name)))
+            continue
+        description = field.description or _title(name)
+        match = _EXAMPLE.search(description)
+        criterion = description[:match.start()].rstrip(" .") if match else description.rstrip(" .")
+        criteria.append({
+            "key": key,
+            "section": section,
+            "criterion": criterion,
+            "example": match.group(1) if match else "",
+            "question": f"{section}: {criterion}" if section else criterion
+        })
+    return criteria
+
+
+def build_answer_request(criterion: Dict[str, str], insurer: str, results: List[Dict[str, Any]],
+                         model: str = DEFAULT_MODEL) -> Dict[str, Any]:
+    """Chat completion parameters answering one criterion for one insurer from its retrieved chunks."""
+    context = "\n".join(
+        f"[{result['tag']}] {result['subsection'] or result['section']}: {result['excerpt']}"
+        for result in pack_context(insurer, results, criterion["question"], token_budget=CONTEXT_TOKEN_BUDGET)
+    )
+    example = f"\nAnswer format example: {criterion['example']}" if criterion["example"] else ""
+    return {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": (
+                "You fill in an insurance product comparison grid. Answer only from the excerpts, "
+                f"in a few words, and cite the excerpt tags. If the excerpts do not say, answer exactly \"{NOT_FOUND}\"."
+            )},
+            {"role": "user", "content": (
+                f"Insurer: {insurer_label(insurer)}\nCriterion: {criterion['question']}{example}\n\nExcerpts:\n{context}"
+            )}
+        ],
+        "temperature": 0,
+        "max_tokens": 150
+    }
+
+
+def answer_criterion(openai_client, criterion: Dict[str, str], insurer: str, results: List[Dict[str, Any]],
+                     model: str = DEFAULT_MODEL) -> str:
+    """Answer of one grid cell; no model call when nothing was retrieved."""
+    if not results:
+        return NOT_FOUND
+    with span("checklist_answer", "chat", model=model, insurer=insurer, criterion=criterion["key"]) as record:
+        response = openai_client.chat.completions.create(**build_answer_request(criterion, insurer, results, model))
+        record.update(usage_tokens(getattr(response, "usage", None)))
+    return response.choices[0].message.content.strip()
+
+
+def run_checklist(product: str, insurers: Optional[List[str]] = None, top_k: int = 4, model: str = DEFAULT_MODEL,
+                  max_workers: int = DEFAULT_GENERATION_WORKERS, retrieval_workers: int = DEFAULT_RETRIEVAL_WORKERS,
+                  rag_chain=None, openai_client=None,
+                  progress: Optional[Callable[[int, int], None]] = None) -> List[Dict[str, str]]:
+    """
+    Answer every criterion of `product` for every insurer.
+
+    Returns one row per criterion: {"Key", "Section", "Criterion", <insurer label>: answer, ...}.
+    `progress(done, total)` is called after each generated cell.
+    """
+    if product not in CRITERIA_MODELS:
+        raise ValueError(f"Unknown product: {product} (expected one of {', '.join(CRITERIA_MODELS)})")
+    insurers = selected_insurers(insurers or DEFAULT_INSURERS)
+    rag_chain = rag_chain or get_rag_chain()
+    openai_client = openai_client or get_openai_client()
+    criteria = criteria_questions(CRITERIA_MODELS[product])
+
+    retrieved = rag_chain.search_batch([criterion["question"] for criterion in criteria], insurers, product,
+                                       top_k=top_k, max_workers=retrieval_workers)
+
+    def answer(pair):
+        i, insurer = pair
+        try:
+            return answer_criterion(openai_client, criteria[i], insurer, retrieved[pair], model=model)
+        except Exception as e:
+            print(f"Error while answering {criteria[i]['key']} for {insurer}: {e}")
+            return f"Error: {e}"
+
+    # Bounded generation pool: at most `max_workers` chat completions in flight
+    answers = {}
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = {pair: executor.submit(contextvars.copy_context().run, answer, pair) for pair in retrieved}
+        for done, (pair, future) in enumerate(futures.items(), 1):
+            answers[pair] = future.result()
+            if progress:
+                progress(done, len(futures))
+
+    return [
+        dict(
+            {"Key": criterion["key"], "Section": criterion["section"], "Criterion": criterion["criterion"]},
+            **{insurer_label(insurer): answers[(i, insurer)] for insurer in insurers}
+        )
+        for i, criterion in enumerate(criteria)
+    ]
+
+
+def write_table(rows: List[Dict[str, str]], path: str) -> None:
+    """Write the grid as Excel (.xlsx, requires pandas and openpyxl) or CSV."""
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    if path.endswith(".xlsx"):
+        import pandas as pd
+        pd.DataFrame(rows).to_excel(path, index=False)
+        return
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else [])
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer the whole criteria checklist of a product for several insurers.")
+    parser.add_argument("--product", choices=list(CRITERIA_MODELS), required=True, help="Insurance product.")
+    parser.add_argument("--insurers", nargs="+", default=None, help="Insurers to compare (default: AXA and Generali).")
+    parser.add_argument("--output", default=None, help="Output file (.xlsx or .csv; default data/checklists/<product>.csv).")
+    parser.add_argument("--model", default=DEFAULT_MODEL, help="Chat model answering the criteria.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_GENERATION_WORKERS, help="Concurrent chat completions.")
+    parser.add_argument("--top-k", type=int, default=4, help="Chunks retrieved per criterion and insurer.")
+    args = parser.parse_args()
+
+    output = args.output or f"data/checklists/{args.product}.csv"
+    rows = run_checklist(
+        args.product, args.insurers, top_k=args.top_k, model=args.model, max_workers=args.workers,
+        progress=lambda done, total: print(f"\r{done}/{total} answers", end="", flush=True)
+    )
+    print()
+    write_table(rows, output)
+    print(f"Checklist saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""
+Process-wide registry of API clients shared by the agent nodes and the Streamlit pages.
+
+Clients are created lazily on first use and then reused, so warm requests go
+through already-open keep-alive connections instead of paying a new client,
+connection pool and TLS handshake per call. All clients are thread-safe and can
+be used concurrently from graph nodes.
+
+Async clients are bound to the event loop they are used in, so the async path
+runs every coroutine on one background event loop (`run_async`,
+`iterate_async`): concurrent users share that loop instead of each pinning a
+thread for the whole I/O wait.
+
+Environment variables:
+    OPENAI_TIMEOUT / OPENAI_CONNECT_TIMEOUT   request and connect timeouts (seconds)
+    OPENAI_MAX_RETRIES                        retries on transient OpenAI errors
+    HTTP_MAX_CONNECTIONS / HTTP_KEEPALIVE_EXPIRY   OpenAI connection pool size and idle keep-alive (seconds)
+    PINECONE_TIMEOUT / PINECONE_POOL_THREADS  Pinecone request timeout and connection pool threads
+    PINECONE_INDEX_HOST                       host of the index for the async client (else looked up once)
+"""
+
+import os
+import asyncio
+import threading
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, TypeVar
+
+import httpx
+from dotenv import load_dotenv
+from openai import OpenAI, AsyncOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient
+from pinecone import Pinecone
+
+load_dotenv()
+
+T = TypeVar("T")
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+class ClientRegistry:
+    """
+    Thread-safe, lazily initialized store of shared instances keyed by name.
+    """
+
+    def __init__(self):
+        self._instances: Dict[str, Any] = {}
+        # Re-entrant: a factory may itself request another shared instance
+        self._lock = threading.RLock()
+
+    def get(self, name: str, factory: Callable[[], Any]) -> Any:
+        """Return the instance registered under `name`, creating it once with `factory`."""
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        with self._lock:
+            # Another thread may have created it while we were waiting
+            if name not in self._instances:
+                self._instances[name] = factory()
+            return self._instances[name]
+
+    def has(self, name: str) -> bool:
+        """Whether the instance registered under `name` has already been created."""
+        return name in self._instances
+
+    def reset(self) -> None:
+        """Drop every shared instance (new clients are created on next use)."""
+        with self._lock:
+            loop = self._instances.pop("event_loop", None)
+            for instance in self._instances.values():
+                close = getattr(instance, "close", None)
+                if callable(close):
+                    try:
+                        result = close()
+                        # Async clients are closed on the loop they belong to
+                        if asyncio.iscoroutine(result):
+                            if loop is not None:
+                                asyncio.run_coroutine_threadsafe(result, loop.loop).result(timeout=5)
+                            else:
+                                result.close()
+                    except Exception:
+                        pass
+            if loop is not None:
+                loop.close()
+            self._instances.clear()
+
+
+class _BackgroundLoop:
+    """
+    Event loop running forever in a daemon thread.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="agent-event-loop", daemon=True)
+        self.thread.start()
+
+    def close(self) -> None:
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=5)
+        self.loop.close()
+
+
+_registry = ClientRegistry()
+
+
+def _create_openai_client() -> OpenAI:
+    timeout, limits = _openai_http_settings()
+    return OpenAI(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        timeout=timeout,
+        max_retries=_env_int("OPENAI_MAX_RETRIES", 2),
+        http_client=DefaultHttpxClient(timeout=timeout, limits=limits)
+    )
+
+
+def _openai_http_settings():
+    timeout = httpx.Timeout(_env_float("OPENAI_TIMEOUT", 60.0), connect=_env_float("OPENAI_CONNECT_TIMEOUT", 5.0))
+    limits = httpx.Limits(
+        max_connections=_env_int("HTTP_MAX_CONNECTIONS", 20),
+        max_keepalive_connections=_env_int("HTTP_MAX_CONNECTIONS", 20),
+        keepalive_expiry=_env_float("HTTP_KEEPALIVE_EXPIRY", 60.0)
+    )
+    return timeout, limits
+
+
+def _create_async_openai_client() -> AsyncOpenAI:
+    timeout, limits = _openai_http_settings()
+    return AsyncOpenAI(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        timeout=timeout,
+        max_retries=_env_int("OPENAI_MAX_RETRIES", 2),
+        http_client=DefaultAsyncHttpxClient(timeout=timeout, limits=limits)
+    )
+
+
+def _create_pinecone_client() -> Pinecone:
+    return Pinecone(
+        api_key=os.getenv("PINECONE_API_KEY"),
+        pool_threads=_env_int("PINECONE_POOL_THREADS", 4),
+        timeout=_env_float("PINECONE_TIMEOUT", 30.0)
+    )
+
+
+def _create_pinecone_index():
+    client = _registry.get("pinecone", _create_pinecone_client)
+    return client.Index(os.getenv("PINECONE_INDEX_NAME"), pool_threads=_env_int("PINECONE_POOL_THREADS", 4))
+
+
+def _resolve_pinecone_index_host() -> str:
+    client = _registry.get("pinecone", _create_pinecone_client)
+    return os.getenv("PINECONE_INDEX_HOST") or client.describe_index(os.getenv("PINECONE_INDEX_NAME")).host
+
+
+def _create_async_pinecone_index():
+    client = _registry.get("pinecone", _create_pinecone_client)
+    return client.IndexAsyncio(host=get_pinecone_index_host())
+
+
+def get_openai_client() -> OpenAI:
+    """Shared OpenAI client with a keep-alive connection pool."""
+    return _registry.get("openai", _create_openai_client)
+
+
+def get_pinecone_index():
+    """Shared handle on the Pinecone index named by PINECONE_INDEX_NAME."""
+    return _registry.get("pinecone_index", _create_pinecone_index)
+
+
+def get_async_openai_client() -> AsyncOpenAI:
+    """Shared async OpenAI client; only use it from the shared event loop."""
+    return _registry.get("async_openai", _create_async_openai_client)
+
+
+def get_pinecone_index_host() -> str:
+    """Host of the Pinecone index: PINECONE_INDEX_HOST, else resolved once with a (blocking) describe_index call."""
+    return _registry.get("pinecone_index_host", _resolve_pinecone_index_host)
+
+
+def get_async_pinecone_index():
+    """Shared asyncio Pinecone index handle; only use it from the shared event loop."""
+    return _registry.get("async_pinecone_index", _create_async_pinecone_index)
+
+
+async def aget_async_pinecone_index():
+    """
+    `get_async_pinecone_index` for coroutines: the index host is resolved in a
+    worker thread on first use, so describe_index never blocks the event loop.
+    """
+    if not _registry.has("pinecone_index_host"):
+        await asyncio.to_thread(get_pinecone_index_host)
+    return get_async_pinecone_index()
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """The background event loop running the async agent path."""
+    return _registry.get("event_loop", _BackgroundLoop).loop
+
+
+def run_async(coroutine: Awaitable[T]) -> T:
+    """Run a coroutine on the shared event loop and wait for its result."""
+    return asyncio.run_coroutine_threadsafe(coroutine, get_event_loop()).result()
+
+
+def iterate_async(iterator: AsyncIterator[T]) -> Iterator[T]:
+    """Consume an async iterator on the shared event loop, one item at a time."""
+    async def next_item():
+        return await iterator.__anext__()
+
+    loop = get_event_loop()
+    while True:
+        try:
+            yield asyncio.run_coroutine_threadsafe(next_item(), loop).result()
+        except StopAsyncIteration:
+            return
+
+
+def get_doc_store():
+    """Shared local chunk store."""
+    from .chains.rag import create_doc_store
+    return _registry.get("doc_store", create_doc_store)
+
+
+def get_semantic_cache():
+    """Shared semantic cache of agent answers."""
+    from .caching import create_semantic_cache
+    return _registry.get("semantic_cache", create_semantic_cache)
+
+
+def get_comparison_cache():
+    """Shared cache of comparisons keyed by retrieved evidence."""
+    from .caching import create_comparison_cache
+    return _registry.get("comparison_cache", create_comparison_cache)
+
+
+def get_rag_chain():
+    """Shared RAG chain (embedding client, vector backend and chunk store built once)."""
+    from .chains.rag import RAGChain
+    return _registry.get("rag_chain", RAGChain)
+
+
+def reset_clients() -> None:
+    """Close and forget every shared client, e.g. after changing the environment."""
+    _registry.reset()
@@ -1,8 +1,34 @@
+import os
+from functools import lru_cache
+from typing import Any, AsyncIterator, Iterator, List, Tuple
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import StateGraph, END
 from .state import CompareState
-from .nodes.axa_rag import run_axa
-from .nodes.generali_rag import run_generali
-from .nodes.compare import run_comparison
+from .insurers import INSURERS, selected_insurers
+from .nodes.embed_query import run_embed_query, arun_embed_query
+from .nodes.insurer_rag import make_insurer_node, make_async_insurer_node, run_grouped_search
+from .nodes.compare import run_comparison, arun_comparison
+from .nodes.semantic_cache import run_cache_lookup, run_cache_store
+from .tracing import traced_node
+
+def search_node_name(insurer: str) -> str:
+    return f"{insurer}_search"
+
+def route_insurers(state: CompareState) -> List[str]:
+    """
+    Fan out to the search node of every selected insurer; they run in parallel.
+    With RETRIEVAL_MODE=grouped, a single node searches all insurers at once.
+    A semantic cache hit skips retrieval and comparison entirely; a selection
+    without any supported insurer goes straight to compare, which reports it.
+    """
+    if state.get("cache_hit"):
+        return [END]
+    insurers = selected_insurers(state.get("insurers"))
+    if not insurers:
+        return ["compare"]
+    if os.getenv("RETRIEVAL_MODE", "fanout").lower() == "grouped":
+        return ["grouped_search"]
+    return [search_node_name(insurer) for insurer in insurers]
 
 def create_agent_graph() -> StateGraph:
     """
@@ -11,22 +37,70 @@ def create_agent_graph() -> StateGraph:
     # Create the graph with our typed state
     workflow = StateGraph(CompareState)
     
-    # Add the nodes
-    workflow.add_node("axa_search", run_axa)
-    workflow.add_node("generali_search", run_generali)
-    workflow.add_node("compare", run_comparison)
+    # Add the nodes: one retrieval branch per supported insurer. Nodes doing
+    # network I/O have an async variant, used when the graph runs with ainvoke.
+    # Every node run is recorded as a span of the current trace, if any
+    def add_node(name, func, afunc=None):
+        node = traced_node(name, func)
+        if afunc is not None:
+            node = RunnableLambda(node, afunc=traced_node(name, afunc))
+        workflow.add_node(name, node)
+
+    add_node("embed_query", run_embed_query, arun_embed_query)
+    add_node("cache_lookup", run_cache_lookup)
+    for insurer in INSURERS:
+        add_node(search_node_name(insurer), make_insurer_node(insurer), make_async_insurer_node(insurer))
+    add_node("grouped_search", run_grouped_search)
+    add_node("compare", run_comparison, arun_comparison)
+    add_node("cache_store", run_cache_store)
     
-    # Define the execution flow
-    workflow.set_entry_point("axa_search")
-    workflow.add_edge("axa_search", "generali_search")
-    workflow.add_edge("generali_search", "compare")
-    workflow.add_edge("compare", END)
+    # Define the execution flow: the selected branches run in the same step and
+    # their results are merged by the insurer_results reducer before compare
+    workflow.set_entry_point("embed_query")
+    workflow.add_edge("embed_query", "cache_lookup")
+    search_nodes = [search_node_name(insurer) for insurer in INSURERS] + ["grouped_search"]
+    workflow.add_conditional_edges("cache_lookup", route_insurers, search_nodes + ["compare", END])
+    for node in search_nodes:
+        workflow.add_edge(node, "compare")
+    workflow.add_edge("compare", "cache_store")
+    workflow.add_edge("cache_store", END)
     
     return workflow
 
+@lru_cache(maxsize=1)
 def compile_agent():
     """
-    Compile and return the agent ready for use.
+    Compile and return the agent ready for use. The compiled graph is stateless
+    and shared by every caller in the process.
     """
     workflow = create_agent_graph()
-    return workflow.compile() 
\ No newline at end of file
+    return workflow.compile()
+
+def stream_agent(initial_state: CompareState, agent=None) -> Iterator[Tuple[str, Any]]:
+    """
+    Run the agent and yield its progress as it happens:
+    ("state", full state after each step) and ("token", comparison text chunk).
+    The last "state" event holds the final state.
+    """
+    agent = agent or compile_agent()
+    for mode, payload in agent.stream(initial_state, stream_mode=["values", "custom"]):
+        event = _stream_event(mode, payload)
+        if event:
+            yield event
+
+async def astream_agent(initial_state: CompareState, agent=None) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Async variant of `stream_agent`, running the async node variants. From
+    synchronous code (e.g. Streamlit), consume it with
+    `agent.clients.iterate_async` so it runs on the shared event loop.
+    """
+    agent = agent or compile_agent()
+    async for mode, payload in agent.astream(initial_state, stream_mode=["values", "custom"]):
+        event = _stream_event(mode, payload)
+        if event:
+            yield event
+
+def _stream_event(mode: str, payload: Any):
+    if mode == "custom":
+        return ("token", payload["comparison_token"]) if "comparison_token" in payload else None
+    return "state", payload
@@ -0,0 +1,31 @@
+"""
+Insurers the agent can search, keyed by the lowercase id used in the vector index.
+"""
+
+from typing import List
+
+# Display names
+INSURERS = {
+    "axa": "AXA",
+    "generali": "Generali",
+    "allianz": "Allianz",
+    "zurich": "Zurich",
+    "baloise": "Baloise",
+}
+
+DEFAULT_INSURERS = ["axa", "generali"]
+
+
+def insurer_label(insurer: str) -> str:
+    """Display name of an insurer id."""
+    return INSURERS.get(insurer.lower(), insurer.capitalize())
+
+
+def selected_insurers(insurers: List[str] = None) -> List[str]:
+    """Known insurer ids from `insurers` (defaults to DEFAULT_INSURERS), without duplicates."""
+    selected = []
+    for insurer in insurers or DEFAULT_INSURERS:
+        key = insurer.lower()
+        if key in INSURERS and key not in selected:
+            selected.append(key)
+    return selected
@@ -1,31 +1,56 @@
-import os
-from typing import Dict, Any
+import time
+from typing import Dict, Any, Optional
 from ..state import CompareState
-from openai import OpenAI
-from dotenv import load_dotenv
+from langgraph.config import get_stream_writer
+from ..clients import get_openai_client, get_async_openai_client, get_comparison_cache
+from ..caching import evidence_key, index_version
+from ..insurers import insurer_label, selected_insurers
+from ..tracing import span, usage_tokens
 
-# Load environment variables
-load_dotenv()
+# Bump whenever the comparison prompt changes, so cached comparisons are not reused
+PROMPT_VERSION = "2"
 
-def run_comparison(state: CompareState) -> CompareState:
+def _no_insurer_error(state: CompareState) -> Optional[Dict[str, Any]]:
     """
-    Node for the final comparison between AXA and Generali.
+    The comparison error when none of the requested insurers is supported
+    (starts with "Error" so the answer is not cached), else None.
+    """
+    if selected_insurers(state.get("insurers")):
+        return None
+    return {"comparison": f"Error during comparison: no supported insurer among {', '.join(state.get('insurers') or [])}"}
+
+def format_insurer_results(state: CompareState) -> str:
+    """
+    Join the results of every selected insurer, in selection order.
+    """
+    results = state.get("insurer_results") or {}
+    return "\n\n".join(
+        f"{insurer_label(insurer)}:\n{results.get(insurer, 'No results found for ' + insurer_label(insurer))}"
+        for insurer in selected_insurers(state.get("insurers"))
+    )
+
+def _stream_writer():
+    """
+    Writer for custom stream events; a no-op when the node runs outside a graph.
     """
     try:
-        # Initialize OpenAI client
-        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        
-        # Create the comparison prompt in English
-        comparison_prompt = f"""
-You are an expert in TC insurance. You are comparing two contracts on the same topic (e.g., liability) for a professional use case.
+        return get_stream_writer()
+    except RuntimeError:
+        return lambda event: None
 
-Here are the search results from your two insurer agents:
+def build_comparison_request(state: CompareState) -> Dict[str, Any]:
+    """
+    Chat completion parameters of the comparison (shared by the sync and async nodes).
+    """
+    insurer_count = len(selected_insurers(state.get("insurers")))
+    
+    # Create the comparison prompt in English
+    comparison_prompt = f"""
+You are an expert in TC insurance. You are comparing {insurer_count} contracts on the same topic (e.g., liability) for a professional use case.
 
-AXA:
-{state['axa_result']}
+Here are the search results from your {insurer_count} insurer agents:
 
-Generali:
-{state['generali_result']}
+{format_insurer_results(state)}
 
 Your mission:
 Anlayze what seems to be the best options.
@@ -34,31 +59,132 @@ Anlayze what seems to be the best options.
 - Do not make any assumptions: base your analysis only on the provided texts.
 - Use a clear, professional, and factual tone.
 - Do not recommend an insurer overall: analyze **element by element**.
+- Cite the evidence tags of the excerpts you rely on (e.g. [AXA-1]).
 - **Always answer in English.**
 
 2. **Summary (max 5 lines)**:
 Present the main differences and contractual advantages identified, without recommending an insurer overall.
 """
+    return {
+        "model": "gpt-4o",
+        "messages": [
+            {"role": "system", "content": "You are an expert in car insurance. Create clear and structured tables to compare insurance products. Always answer in English."},
+            {"role": "user", "content": comparison_prompt}
+        ],
+        "temperature": 0.1,
+        "max_tokens": 2000,
+        "stream": True,
+        # The last streamed chunk carries the token usage (for tracing)
+        "stream_options": {"include_usage": True}
+    }
+
+def _collect_token(chunk, parts: list, writer, record: Dict[str, Any], started: float) -> None:
+    """
+    Append the token of a streamed chunk and forward it (stream_mode="custom");
+    token usage and time to first token go to the trace `record`.
+    """
+    record.update(usage_tokens(getattr(chunk, "usage", None)))
+    if not chunk.choices:
+        return
+    token = chunk.choices[0].delta.content
+    if token:
+        if not parts:
+            record["first_token_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        parts.append(token)
+        writer({"comparison_token": token})
+
+def comparison_cache_key(state: CompareState, model: str) -> Optional[str]:
+    """
+    Key of the comparison in the comparison cache (only with `use_cache`),
+    None when caching does not apply, e.g. after a failed search.
+    """
+    if not state.get("use_cache"):
+        return None
+    if any(text.startswith("Error") for text in (state.get("insurer_results") or {}).values()):
+        return None
+    evidence = state.get("insurer_evidence") or {}
+    return evidence_key(
+        {insurer: evidence.get(insurer, []) for insurer in selected_insurers(state.get("insurers"))},
+        state["product"], PROMPT_VERSION, model, index_version()
+    )
+
+def _cached_comparison(key: Optional[str], writer) -> Optional[str]:
+    """Comparison already produced from the same evidence, forwarded to the stream in one piece."""
+    if key is None:
+        return None
+    with span("comparison_cache_lookup", "cache") as record:
+        try:
+            comparison = get_comparison_cache().get(key)
+        except Exception as e:
+            print(f"Error during comparison cache lookup: {e}")
+            comparison = None
+        record["cache_hit"] = comparison is not None
+    if comparison:
+        writer({"comparison_token": comparison})
+    return comparison
+
+def _store_comparison(key: Optional[str], comparison: str) -> None:
+    if key is None or not comparison:
+        return
+    try:
+        get_comparison_cache().put(key, comparison)
+    except Exception as e:
+        print(f"Error while storing the comparison in the cache: {e}")
+
+def run_comparison(state: CompareState) -> Dict[str, Any]:
+    """
+    Node for the final comparison between the selected insurers. A comparison
+    already produced from the same retrieved chunks is reused from the cache.
+    """
+    error = _no_insurer_error(state)
+    if error:
+        return error
+    try:
+        request = build_comparison_request(state)
+        writer = _stream_writer()
+        key = comparison_cache_key(state, request["model"])
+        cached = _cached_comparison(key, writer)
+        if cached:
+            return {"comparison": cached, "comparison_cached": True}
+
+        # Shared OpenAI client (keep-alive connections); tokens are streamed to the caller
+        with span("chat_completion", "chat", model=request["model"]) as record:
+            started = time.perf_counter()
+            stream = get_openai_client().chat.completions.create(**request)
+            parts = []
+            for chunk in stream:
+                _collect_token(chunk, parts, writer, record, started)
+        comparison = "".join(parts)
+        _store_comparison(key, comparison)
+        return {"comparison": comparison, "comparison_cached": False}
         
-        # Generate the comparison with OpenAI
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are an expert in car insurance. Create clear and structured tables to compare insurance products. Always answer in English."},
-                {"role": "user", "content": comparison_prompt}
-            ],
-            temperature=0.1,
-            max_tokens=2000
-        )
-        
-        # Extract the response
-        comparison_result = response.choices[0].message.content
-        
-        # Update state
-        state["comparison"] = comparison_result
-        
-        return state
+    except Exception as e:
+        return {"comparison": f"Error during comparison: {str(e)}"}
+
+async def arun_comparison(state: CompareState) -> Dict[str, Any]:
+    """
+    Async variant of `run_comparison`, using the shared async OpenAI client.
+    """
+    error = _no_insurer_error(state)
+    if error:
+        return error
+    try:
+        request = build_comparison_request(state)
+        writer = _stream_writer()
+        key = comparison_cache_key(state, request["model"])
+        cached = _cached_comparison(key, writer)
+        if cached:
+            return {"comparison": cached, "comparison_cached": True}
+
+        with span("chat_completion", "chat", model=request["model"]) as record:
+            started = time.perf_counter()
+            stream = await get_async_openai_client().chat.completions.create(**request)
+            parts = []
+            async for chunk in stream:
+                _collect_token(chunk, parts, writer, record, started)
+        comparison = "".join(parts)
+        _store_comparison(key, comparison)
+        return {"comparison": comparison, "comparison_cached": False}
         
     except Exception as e:
-        state["comparison"] = f"Error during comparison: {str(e)}"
-        return state
\ No newline at end of file
+        return {"comparison": f"Error during comparison: {str(e)}"}
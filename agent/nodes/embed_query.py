@@ -0,0 +1,35 @@
+from typing import Any, Dict
+from ..state import CompareState
+from ..clients import get_rag_chain
+from ..chains.lexical import section_query
+
+def run_embed_query(state: CompareState) -> Dict[str, Any]:
+    """
+    Node computing the query embedding once for all insurer retrieval nodes,
+    together with the reformulations of the query when expansion is enabled.
+    """
+    try:
+        rag_chain = get_rag_chain()
+        if rag_chain.hybrid and section_query(state["user_input"]):
+            # Section lookups ("section B12") are answered lexically, without an embedding
+            return {"query_embedding": None, "query_variants": None}
+        embedding, variants = rag_chain.prepare_query(state["user_input"])
+    except Exception as e:
+        # Retrieval nodes embed the query themselves when no embedding is available
+        print(f"Error during query embedding: {e}")
+        embedding, variants = None, None
+    return {"query_embedding": embedding, "query_variants": variants}
+
+async def arun_embed_query(state: CompareState) -> Dict[str, Any]:
+    """
+    Async variant of `run_embed_query`.
+    """
+    try:
+        rag_chain = get_rag_chain()
+        if rag_chain.hybrid and section_query(state["user_input"]):
+            return {"query_embedding": None, "query_variants": None}
+        embedding, variants = await rag_chain.aprepare_query(state["user_input"])
+    except Exception as e:
+        print(f"Error during query embedding: {e}")
+        embedding, variants = None, None
+    return {"query_embedding": embedding, "query_variants": variants}
@@ -0,0 +1,102 @@
+import os
+from typing import Any, Awaitable, Callable, Dict, List
+from ..state import CompareState
+from ..clients import get_rag_chain
+from ..insurers import insurer_label, selected_insurers
+from ..chains.context import pack_context, citation_tag, DEFAULT_TOKEN_BUDGET
+
+def format_results(insurer: str, results: List[Dict[str, Any]], query: str = "") -> str:
+    """
+    Format search results as text for the comparison prompt and the UI.
+    The content of the hits is packed into CONTEXT_TOKEN_BUDGET tokens per
+    insurer, keeping the sentences relevant to `query`, each hit tagged for citation.
+    Every hit is listed, numbered like its tag, even when none of its
+    sentences fit the budget. Retrieval scores are left out: they vary with
+    the phrasing, and cached comparisons are shared across phrasings.
+    """
+    label = insurer_label(insurer)
+    if not results:
+        return f"No results found for {label}"
+    budget = int(os.getenv("CONTEXT_TOKEN_BUDGET", DEFAULT_TOKEN_BUDGET))
+    excerpts = {result["tag"]: result["excerpt"] for result in pack_context(insurer, results, query, token_budget=budget)}
+    text = f"{label} Results:\n"
+    for i, result in enumerate(results, 1):
+        tag = citation_tag(insurer, i)
+        text += f"{i}. [{tag}] Section: {result['section']}\n"
+        text += f"   Subsection: {result['subsection']}\n"
+        text += f"   Content: {excerpts.get(tag) or '(no relevant excerpt)'}\n\n"
+    return text
+
+def make_insurer_node(insurer: str) -> Callable[[CompareState], Dict[str, Any]]:
+    """
+    Build the RAG search node of one insurer. Nodes run in parallel, so each
+    returns only its entry of `insurer_results`.
+    """
+    def run_insurer(state: CompareState) -> Dict[str, Any]:
+        try:
+            # Perform search for this insurer with top 4 results
+            results = get_rag_chain().search(
+                query=state["user_input"],
+                insurer=insurer.capitalize(),
+                product=state["product"],
+                top_k=4,
+                embedding=state.get("query_embedding"),
+                variants=state.get("query_variants")
+            )
+            text = format_results(insurer, results, state["user_input"])
+            evidence = [result["id"] for result in results]
+        except Exception as e:
+            text = f"Error during {insurer_label(insurer)} search: {str(e)}"
+            evidence = []
+        return {"insurer_results": {insurer: text}, "insurer_evidence": {insurer: evidence}}
+
+    run_insurer.__name__ = f"run_{insurer}"
+    return run_insurer
+
+def make_async_insurer_node(insurer: str) -> Callable[[CompareState], Awaitable[Dict[str, Any]]]:
+    """
+    Async variant of `make_insurer_node`.
+    """
+    async def arun_insurer(state: CompareState) -> Dict[str, Any]:
+        try:
+            results = await get_rag_chain().asearch(
+                query=state["user_input"],
+                insurer=insurer.capitalize(),
+                product=state["product"],
+                top_k=4,
+                embedding=state.get("query_embedding"),
+                variants=state.get("query_variants")
+            )
+            text = format_results(insurer, results, state["user_input"])
+            evidence = [result["id"] for result in results]
+        except Exception as e:
+            text = f"Error during {insurer_label(insurer)} search: {str(e)}"
+            evidence = []
+        return {"insurer_results": {insurer: text}, "insurer_evidence": {insurer: evidence}}
+
+    arun_insurer.__name__ = f"arun_{insurer}"
+    return arun_insurer
+
+def run_grouped_search(state: CompareState) -> Dict[str, Any]:
+    """
+    Search every selected insurer with a single multi-insurer backend query
+    (RETRIEVAL_MODE=grouped) instead of one query per insurer.
+    """
+    insurers = selected_insurers(state.get("insurers"))
+    try:
+        results = get_rag_chain().search_many(
+            query=state["user_input"],
+            insurers=insurers,
+            product=state["product"],
+            top_k=4,
+            embedding=state.get("query_embedding")
+        )
+        texts = {
+            insurer: format_results(insurer, results.get(insurer, []), state["user_input"])
+            for insurer in insurers
+        }
+        evidence = {insurer: [result["id"] for result in results.get(insurer, [])] for insurer in insurers}
+    except Exception as e:
+        texts = {insurer: f"Error during {insurer_label(insurer)} search: {str(e)}" for insurer in insurers}
+        evidence = {insurer: [] for insurer in insurers}
+    return {"insurer_results": texts, "insurer_evidence": evidence}
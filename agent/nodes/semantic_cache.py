@@ -0,0 +1,52 @@
+from typing import Any, Dict
+from ..state import CompareState
+from ..clients import get_semantic_cache
+from ..caching import index_version
+from ..insurers import selected_insurers
+from ..tracing import span
+
+def run_cache_lookup(state: CompareState) -> Dict[str, Any]:
+    """
+    Node answering from the semantic cache when a near-duplicate question was
+    already answered for the same product and insurers (only with `use_cache`).
+    """
+    embedding = state.get("query_embedding")
+    if not state.get("use_cache") or embedding is None:
+        return {"cache_hit": None}
+    try:
+        with span("semantic_cache_lookup", "cache") as record:
+            entry = get_semantic_cache().lookup(
+                embedding, state["product"], selected_insurers(state.get("insurers")), index_version()
+            )
+            record["cache_hit"] = entry is not None
+    except Exception as e:
+        print(f"Error during semantic cache lookup: {e}")
+        entry = None
+    if entry is None:
+        return {"cache_hit": None}
+    return {
+        "cache_hit": {"query": entry["query"], "similarity": entry["similarity"]},
+        "insurer_results": entry["result"]["insurer_results"],
+        "comparison": entry["result"]["comparison"]
+    }
+
+def run_cache_store(state: CompareState) -> Dict[str, Any]:
+    """
+    Node caching a freshly computed answer, unless a step failed.
+    """
+    embedding = state.get("query_embedding")
+    if not state.get("use_cache") or embedding is None:
+        return {}
+    comparison = state.get("comparison", "")
+    results = state.get("insurer_results") or {}
+    if comparison.startswith("Error") or any(text.startswith("Error") for text in results.values()):
+        return {}
+    try:
+        with span("semantic_cache_store", "cache"):
+            get_semantic_cache().store(
+                state["user_input"], embedding, state["product"], selected_insurers(state.get("insurers")),
+                index_version(), {"insurer_results": results, "comparison": comparison}
+            )
+    except Exception as e:
+        print(f"Error while storing the answer in the semantic cache: {e}")
+    return {}
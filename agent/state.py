@@ -1,10 +1,22 @@
-from typing import TypedDict, List, Optional
+from typing import TypedDict, List, Optional, Dict, Any, Annotated
+
+
+def merge_results(left: Optional[Dict[str, Any]], right: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Reducer joining the per-insurer results written by parallel retrieval nodes."""
+    return {**(left or {}), **(right or {})}
+
 
 class CompareState(TypedDict):
     user_input: str
     product: str
-    axa_result: str
-    generali_result: str
+    query_embedding: Optional[List[float]]
+    # Reformulations of the query and their embeddings (query expansion)
+    query_variants: Optional[Dict[str, List[float]]]
+    insurers: List[str]
+    insurer_results: Annotated[Dict[str, str], merge_results]
+    # Ids of the chunks retrieved for each insurer (key of the comparison cache)
+    insurer_evidence: Annotated[Dict[str, List[str]], merge_results]
     comparison: str
-    axa_answer: str
-    generali_answer: str
\ No newline at end of file
+    comparison_cached: bool
+    use_cache: bool
+    cache_hit: Optional[Dict[str, Any]]
@@ -0,0 +1,199 @@
+"""
+Lightweight per-request tracing of the agent.
+
+A trace is opened around one agent run (`trace_request`) and carried by a
+context variable, so graph nodes and the external calls they make (embedding,
+vector query, chat completion, chunk store) append spans to it without any
+plumbing; spans are no-ops when no trace is active. Each span records wall
+time, tokens in/out, cache hits and errors.
+
+Traces can be appended to a JSON lines file (TRACE_LOG_PATH) and aggregated
+into p50/p95 latencies per span:
+
+    python -m agent.tracing [data/traces/agent_traces.jsonl]
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import datetime
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+
+DEFAULT_TRACE_LOG_PATH = "data/traces/agent_traces.jsonl"
+
+_current_trace: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("agent_trace", default=None)
+
+
+class Trace:
+    """
+    Spans recorded during one agent request. Spans may be added concurrently
+    by parallel nodes.
+    """
+
+    def __init__(self, **attributes):
+        self.request_id = uuid.uuid4().hex[:12]
+        self.started_at = datetime.datetime.now().isoformat(timespec="seconds")
+        self.attributes = attributes
+        self.spans: List[Dict[str, Any]] = []
+        self.duration_ms: Optional[float] = None
+        self._t0 = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def offset_ms(self) -> float:
+        return (time.perf_counter() - self._t0) * 1000
+
+    def add(self, span: Dict[str, Any]) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    def finish(self) -> None:
+        self.duration_ms = round(self.offset_ms(), 3)
+
+    def totals(self) -> Dict[str, Any]:
+        """Totals over the spans: tokens in/out, cache hits and errors."""
+        return {
+            "tokens_in": sum(span.get("tokens_in") or 0 for span in self.spans),
+            "tokens_out": sum(span.get("tokens_out") or 0 for span in self.spans),
+            "cache_hits": sum(1 for span in self.spans if span.get("cache_hit")),
+            "errors": sum(1 for span in self.spans if span.get("error"))
+        }
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "request_id": self.request_id,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms,
+            "attributes": self.attributes,
+            "totals": self.totals(),
+            "spans": sorted(self.spans, key=lambda span: span["start_ms"])
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.as_dict(), ensure_ascii=False, default=str)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def trace_request(**attributes) -> Iterator[Trace]:
+    """Open a trace for one agent request; spans recorded inside are attached to it."""
+    trace = Trace(**attributes)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        trace.finish()
+        _current_trace.reset(token)
+
+
+@contextmanager
+def span(name: str, kind: str, **attributes) -> Iterator[Dict[str, Any]]:
+    """
+    Record one timed operation in the current trace. The yielded dict can be
+    updated with `tokens_in`, `tokens_out`, `cache_hit` or any attribute.
+    """
+    trace = _current_trace.get()
+    record: Dict[str, Any] = {"name": name, "kind": kind, **attributes}
+    if trace is None:
+        yield record
+        return
+    record["start_ms"] = round(trace.offset_ms(), 3)
+    t0 = time.perf_counter()
+    try:
+        yield record
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        record["duration_ms"] = round((time.perf_counter() - t0) * 1000, 3)
+        trace.add(record)
+
+
+def traced_node(name: str, func: Callable) -> Callable:
+    """Wrap a sync or async graph node so each run is recorded as a "node" span."""
+    if asyncio.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(state, *args, **kwargs):
+            with span(name, "node"):
+                return await func(state, *args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(state, *args, **kwargs):
+        with span(name, "node"):
+            return func(state, *args, **kwargs)
+    return wrapper
+
+
+def usage_tokens(usage) -> Dict[str, int]:
+    """tokens_in / tokens_out from an OpenAI `usage` object (absent fields are skipped)."""
+    tokens = {}
+    if usage is None:
+        return tokens
+    if getattr(usage, "prompt_tokens", None) is not None:
+        tokens["tokens_in"] = usage.prompt_tokens
+    if getattr(usage, "completion_tokens", None) is not None:
+        tokens["tokens_out"] = usage.completion_tokens
+    return tokens
+
+
+def export_trace(trace: Trace, path: Optional[str] = None) -> str:
+    """Append the trace as one JSON line and return the file path."""
+    path = path or os.getenv("TRACE_LOG_PATH", DEFAULT_TRACE_LOG_PATH)
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(trace.to_json() + "\n")
+    return path
+
+
+def summarize_traces(path: str) -> List[Dict[str, Any]]:
+    """
+    Latency percentiles per span name (plus the whole request) over a JSON lines trace file.
+    """
+    durations: Dict[str, List[float]] = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            trace = json.loads(line)
+            if trace.get("duration_ms") is not None:
+                durations.setdefault("request", []).append(trace["duration_ms"])
+            for record in trace["spans"]:
+                durations.setdefault(f"{record['kind']}:{record['name']}", []).append(record["duration_ms"])
+    return [
+        {
+            "span": name,
+            "count": len(values),
+            "p50_ms": round(float(np.percentile(values, 50)), 1),
+            "p95_ms": round(float(np.percentile(values, 95)), 1),
+            "max_ms": round(float(np.max(values)), 1)
+        }
+        for name, values in sorted(durations.items())
+    ]
+
+
+def main():
+    from tabulate import tabulate
+    path = sys.argv[1] if len(sys.argv) > 1 else os.getenv("TRACE_LOG_PATH", DEFAULT_TRACE_LOG_PATH)
+    if not os.path.exists(path):
+        print(f"No trace file found at {path}")
+        return
+    rows = summarize_traces(path)
+    print(tabulate([list(row.values()) for row in rows], headers=["Span", "Count", "p50 (ms)", "p95 (ms)", "Max (ms)"],
+                   tablefmt="grid"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""
+Index hors ligne des alignements de clauses entre assureurs.
+
+Pour chaque produit, la matrice complète de similarité cosinus entre les chunks
+de deux assureurs est calculée en un seul produit matriciel NumPy sur les
+vecteurs du cache d'embeddings (aucun appel à l'API). Pour chaque clause, les
+`top_k` clauses les plus proches de chaque autre assureur sont conservées
+(ex : AXA « B3 - Franchise » ↔ Generali « 24. Franchise »), avec un indicateur
+`mutual` quand les deux clauses sont chacune la meilleure de l'autre.
+
+L'index est écrit en JSON (data/processed/alignments/<produit>.json) et lu via
+`load_alignment_index` : l'agent et les pages de comparaison accèdent ainsi
+directement aux paires de clauses alignées, sans recherche au moment de la
+requête.
+
+Usage : python -m src.vectorization.align_clauses --product car [--top-k 3] [--min-score 0.5]
+"""
+import os
+import json
+import argparse
+import datetime
+import threading
+import numpy as np
+from tabulate import tabulate
+
+from agent.chains.lexical import section_of
+from src.vectorization.doc_store import DocStore
+from src.vectorization.embedding_cache import EmbeddingCache
+from src.vectorization.index_settings import get_index_settings
+
+DEFAULT_ALIGNMENT_DIR = 'data/processed/alignments'
+DEFAULT_TOP_K = 3
+DEFAULT_MIN_SCORE = 0.5
+
+_CLAUSE_FIELDS = ('section', 'subsection', 'category')
+
+
+def alignment_path(product: str, directory: str = DEFAULT_ALIGNMENT_DIR) -> str:
+    return os.path.join(directory, f"{product}.json")
+
+
+def partition_vectors(cache: EmbeddingCache, doc_store: DocStore, insurer: str, product: str):
+    """Chunks d'un assureur/produit présents dans le cache et leur matrice normalisée (float32)."""
+    chunks, rows = [], []
+    for chunk in doc_store.partition(insurer, product):
+        row = cache.row(cache.key(chunk['content']))
+        if row is not None:
+            chunks.append(chunk)
+            rows.append(row)
+    matrix = np.asarray(cache.matrix[np.asarray(rows, dtype=np.int64)], dtype=np.float32)
+    if len(matrix):
+        matrix = matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    return chunks, matrix
+
+
+def top_alignments(similarity: np.ndarray, top_k: int, min_score: float) -> list:
+    """
+    Pour chaque ligne de la matrice de similarité, les `top_k` colonnes les plus
+    proches au-dessus de `min_score` : liste de [(colonne, score, mutual)].
+    """
+    if not similarity.size:
+        return [[] for _ in range(len(similarity))]
+    top_k = min(top_k, similarity.shape[1])
+    columns = np.argpartition(-similarity, top_k - 1, axis=1)[:, :top_k]
+    scores = np.take_along_axis(similarity, columns, axis=1)
+    order = np.argsort(-scores, axis=1)
+    columns = np.take_along_axis(columns, order, axis=1)
+    scores = np.take_along_axis(scores, order, axis=1)
+    # Paire mutuelle : chaque clause est la meilleure de l'autre
+    best_row_of_column = similarity.argmax(axis=0)
+    return [
+        [
+            (int(column), float(score), bool(best_row_of_column[column] == row and rank == 0))
+            for rank, (column, score) in enumerate(zip(columns[row], scores[row]))
+            if score >= min_score
+        ]
+        for row in range(len(similarity))
+    ]
+
+
+def build_alignments(partitions: dict, product: str, top_k: int = DEFAULT_TOP_K,
+                     min_score: float = DEFAULT_MIN_SCORE) -> dict:
+    """
+    Index d'alignement d'un produit à partir de {assureur: (chunks, matrice normalisée)}.
+
+    Une seule matrice de similarité par couple d'assureurs (A @ B.T), lue dans
+    les deux sens.
+    """
+    insurers = sorted(insurer for insurer, (chunks, _) in partitions.items() if chunks)
+    index = {
+        'product': product,
+        'built_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'top_k': top_k,
+        'min_score': min_score,
+        'clauses': {
+            insurer: {chunk['id']: {field: chunk.get(field) or '' for field in _CLAUSE_FIELDS}
+                      for chunk in partitions[insurer][0]}
+            for insurer in insurers
+        },
+        'alignments': {insurer: {} for insurer in insurers}
+    }
+    for i, source in enumerate(insurers):
+        for target in insurers[i + 1:]:
+            source_chunks, source_matrix = partitions[source]
+            target_chunks, target_matrix = partitions[target]
+            similarity = source_matrix @ target_matrix.T
+            for a, b, chunks_a, chunks_b, matrix in ((source, target, source_chunks, target_chunks, similarity),
+                                                     (target, source, target_chunks, source_chunks, similarity.T)):
+                index['alignments'][a][b] = {
+                    chunks_a[row]['id']: [
+                        {'id': chunks_b[column]['id'], 'score': round(score, 4), 'mutual': mutual}
+                        for column, score, mutual in matches
+                    ]
+                    for row, matches in enumerate(top_alignments(matrix, top_k, min_score))
+                    if matches
+                }
+    return index
+
+
+def save_alignments(index: dict, directory: str = DEFAULT_ALIGNMENT_DIR) -> str:
+    path = alignment_path(index['product'], directory)
+    os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False)
+    return path
+
+
+class AlignmentIndex:
+    """Lecture de l'index d'alignement d'un produit."""
+
+    def __init__(self, data: dict):
+        self.product = data['product']
+        self.clauses = data['clauses']
+        self.alignments = data['alignments']
+
+    def clause(self, insurer: str, chunk_id: str) -> dict:
+        """Métadonnées d'une clause (section, sous-section, catégorie), ou {}."""
+        return self.clauses.get(insurer.lower(), {}).get(chunk_id, {})
+
+    def aligned(self, insurer: str, chunk_id: str, other: str = None) -> list:
+        """
+        Clauses des autres assureurs (ou du seul `other`) alignées sur une
+        clause, meilleur score d'abord.
+        """
+        insurer = insurer.lower()
+        targets = [other.lower()] if other else list(self.alignments.get(insurer, {}))
+        matches = [
+            dict(match, insurer=target, **self.clause(target, match['id']))
+            for target in targets
+            for match in self.alignments.get(insurer, {}).get(target, {}).get(chunk_id, [])
+        ]
+        return sorted(matches, key=lambda match: match['score'], reverse=True)
+
+    def section_matches(self, section: str, insurer: str, top_k: int = 10) -> list:
+        """
+        Clauses de `insurer` alignées sur la section `section` (ex : "B3") des
+        autres assureurs, au format des backends (`id`, `score`, `metadata`).
+        """
+        section = section.upper()
+        insurer = insurer.lower()
+        best = {}
+        for source, clauses in self.clauses.items():
+            if source == insurer:
+                continue
+            for chunk_id, clause in clauses.items():
+                if section_of(clause['subsection']) != section:
+                    continue
+                for match in self.alignments.get(source, {}).get(insurer, {}).get(chunk_id, []):
+                    best[match['id']] = max(best.get(match['id'], 0.0), match['score'])
+        ranked = sorted(best.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [
+            {
+                'id': chunk_id,
+                'score': score,
+                'metadata': dict(self.clause(insurer, chunk_id), insurer=insurer.capitalize(), product=self.product)
+            }
+            for chunk_id, score in ranked
+        ]
+
+
+_loaded = {}
+_loaded_lock = threading.Lock()
+
+
+def load_alignment_index(product: str, directory: str = DEFAULT_ALIGNMENT_DIR):
+    """
+    Index d'alignement d'un produit, ou None s'il n'a pas été calculé.
+    Relu seulement quand le fichier change.
+    """
+    path = alignment_path(product, directory)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    with _loaded_lock:
+        cached = _loaded.get(path)
+        if cached is None or cached[0] != mtime:
+            with open(path, 'r', encoding='utf-8') as f:
+                cached = (mtime, AlignmentIndex(json.load(f)))
+            _loaded[path] = cached
+        return cached[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute the cross-insurer clause alignment index of a product.")
+    parser.add_argument('--product', type=str, required=True, help='Insurance product (e.g. car, travel).')
+    parser.add_argument('--top-k', type=int, default=DEFAULT_TOP_K, help='Aligned clauses kept per clause and insurer.')
+    parser.add_argument('--min-score', type=float, default=DEFAULT_MIN_SCORE, help='Minimum cosine similarity of an alignment.')
+    parser.add_argument('--output-dir', type=str, default=DEFAULT_ALIGNMENT_DIR, help='Directory of the alignment files.')
+    args = parser.parse_args()
+
+    settings = get_index_settings()
+    cache = EmbeddingCache(settings.model, settings.dimensions, readonly=True)
+    doc_store = DocStore()
+    partitions = {
+        insurer: partition_vectors(cache, doc_store, insurer, product)
+        for insurer, product in doc_store.partitions()
+        if product == args.product
+    }
+    if sum(1 for chunks, _ in partitions.values() if chunks) < 2:
+        print(f"Il faut les vecteurs en cache d'au moins deux assureurs pour le produit {args.product} "
+              f"(lancez d'abord l'upsert avec le cache activé).")
+        return
+
+    index = build_alignments(partitions, args.product, top_k=args.top_k, min_score=args.min_score)
+    path = save_alignments(index, args.output_dir)
+
+    rows = []
+    for source, targets in index['alignments'].items():
+        for target, aligned in targets.items():
+            mutual = sum(1 for matches in aligned.values() if matches[0]['mutual'])
+            rows.append([source, target, len(index['clauses'][source]), len(aligned), mutual])
+    print(tabulate(rows, headers=["Assureur", "Aligné sur", "Clauses", "Clauses alignées", "Paires mutuelles"],
+                   tablefmt="grid"))
+    print(f"Index d'alignement enregistré dans {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Découpage des requêtes d'embeddings selon un budget de tokens.
+
+Les lots sont remplis jusqu'à un plafond estimé de tokens (et non plus un
+nombre fixe de chunks). Un lot refusé par l'API pour dépassement de tokens est
+coupé en deux et renvoyé ; un chunk qui dépasse seul la limite (vérifiée
+avant l'envoi, puis par l'API) est signalé comme échec, jamais ignoré.
+"""
+import time
+import threading
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Limites de l'endpoint embeddings d'OpenAI : 8192 tokens par texte, 300k par requête
+MAX_TOKENS_PER_INPUT = 8191
+DEFAULT_MAX_TOKENS_PER_REQUEST = 50000
+DEFAULT_MAX_ITEMS_PER_REQUEST = 500
+
+_encoding = None
+
+
+def estimate_tokens(text: str) -> int:
+    """Nombre de tokens (cl100k_base si tiktoken est installé, sinon ~4 caractères par token)."""
+    global _encoding
+    if tiktoken is not None:
+        if _encoding is None:
+            _encoding = tiktoken.get_encoding('cl100k_base')
+        return len(_encoding.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+def is_token_limit_error(error: Exception) -> bool:
+    message = str(error).lower()
+    return any(marker in message for marker in (
+        'maximum context length',
+        'too many tokens',
+        'max_tokens_per_request',
+        'maximum request size'
+    ))
+
+
+class TokenBatcher:
+    """Regroupe des éléments en lots dont la somme estimée de tokens reste sous le plafond."""
+
+    def __init__(self, max_tokens: int = DEFAULT_MAX_TOKENS_PER_REQUEST,
+                 max_items: int = DEFAULT_MAX_ITEMS_PER_REQUEST, count_tokens=estimate_tokens):
+        self.max_tokens = max_tokens
+        self.max_items = max_items
+        self.count_tokens = count_tokens
+
+    def batches(self, items: list, text=lambda item: item) -> list:
+        batches = []
+        current, current_tokens = [], 0
+        for item in items:
+            tokens = self.count_tokens(text(item))
+            if current and (current_tokens + tokens > self.max_tokens or len(current) >= self.max_items):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(item)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+
+class EmbeddingStats:
+    """Compteurs des requêtes d'embeddings : tokens, durée, découpages et échecs."""
+
+    def __init__(self):
+        self.requests = 0
+        self.tokens = 0
+        self.seconds = 0.0
+        self.splits = 0
+        self.failures = []
+        self.requests_per_document = {}
+        self._lock = threading.Lock()
+
+    def record_request(self, tokens: int, seconds: float, documents=()):
+        with self._lock:
+            self.requests += 1
+            self.tokens += tokens
+            self.seconds += seconds
+            for document in set(documents):
+                self.requests_per_document[document] = self.requests_per_document.get(document, 0) + 1
+
+    def record_split(self):
+        with self._lock:
+            self.splits += 1
+
+    def record_failure(self, item_id: str, error: Exception):
+        with self._lock:
+            self.failures.append({'id': item_id, 'error': str(error)})
+
+    def as_dict(self) -> dict:
+        return {
+            'requests': self.requests,
+            'tokens': self.tokens,
+            'tokens_per_second': round(self.tokens / self.seconds, 1) if self.seconds else 0.0,
+            'splits': self.splits,
+            'failed_items': len(self.failures),
+            'requests_per_document': self.requests_per_document
+        }
+
+
+def embed_with_split(texts: list, request_fn, stats: EmbeddingStats, ids: list = None, documents: list = None,
+                     count_tokens=estimate_tokens) -> list:
+    """
+    Embedde `texts` via `request_fn(texts) -> (vecteurs, tokens)`.
+
+    Les textes qui dépassent seuls MAX_TOKENS_PER_INPUT sont signalés comme
+    échecs sans appel à l'API. Si l'API refuse un lot pour dépassement de
+    tokens, il est coupé en deux et chaque moitié est renvoyée. Retourne une
+    liste alignée sur `texts` où les éléments impossibles à embedder valent
+    None (et sont enregistrés dans `stats`).
+    """
+    ids = ids or [str(i) for i in range(len(texts))]
+    documents = documents or [''] * len(texts)
+    vectors = [None] * len(texts)
+    accepted = []
+    for i, text in enumerate(texts):
+        tokens = count_tokens(text)
+        if tokens > MAX_TOKENS_PER_INPUT:
+            stats.record_failure(ids[i], ValueError(f"{tokens} tokens, au-delà de la limite de {MAX_TOKENS_PER_INPUT} par texte"))
+        else:
+            accepted.append(i)
+    if accepted:
+        embedded = _split_and_embed([texts[i] for i in accepted], request_fn, stats,
+                                    [ids[i] for i in accepted], [documents[i] for i in accepted])
+        for i, vector in zip(accepted, embedded):
+            vectors[i] = vector
+    return vectors
+
+
+def _split_and_embed(texts: list, request_fn, stats: EmbeddingStats, ids: list, documents: list) -> list:
+    try:
+        t0 = time.perf_counter()
+        vectors, tokens = request_fn(texts)
+        stats.record_request(tokens, time.perf_counter() - t0, documents)
+        return list(vectors)
+    except Exception as e:
+        if not is_token_limit_error(e):
+            raise
+        if len(texts) == 1:
+            stats.record_failure(ids[0], e)
+            return [None]
+        stats.record_split()
+        middle = len(texts) // 2
+        return (
+            _split_and_embed(texts[:middle], request_fn, stats, ids[:middle], documents[:middle])
+            + _split_and_embed(texts[middle:], request_fn, stats, ids[middle:], documents[middle:])
+        )
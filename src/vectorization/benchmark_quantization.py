@@ -0,0 +1,123 @@
+"""
+Benchmark du stockage quantifié (int8 / float16) de la recherche locale.
+
+Compare chaque configuration à la recherche exacte float32 sur le corpus de
+chunks (vecteurs du cache d'embeddings) : recall@k, requêtes par seconde et
+octets résidents par vecteur. Comme dans `LocalBackend.from_embedding_cache`,
+le re-scoring lit les vecteurs exacts dans une matrice memory-mappée (un
+fichier temporaire ici), qui n'est pas comptée en mémoire. Les requêtes sont
+des vecteurs du corpus bruités, pour simuler des questions proches d'un chunk
+sans appeler l'API.
+
+Usage : python -m src.vectorization.benchmark_quantization [--k 4] [--queries 200]
+"""
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+from tabulate import tabulate
+
+from agent.chains.backends import LocalBackend
+from src.vectorization.embedding_cache import EmbeddingCache
+from src.vectorization.doc_store import DocStore
+
+CONFIGURATIONS = [
+    ('float32 (exact)', None, 0),
+    ('float16', 'float16', 0),
+    ('float16 + rescoring', 'float16', 4),
+    ('int8', 'int8', 0),
+    ('int8 + rescoring', 'int8', 4),
+]
+
+
+def load_corpus(model: str, dimensions: int) -> np.ndarray:
+    """Vecteurs de tous les chunks du DocStore présents dans le cache."""
+    cache = EmbeddingCache(model, dimensions, readonly=True)
+    doc_store = DocStore()
+    rows = [
+        cache.row(cache.key(chunk['content']))
+        for insurer, product in doc_store.partitions()
+        for chunk in doc_store.partition(insurer, product)
+    ]
+    rows = [row for row in rows if row is not None]
+    return np.asarray(cache.matrix[rows], dtype=np.float32)
+
+
+def synthetic_corpus(size: int, dimensions: int, seed: int = 0) -> np.ndarray:
+    """Corpus aléatoire regroupé en clusters, à défaut de cache local."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(size // 50, 1), dimensions))
+    corpus = centers[rng.integers(0, len(centers), size)] + 0.5 * rng.standard_normal((size, dimensions))
+    return corpus.astype(np.float32)
+
+
+def make_queries(corpus: np.ndarray, count: int, noise: float = 0.5, seed: int = 1) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    base = corpus[rng.integers(0, len(corpus), count)]
+    base = base / np.linalg.norm(base, axis=1, keepdims=True)
+    queries = base + noise * rng.standard_normal(base.shape) / np.sqrt(corpus.shape[1])
+    return queries.astype(np.float32)
+
+
+def memmapped(corpus: np.ndarray, directory: str) -> np.memmap:
+    """Copie du corpus dans une matrice memory-mappée, comme le cache d'embeddings."""
+    matrix = np.memmap(os.path.join(directory, 'vectors.bin'), dtype=np.float32, mode='w+', shape=corpus.shape)
+    matrix[:] = corpus
+    matrix.flush()
+    return matrix
+
+
+def run_benchmark(corpus: np.ndarray, queries: np.ndarray, k: int) -> list:
+    with tempfile.TemporaryDirectory() as directory:
+        return _run_benchmark(corpus, memmapped(corpus, directory), queries, k)
+
+
+def _run_benchmark(corpus: np.ndarray, exact_matrix: np.memmap, queries: np.ndarray, k: int) -> list:
+    ids = [str(i) for i in range(len(corpus))]
+    metadata = [{} for _ in ids]
+    exact = None
+    rows = []
+    for name, quantization, rescore_factor in CONFIGURATIONS:
+        backend = LocalBackend(quantization=quantization, rescore_factor=rescore_factor)
+        backend.add_partition('bench', 'bench', ids, corpus, metadata,
+                              exact_vectors=(lambda candidates: exact_matrix[candidates]) if quantization else None)
+        partition = backend.partitions[('bench', 'bench')]
+
+        t0 = time.perf_counter()
+        results = [[match['id'] for match in backend.query(query, 'bench', 'bench', top_k=k)] for query in queries]
+        seconds = time.perf_counter() - t0
+
+        if exact is None:
+            exact = results
+        recall = np.mean([len(set(found) & set(truth)) / k for found, truth in zip(results, exact)])
+        rows.append([name, f"{recall:.4f}", f"{len(queries) / seconds:,.0f}", f"{partition.bytes_per_vector:,.0f}"])
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark quantized local vector storage against exact float32 search.")
+    parser.add_argument('--k', type=int, default=4, help='Number of results per query (recall@k).')
+    parser.add_argument('--queries', type=int, default=200, help='Number of benchmark queries.')
+    parser.add_argument('--model', type=str, default='text-embedding-3-small', help='Embedding model of the cache.')
+    parser.add_argument('--dimensions', type=int, default=1536, help='Embedding dimensions of the cache.')
+    parser.add_argument('--synthetic', type=int, default=0, help='Use N synthetic vectors instead of the local corpus.')
+    args = parser.parse_args()
+
+    if args.synthetic:
+        corpus = synthetic_corpus(args.synthetic, args.dimensions)
+        print(f"Corpus synthétique : {len(corpus)} vecteurs de dimension {args.dimensions}")
+    else:
+        corpus = load_corpus(args.model, args.dimensions)
+        print(f"Corpus local : {len(corpus)} chunks ({args.model}, {args.dimensions} dimensions)")
+    if not len(corpus):
+        print("Aucun vecteur trouvé : lancez d'abord l'upsert avec le cache activé, ou utilisez --synthetic.")
+        return
+
+    queries = make_queries(corpus, args.queries)
+    rows = run_benchmark(corpus, queries, args.k)
+    print(tabulate(rows, headers=["Stockage", f"Recall@{args.k}", "QPS", "Octets résidents/vecteur"], tablefmt="grid"))
+
+
+if __name__ == "__main__":
+    main()
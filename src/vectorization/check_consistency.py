@@ -0,0 +1,205 @@
+"""
+Contrôle de cohérence entre les chunks locaux, le manifeste, le DocStore et l'index vectoriel.
+
+Pour chaque assureur et produit, l'état attendu (dernier fichier de chunks) est
+comparé à l'état réel de l'index (ids listés puis métadonnées `content_hash`
+lues par pages) :
+- missing    : chunks absents de l'index ;
+- stale      : vecteurs de l'index qui ne correspondent plus à aucun chunk ;
+- mismatched : vecteurs dont le hash de contenu diffère (ou est absent) ;
+- manifest_drift : ids pour lesquels le manifeste local ne reflète pas l'index ;
+- doc_store_missing : chunks dont le texte manque dans le DocStore.
+
+Avec `--repair`, le manifeste est réaligné sur l'état réel de l'index puis
+l'upsert incrémental ne ré-embedde et ne réécrit que les écarts. Le rapport
+JSON est destiné à un cron nocturne (code de sortie 1 si des écarts subsistent).
+
+Usage :
+    python -m src.vectorization.check_consistency [--insurer axa] [--repair] [--report rapport.json]
+"""
+import os
+import sys
+import glob
+import json
+import argparse
+import datetime
+import contextlib
+from dotenv import load_dotenv
+from openai import OpenAI
+from pinecone import Pinecone
+
+from src.vectorization.doc_store import DocStore
+from src.vectorization.embedding_cache import EmbeddingCache
+from src.vectorization.index_settings import IndexSettings, get_index_settings
+from src.vectorization.manifest import build_records, load_manifest, save_manifest, manifest_target
+from src.vectorization.upsert_to_pinecone import (
+    get_latest_categorized_file,
+    load_chunks,
+    infer_product,
+    list_vector_ids,
+    process_insurer_upsert,
+)
+
+load_dotenv()
+
+# Taille d'une page de `list` / `fetch`
+PAGE_SIZE = 100
+
+# Nombre d'ids d'exemple conservés par catégorie d'écart dans le rapport
+SAMPLE_SIZE = 20
+
+
+def list_insurers() -> list:
+    """Assureurs ayant au moins un répertoire de chunks, bruts ou catégorisés."""
+    return sorted({
+        os.path.basename(os.path.dirname(path))
+        for layout in ('chunks', 'categorized_chunks')
+        for path in glob.glob(f'data/processed/*/{layout}')
+    })
+
+
+def index_state(index, insurer: str, product: str, settings: IndexSettings) -> dict:
+    """État réel de l'index pour un assureur et un produit : {id: hash du contenu ou None}."""
+    namespace = settings.namespace(insurer, product)
+    # En organisation "shared", tous les assureurs partagent le namespace par défaut
+    prefix = f"{insurer.lower()}-{product}-" if settings.namespace_layout == 'shared' else None
+    ids = list_vector_ids(index, namespace=namespace, prefix=prefix, limit=PAGE_SIZE)
+
+    state = {}
+    for i in range(0, len(ids), PAGE_SIZE):
+        fetched = index.fetch(ids=ids[i:i + PAGE_SIZE], namespace=namespace).vectors
+        for vector_id, vector in fetched.items():
+            state[vector_id] = (vector.metadata or {}).get('content_hash')
+    return state
+
+
+def check_partition(index, insurer: str, product: str = None, settings: IndexSettings = None,
+                    doc_store: DocStore = None) -> dict:
+    """Compare chunks locaux, manifeste, DocStore et index ; retourne le rapport de la partition."""
+    settings = settings or get_index_settings()
+    chunk_file = get_latest_categorized_file(insurer)
+    product = infer_product(chunk_file, product)
+    expected = {record['id']: record['content_hash'] for record in build_records(load_chunks(chunk_file), insurer, product)}
+    actual = index_state(index, insurer, product, settings)
+    manifest = load_manifest(insurer, product,
+                             target=manifest_target(settings, namespace=settings.namespace(insurer, product)))
+
+    missing = sorted(set(expected) - set(actual))
+    stale = sorted(set(actual) - set(expected))
+    mismatched = sorted(vector_id for vector_id in set(expected) & set(actual) if actual[vector_id] != expected[vector_id])
+    manifest_drift = sorted(
+        vector_id for vector_id in set(manifest) | set(actual)
+        if manifest.get(vector_id) != actual.get(vector_id)
+    )
+    doc_store_missing = []
+    if doc_store is not None:
+        stored = doc_store.get_many(list(expected))
+        doc_store_missing = sorted(
+            vector_id for vector_id in expected
+            if vector_id not in stored or stored[vector_id]['content_hash'] != expected[vector_id]
+        )
+
+    discrepancies = {
+        'missing': missing,
+        'stale': stale,
+        'mismatched': mismatched,
+        'manifest_drift': manifest_drift,
+        'doc_store_missing': doc_store_missing
+    }
+    return {
+        'insurer': insurer.lower(),
+        'product': product,
+        'namespace': settings.namespace(insurer, product),
+        'chunk_file': chunk_file,
+        'expected': len(expected),
+        'indexed': len(actual),
+        'counts': {name: len(ids) for name, ids in discrepancies.items()},
+        'samples': {name: ids[:SAMPLE_SIZE] for name, ids in discrepancies.items() if ids},
+        'ok': not any(discrepancies.values()),
+        # Utilisé par la réparation, retiré du rapport publié
+        '_actual': actual
+    }
+
+
+def repair_partition(partition: dict, index, openai_client, settings: IndexSettings, cache: EmbeddingCache = None,
+                     doc_store: DocStore = None) -> bool:
+    """
+    Répare une partition : le manifeste est remplacé par l'état réel de l'index,
+    puis l'upsert incrémental upserte les chunks manquants ou modifiés et
+    supprime les vecteurs obsolètes (le DocStore est réécrit au passage).
+    """
+    save_manifest(partition['insurer'], partition['product'], partition['_actual'], chunk_file=partition['chunk_file'],
+                  target=manifest_target(settings, namespace=settings.namespace(partition['insurer'], partition['product'])))
+    # Les messages de l'upsert vont sur stderr : stdout est réservé au rapport JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        return process_insurer_upsert(
+            partition['insurer'], None, openai_client, index, settings.model, product=partition['product'],
+            cache=cache, doc_store=doc_store, embedding_dimensions=settings.dimensions, settings=settings
+        )
+
+
+def run_checks(index, insurers: list, product: str = None, settings: IndexSettings = None, doc_store: DocStore = None,
+               repair: bool = False, openai_client=None, cache: EmbeddingCache = None) -> dict:
+    """Contrôle (et répare si demandé) chaque assureur ; retourne le rapport complet."""
+    settings = settings or get_index_settings()
+    partitions = []
+    for insurer in insurers:
+        try:
+            partition = check_partition(index, insurer, product, settings=settings, doc_store=doc_store)
+        except FileNotFoundError as e:
+            partitions.append({'insurer': insurer.lower(), 'product': product, 'ok': False, 'error': str(e)})
+            continue
+        if repair and not partition['ok']:
+            before = partition['counts']
+            repaired = repair_partition(partition, index, openai_client, settings, cache=cache, doc_store=doc_store)
+            partition = check_partition(index, insurer, product, settings=settings, doc_store=doc_store)
+            partition['repair'] = {'before': before, 'upsert_ok': repaired}
+        partition.pop('_actual')
+        partitions.append(partition)
+    return {
+        'checked_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'model': settings.model,
+        'dimensions': settings.dimensions,
+        'namespace_layout': settings.namespace_layout,
+        'repair': repair,
+        'ok': all(partition['ok'] for partition in partitions),
+        'partitions': partitions
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that local chunks, manifests, the doc store and the vector index agree.")
+    parser.add_argument('--insurer', type=str, nargs='+', default=None, help='Insurers to check (default: every insurer with chunk files).')
+    parser.add_argument('--product', type=str, default=None, help='Insurance product. If not provided, inferred from the chunk file path.')
+    parser.add_argument('--repair', action='store_true', help='Re-embed and rewrite only the discrepancies.')
+    parser.add_argument('--report', type=str, default=None, help='Write the JSON report to this file instead of stdout.')
+    parser.add_argument('--no-cache', action='store_true', help='Disable the on-disk embedding cache during repair.')
+    args = parser.parse_args()
+
+    index_name = os.getenv("PINECONE_INDEX_NAME")
+    if not os.getenv("PINECONE_API_KEY") or not index_name:
+        print("Erreur : PINECONE_API_KEY et PINECONE_INDEX_NAME doivent être définies dans le fichier .env", file=sys.stderr)
+        sys.exit(2)
+    index = Pinecone(api_key=os.getenv("PINECONE_API_KEY")).Index(index_name)
+    settings = get_index_settings()
+
+    openai_client, cache = None, None
+    if args.repair:
+        openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        if not args.no_cache:
+            cache = EmbeddingCache(settings.model, settings.dimensions)
+
+    report = run_checks(index, args.insurer or list_insurers(), args.product, settings=settings, doc_store=DocStore(),
+                        repair=args.repair, openai_client=openai_client, cache=cache)
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            f.write(output)
+        print(f"Rapport sauvegardé dans : {args.report}", file=sys.stderr)
+    else:
+        print(output)
+    sys.exit(0 if report['ok'] else 1)
+
+
+if __name__ == "__main__":
+    main()
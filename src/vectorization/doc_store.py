@@ -0,0 +1,81 @@
+"""
+Stockage local du texte des chunks.
+
+Les vecteurs de l'index ne portent que des métadonnées compactes ; le contenu
+complet est conservé ici, dans une base SQLite indexée par id de vecteur, et
+récupéré en une seule requête pour les résultats effectivement retournés.
+"""
+import os
+import sqlite3
+import threading
+
+DEFAULT_DOC_STORE_PATH = 'data/processed/doc_store.sqlite'
+
+COLUMNS = ('id', 'insurer', 'product', 'section', 'subsection', 'category', 'content', 'content_hash')
+
+# SQLite limite le nombre de paramètres d'une requête
+_MAX_VARIABLES = 900
+
+
+class DocStore:
+    """Table `chunks` (id -> métadonnées + contenu) dans un fichier SQLite."""
+
+    def __init__(self, path: str = DEFAULT_DOC_STORE_PATH):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                "id TEXT PRIMARY KEY, insurer TEXT, product TEXT, section TEXT, subsection TEXT, "
+                "category TEXT, content TEXT, content_hash TEXT)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS chunks_partition ON chunks (insurer, product)")
+
+    def upsert_many(self, rows: list) -> None:
+        """Insère ou remplace des chunks (dicts avec les clés de COLUMNS)."""
+        values = [tuple(row.get(column, '') for column in COLUMNS) for row in rows]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO chunks ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                values
+            )
+
+    def delete_many(self, ids: list) -> None:
+        with self._lock, self._conn:
+            for i in range(0, len(ids), _MAX_VARIABLES):
+                batch = ids[i:i + _MAX_VARIABLES]
+                self._conn.execute(f"DELETE FROM chunks WHERE id IN ({', '.join('?' * len(batch))})", batch)
+
+    def get_many(self, ids: list) -> dict:
+        """Retourne {id: chunk} pour les ids présents, en une requête par tranche de 900 ids."""
+        found = {}
+        with self._lock:
+            for i in range(0, len(ids), _MAX_VARIABLES):
+                batch = ids[i:i + _MAX_VARIABLES]
+                cursor = self._conn.execute(
+                    f"SELECT * FROM chunks WHERE id IN ({', '.join('?' * len(batch))})", batch
+                )
+                found.update({row['id']: dict(row) for row in cursor})
+        return found
+
+    def partition(self, insurer: str, product: str) -> list:
+        """Tous les chunks d'un assureur et d'un produit."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT * FROM chunks WHERE insurer = ? AND product = ? ORDER BY id",
+                (insurer.lower(), product)
+            )
+            return [dict(row) for row in cursor]
+
+    def partitions(self) -> list:
+        """Liste des couples (assureur, produit) présents."""
+        with self._lock:
+            cursor = self._conn.execute("SELECT DISTINCT insurer, product FROM chunks ORDER BY insurer, product")
+            return [(row['insurer'], row['product']) for row in cursor]
+
+    def close(self) -> None:
+        self._conn.close()
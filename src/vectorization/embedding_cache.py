@@ -0,0 +1,164 @@
+import os
+import json
+import hashlib
+import threading
+import numpy as np
+
+DEFAULT_CACHE_DIR = 'data/processed/embeddings_cache'
+SUPPORTED_DTYPES = ('float32', 'float16')
+
+
+def embedding_key(content: str, model: str, dimensions: int) -> str:
+    """Clé de cache d'un texte : hash du contenu, du modèle et de la dimension."""
+    payload = f"{model}\x00{dimensions}\x00{content}".encode('utf-8')
+    return hashlib.sha256(payload).hexdigest()
+
+
+def supports_dimensions(model: str) -> bool:
+    """Les modèles text-embedding-3 acceptent le paramètre `dimensions`."""
+    return model.startswith('text-embedding-3')
+
+
+class EmbeddingCache:
+    """
+    Cache disque des embeddings.
+
+    Les vecteurs sont stockés dans une matrice memory-mappée (`vectors.bin`,
+    float32 ou float16) et un index JSON associe chaque clé à son numéro de ligne.
+    Les autres consommateurs (recherche locale, dédoublonnage, clustering) lisent
+    la matrice via `matrix` sans copie et sans appel à l'API.
+    """
+
+    def __init__(self, model: str, dimensions: int, cache_dir: str = DEFAULT_CACHE_DIR,
+                 dtype: str = 'float32', readonly: bool = False):
+        if dtype not in SUPPORTED_DTYPES:
+            raise ValueError(f"dtype non supporté : {dtype} (attendu : {', '.join(SUPPORTED_DTYPES)})")
+        self.model = model
+        self.dimensions = dimensions
+        self.dtype = np.dtype(dtype)
+        self.readonly = readonly
+        self.directory = os.path.join(cache_dir, f"{model}-{dimensions}-{dtype}")
+        self.matrix_path = os.path.join(self.directory, 'vectors.bin')
+        self.index_path = os.path.join(self.directory, 'index.json')
+        self._lock = threading.Lock()
+        self._rows = {}
+        self._capacity = 0
+        self._memmap = None
+
+        if not readonly:
+            os.makedirs(self.directory, exist_ok=True)
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            self._rows = index['rows']
+            self._capacity = index['capacity']
+        if self._capacity:
+            self._open_matrix()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._rows
+
+    def key(self, content: str) -> str:
+        return embedding_key(content, self.model, self.dimensions)
+
+    def row(self, key: str):
+        """Numéro de ligne d'une clé dans `matrix`, ou None si absente."""
+        return self._rows.get(key)
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """Vue (sans copie) sur les lignes remplies de la matrice memory-mappée."""
+        if self._memmap is None:
+            return np.empty((0, self.dimensions), dtype=self.dtype)
+        return self._memmap[:len(self._rows)]
+
+    def get(self, key: str):
+        """Vecteur (vue sans copie) associé à une clé, ou None."""
+        with self._lock:
+            row = self._rows.get(key)
+            if row is None:
+                return None
+            return self._memmap[row]
+
+    def get_many(self, keys: list) -> np.ndarray:
+        """Matrice des vecteurs pour les clés données (toutes doivent être présentes)."""
+        with self._lock:
+            rows = [self._rows[key] for key in keys]
+            return np.asarray(self._memmap[rows])
+
+    def put_many(self, keys: list, vectors) -> None:
+        """Ajoute des vecteurs au cache ; les clés déjà présentes sont ignorées."""
+        if self.readonly:
+            raise RuntimeError("Cache ouvert en lecture seule")
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(keys) != len(vectors):
+            raise ValueError("Le nombre de clés et de vecteurs diffère")
+        if len(keys) and vectors.shape[1] != self.dimensions:
+            raise ValueError(f"Dimension attendue {self.dimensions}, reçue {vectors.shape[1]}")
+
+        with self._lock:
+            new = {}
+            for key, vector in zip(keys, vectors):
+                if key not in self._rows and key not in new:
+                    new[key] = vector
+            if not new:
+                return
+            start = len(self._rows)
+            self._ensure_capacity(start + len(new))
+            self._memmap[start:start + len(new)] = np.stack(list(new.values())).astype(self.dtype)
+            self._memmap.flush()
+            for offset, key in enumerate(new):
+                self._rows[key] = start + offset
+            self._save_index()
+
+    def embed(self, contents: list, openai_client) -> list:
+        """
+        Retourne les embeddings des textes, en n'appelant l'API que pour ceux
+        qui ne sont pas encore en cache.
+        """
+        keys = [self.key(content) for content in contents]
+        missing = {}
+        for key, content in zip(keys, contents):
+            if key not in self._rows and key not in missing:
+                missing[key] = content
+
+        if missing:
+            params = {'input': list(missing.values()), 'model': self.model}
+            if supports_dimensions(self.model):
+                params['dimensions'] = self.dimensions
+            res = openai_client.embeddings.create(**params)
+            self.put_many(list(missing.keys()), [record.embedding for record in res.data])
+
+        return self.get_many(keys).astype(np.float32).tolist()
+
+    def _open_matrix(self) -> None:
+        mode = 'r' if self.readonly else 'r+'
+        self._memmap = np.memmap(self.matrix_path, dtype=self.dtype, mode=mode,
+                                 shape=(self._capacity, self.dimensions))
+
+    def _ensure_capacity(self, rows: int) -> None:
+        if rows <= self._capacity:
+            return
+        capacity = max(rows, 2 * self._capacity, 1024)
+        if self._memmap is not None:
+            self._memmap.flush()
+            self._memmap = None
+        with open(self.matrix_path, 'ab') as f:
+            f.truncate(capacity * self.dimensions * self.dtype.itemsize)
+        self._capacity = capacity
+        self._open_matrix()
+
+    def _save_index(self) -> None:
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'model': self.model,
+                'dimensions': self.dimensions,
+                'dtype': self.dtype.name,
+                'capacity': self._capacity,
+                'rows': self._rows
+            }, f)
+        os.replace(tmp_path, self.index_path)
@@ -0,0 +1,148 @@
+"""
+Évaluation hors ligne du compromis dimension des embeddings / qualité / latence.
+
+Pour chaque dimension candidate (256, 512, 1024, 1536), mesure sur un jeu de
+questions de référence le recall@k (sous-sections attendues retrouvées) et la
+latence de requête de la recherche locale.
+
+Les modèles text-embedding-3 sont entraînés pour que les premières composantes
+d'un vecteur forment un embedding valide : par défaut, les vecteurs 1536 du
+cache sont tronqués puis renormalisés, ce qui équivaut au paramètre
+`dimensions` de l'API sans ré-embedder le corpus. `--reembed` demande au
+contraire de vrais embeddings à chaque dimension (via des caches séparés).
+
+Format du jeu de référence (JSON) :
+[
+    {"question": "Quelle est la franchise pour les jeunes conducteurs ?",
+     "insurer": "axa", "product": "car", "expected": ["B3", "C2"]}
+]
+Une sous-section attendue correspond à un résultat dont la sous-section
+commence par cet identifiant (ex : "B3" pour "B3 - Franchise").
+
+Usage : python -m src.vectorization.evaluate_dimensions [--golden data/eval/golden_questions.json]
+"""
+import os
+import json
+import time
+import argparse
+import numpy as np
+from dotenv import load_dotenv
+from openai import OpenAI
+from tabulate import tabulate
+
+from agent.chains.backends import LocalBackend
+from src.vectorization.batching import TokenBatcher
+from src.vectorization.doc_store import DocStore
+from src.vectorization.embedding_cache import EmbeddingCache
+from src.vectorization.index_settings import DEFAULT_EMBEDDING_MODEL, CANDIDATE_DIMENSIONS
+
+load_dotenv()
+
+DEFAULT_GOLDEN_PATH = 'data/eval/golden_questions.json'
+
+
+def load_golden(path: str) -> list:
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def subsection_matches(subsection: str, expected: str) -> bool:
+    """Vrai si la sous-section retournée correspond à l'identifiant attendu (ex : "B3", "24.")."""
+    subsection = subsection.strip()
+    if not subsection:
+        return False
+    return subsection == expected or subsection.split()[0].rstrip('.-') == expected.strip().rstrip('.-')
+
+
+def truncate(matrix: np.ndarray, dimensions: int) -> np.ndarray:
+    """Garde les `dimensions` premières composantes et renormalise."""
+    matrix = np.asarray(matrix, dtype=np.float32)[..., :dimensions]
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def build_backend(doc_store: DocStore, vectors_for, dimensions: int) -> LocalBackend:
+    """Backend local à `dimensions`, `vectors_for(chunks)` fournissant les vecteurs du corpus."""
+    backend = LocalBackend()
+    for insurer, product in doc_store.partitions():
+        chunks = doc_store.partition(insurer, product)
+        metadata = [{'subsection': chunk['subsection'], 'section': chunk['section']} for chunk in chunks]
+        backend.add_partition(insurer, product, [chunk['id'] for chunk in chunks],
+                              truncate(vectors_for(chunks), dimensions), metadata)
+    return backend
+
+
+def evaluate(backend: LocalBackend, golden: list, query_vectors: np.ndarray, k: int) -> dict:
+    recalls, latencies = [], []
+    for item, vector in zip(golden, query_vectors):
+        t0 = time.perf_counter()
+        matches = backend.query(vector, item['insurer'], item['product'], top_k=k)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        retrieved = [match['metadata']['subsection'] for match in matches]
+        found = sum(1 for expected in item['expected'] if any(subsection_matches(s, expected) for s in retrieved))
+        recalls.append(found / len(item['expected']) if item['expected'] else 0.0)
+    return {
+        'recall': float(np.mean(recalls)) if recalls else 0.0,
+        'latency_ms_mean': float(np.mean(latencies)) if latencies else 0.0,
+        'latency_ms_p95': float(np.percentile(latencies, 95)) if latencies else 0.0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure recall@k and query latency at several embedding dimensions.")
+    parser.add_argument('--golden', type=str, default=DEFAULT_GOLDEN_PATH, help='Golden question set (JSON).')
+    parser.add_argument('--k', type=int, default=4, help='Number of retrieved chunks per question (recall@k).')
+    parser.add_argument('--model', type=str, default=DEFAULT_EMBEDDING_MODEL, help='Embedding model.')
+    parser.add_argument('--dimensions', type=int, nargs='+', default=list(CANDIDATE_DIMENSIONS), help='Dimensions to evaluate.')
+    parser.add_argument('--reembed', action='store_true', help='Request real embeddings at each dimension instead of truncating.')
+    parser.add_argument('--output', type=str, default=None, help='Write the results as JSON to this file.')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.golden):
+        print(f"Jeu de référence introuvable : {args.golden} (voir le format dans la docstring du module)")
+        return
+    golden = load_golden(args.golden)
+    questions = [item['question'] for item in golden]
+    doc_store = DocStore()
+    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    full_dimensions = max(args.dimensions)
+
+    def cached_vectors(cache, texts):
+        # Lots bornés en tokens pour les textes absents du cache
+        vectors = []
+        for batch in TokenBatcher().batches(texts):
+            vectors.extend(cache.embed(batch, client))
+        return np.asarray(vectors, dtype=np.float32)
+
+    full_cache = EmbeddingCache(args.model, full_dimensions)
+    full_questions = cached_vectors(full_cache, questions) if not args.reembed else None
+
+    results = []
+    for dimensions in sorted(args.dimensions):
+        if args.reembed:
+            cache = EmbeddingCache(args.model, dimensions)
+            backend = build_backend(doc_store, lambda chunks: cached_vectors(cache, [c['content'] for c in chunks]), dimensions)
+            query_vectors = cached_vectors(cache, questions)
+        else:
+            backend = build_backend(doc_store, lambda chunks: cached_vectors(full_cache, [c['content'] for c in chunks]), dimensions)
+            query_vectors = truncate(full_questions, dimensions)
+        metrics = evaluate(backend, golden, query_vectors, args.k)
+        metrics.update({'dimensions': dimensions, 'bytes_per_vector': dimensions * 4})
+        results.append(metrics)
+
+    print(f"{len(golden)} questions, {len(backend)} chunks, modèle {args.model}"
+          f" ({'ré-embeddé' if args.reembed else 'vecteurs tronqués'})")
+    print(tabulate(
+        [[r['dimensions'], f"{r['recall']:.3f}", f"{r['latency_ms_mean']:.3f}", f"{r['latency_ms_p95']:.3f}", r['bytes_per_vector']]
+         for r in results],
+        headers=["Dimensions", f"Recall@{args.k}", "Latence moy. (ms)", "Latence p95 (ms)", "Octets/vecteur"],
+        tablefmt="grid"
+    ))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Résultats sauvegardés dans : {args.output}")
+
+
+if __name__ == "__main__":
+    main()
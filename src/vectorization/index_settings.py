@@ -0,0 +1,68 @@
+"""
+Paramètres de l'index vectoriel partagés par l'upsert et la recherche.
+
+Le modèle et la dimension des embeddings doivent être identiques des deux
+côtés : ils sont lus une seule fois ici (variables d'environnement
+EMBEDDING_MODEL et EMBEDDING_DIMENSIONS), de même que l'organisation des
+namespaces Pinecone (PINECONE_NAMESPACE_LAYOUT).
+"""
+import os
+
+from src.vectorization.embedding_cache import supports_dimensions
+
+DEFAULT_EMBEDDING_MODEL = 'text-embedding-3-small'
+DEFAULT_EMBEDDING_DIMENSIONS = 1536
+
+# "partitioned" : un namespace par assureur et produit ; "shared" : namespace
+# unique filtré par métadonnées. "shared" reste la valeur par défaut tant que
+# migrate_namespaces n'a pas été lancé sur l'index : passer à "partitioned"
+# avant la migration viderait les résultats de recherche.
+NAMESPACE_LAYOUTS = ('partitioned', 'shared')
+DEFAULT_NAMESPACE_LAYOUT = 'shared'
+
+# Dimensions réduites évaluées par evaluate_dimensions (text-embedding-3-small : 1536 max)
+CANDIDATE_DIMENSIONS = (256, 512, 1024, 1536)
+
+
+class IndexSettings:
+    """Modèle et dimension des embeddings, et organisation des namespaces de l'index."""
+
+    def __init__(self, model: str = DEFAULT_EMBEDDING_MODEL, dimensions: int = DEFAULT_EMBEDDING_DIMENSIONS,
+                 namespace_layout: str = DEFAULT_NAMESPACE_LAYOUT):
+        if dimensions != DEFAULT_EMBEDDING_DIMENSIONS and not supports_dimensions(model):
+            raise ValueError(f"Le modèle {model} ne permet pas de choisir la dimension des embeddings")
+        if namespace_layout not in NAMESPACE_LAYOUTS:
+            raise ValueError(f"Organisation de namespaces inconnue : {namespace_layout} (attendu : {', '.join(NAMESPACE_LAYOUTS)})")
+        self.model = model
+        self.dimensions = dimensions
+        self.namespace_layout = namespace_layout
+
+    def namespace(self, insurer: str, product: str) -> str:
+        """Namespace Pinecone des vecteurs d'un assureur et d'un produit."""
+        if self.namespace_layout == 'shared':
+            return ''
+        return namespace_for(insurer, product)
+
+    def embedding_params(self) -> dict:
+        """Paramètres à passer à `embeddings.create` (hors `input`)."""
+        params = {'model': self.model}
+        if supports_dimensions(self.model):
+            params['dimensions'] = self.dimensions
+        return params
+
+    def __repr__(self) -> str:
+        return (f"IndexSettings(model={self.model!r}, dimensions={self.dimensions}, "
+                f"namespace_layout={self.namespace_layout!r})")
+
+
+def namespace_for(insurer: str, product: str) -> str:
+    return f"{insurer.lower()}-{product.lower()}"
+
+
+def get_index_settings(model: str = None, dimensions: int = None, namespace_layout: str = None) -> IndexSettings:
+    """Paramètres de l'index : arguments explicites, sinon variables d'environnement, sinon valeurs par défaut."""
+    return IndexSettings(
+        model=model or os.getenv('EMBEDDING_MODEL', DEFAULT_EMBEDDING_MODEL),
+        dimensions=int(dimensions or os.getenv('EMBEDDING_DIMENSIONS', DEFAULT_EMBEDDING_DIMENSIONS)),
+        namespace_layout=namespace_layout or os.getenv('PINECONE_NAMESPACE_LAYOUT', DEFAULT_NAMESPACE_LAYOUT)
+    )
@@ -0,0 +1,192 @@
+import os
+import json
+import glob
+import hashlib
+import datetime
+
+MANIFEST_DIR = 'data/processed/{insurer}/manifests'
+
+
+def _short_hash(value: str, length: int = 12) -> str:
+    return hashlib.sha256(value.encode('utf-8')).hexdigest()[:length]
+
+
+def document_hash(insurer: str, product: str, document: str) -> str:
+    """Hash stable d'un document source (assureur, produit, nom du PDF)."""
+    return _short_hash(f"{insurer.lower()}|{product}|{document}")
+
+
+def source_document(chunk: dict) -> str:
+    """Nom du PDF source d'un chunk (`pdf_name` chez AXA, `pdf` chez Generali)."""
+    return chunk.get('pdf_name') or chunk.get('pdf', '')
+
+
+def structural_key(chunk: dict) -> str:
+    """Clé structurelle d'un chunk : sa position logique dans le document (section / sous-section)."""
+    return f"{chunk.get('section', '')}|{chunk.get('subsection', '')}"
+
+
+def content_hash(content: str) -> str:
+    """Hash du contenu d'un chunk, utilisé pour détecter les modifications."""
+    return _short_hash(content, 16)
+
+
+def chunk_hash(chunk: dict) -> str:
+    """
+    Hash du contenu d'un chunk et de sa catégorie : une catégorie ajoutée ou
+    modifiée réécrit aussi les métadonnées du vecteur (sans ré-embedding).
+    """
+    category = chunk.get('category')
+    content = chunk.get('content', '')
+    return content_hash(f"{category}\n{content}" if category else content)
+
+
+def build_records(chunks: list, insurer: str, product: str) -> list:
+    """
+    Associe à chaque chunk un id déterministe et le hash de son contenu (et de sa catégorie).
+
+    L'id dépend du document source et de la clé structurelle du chunk, et non de
+    sa position dans le fichier : insérer un chunk ne décale plus les suivants.
+    Les clés structurelles en double sont départagées par leur ordre d'apparition.
+    """
+    records = []
+    occurrences = {}
+    for chunk in chunks:
+        doc_hash = document_hash(insurer, product, source_document(chunk))
+        key = structural_key(chunk)
+        occurrence = occurrences.get((doc_hash, key), 0)
+        occurrences[(doc_hash, key)] = occurrence + 1
+
+        vector_id = f"{insurer.lower()}-{product}-{doc_hash}-{_short_hash(key)}"
+        if occurrence:
+            vector_id = f"{vector_id}-{occurrence}"
+        records.append({
+            'id': vector_id,
+            'content_hash': chunk_hash(chunk),
+            'chunk': chunk
+        })
+    return records
+
+
+def manifest_path(insurer: str, product: str) -> str:
+    return os.path.join(MANIFEST_DIR.format(insurer=insurer.lower()), f'{product}.json')
+
+
+def manifest_target(settings, index_name: str = None, namespace: str = '') -> dict:
+    """
+    Cible d'un manifeste : index Pinecone (PINECONE_INDEX_NAME par défaut),
+    namespace, modèle et dimension des embeddings. Changer d'organisation de
+    namespaces change donc la cible et force un upsert complet.
+    """
+    return {
+        'index': index_name if index_name is not None else os.getenv('PINECONE_INDEX_NAME', ''),
+        'namespace': namespace,
+        'model': settings.model,
+        'dimensions': settings.dimensions
+    }
+
+
+def load_manifest(insurer: str, product: str, target: dict = None) -> dict:
+    """
+    Charge le manifeste local {id: hash du contenu} de ce qui est dans l'index.
+
+    Avec `target`, un manifeste écrit pour une autre cible (autre index, modèle
+    ou dimension, ou manifeste sans cible) est ignoré : tout est à réécrire.
+    """
+    path = manifest_path(insurer, product)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if target is not None and manifest.get('target') != target:
+        return {}
+    return manifest.get('vectors', {})
+
+
+def save_manifest(insurer: str, product: str, vectors: dict, chunk_file: str = None, target: dict = None) -> str:
+    """Sauvegarde le manifeste de manière atomique et retourne son chemin."""
+    path = manifest_path(insurer, product)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'insurer': insurer.lower(),
+            'product': product,
+            'chunk_file': chunk_file,
+            'target': target,
+            'updated_at': datetime.datetime.now().isoformat(timespec='seconds'),
+            'vectors': vectors
+        }, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+    return path
+
+
+def retarget_manifest(insurer: str, product: str, namespace: str, source_namespace: str = '') -> bool:
+    """
+    Reporte dans le manifeste le déplacement de ses vecteurs de
+    `source_namespace` vers `namespace` (migrate_namespaces), pour que l'upsert
+    suivant reste incrémental. False si le manifeste n'existe pas ou ne visait
+    pas `source_namespace`.
+    """
+    path = manifest_path(insurer, product)
+    if not os.path.exists(path):
+        return False
+    with open(path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    target = manifest.get('target')
+    if not target or target.get('namespace', '') != source_namespace:
+        return False
+    save_manifest(insurer, product, manifest.get('vectors', {}), chunk_file=manifest.get('chunk_file'),
+                  target=dict(target, namespace=namespace))
+    return True
+
+
+def manifest_paths() -> list:
+    """Chemins de tous les manifestes locaux, triés."""
+    return sorted(glob.glob(os.path.join(MANIFEST_DIR.format(insurer='*'), '*.json')))
+
+
+def iter_manifests() -> list:
+    """Retourne le contenu de tous les manifestes locaux (un par assureur et produit)."""
+    manifests = []
+    for path in manifest_paths():
+        with open(path, 'r', encoding='utf-8') as f:
+            manifests.append(json.load(f))
+    return manifests
+
+
+_fingerprints = {}
+
+
+def manifests_version() -> str:
+    """
+    Version du contenu de l'index dérivée des manifestes : elle ne change que si
+    des vecteurs ont été ajoutés, modifiés ou supprimés, ou si la cible (index,
+    modèle, dimension) a changé. Chaque manifeste n'est relu que si son fichier
+    a été réécrit. Seuls les manifestes du répertoire courant sont lus : un
+    upsert lancé depuis une autre copie du dépôt ne change pas cette version.
+    """
+    parts = []
+    for path in manifest_paths():
+        stat = os.stat(path)
+        cached = _fingerprints.get(path)
+        if cached is None or cached[0] != (stat.st_mtime_ns, stat.st_size):
+            with open(path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            content = {'target': manifest.get('target'), 'vectors': manifest.get('vectors', {})}
+            cached = ((stat.st_mtime_ns, stat.st_size), _short_hash(json.dumps(content, sort_keys=True)))
+            _fingerprints[path] = cached
+        parts.append(f"{path}:{cached[1]}")
+    return _short_hash('|'.join(parts))
+
+
+def diff_manifest(previous: dict, records: list) -> tuple:
+    """
+    Compare les records courants au manifeste précédent.
+    Retourne (records à upserter, ids à supprimer, nombre de records inchangés).
+    """
+    current_ids = {record['id'] for record in records}
+    to_upsert = [record for record in records if previous.get(record['id']) != record['content_hash']]
+    to_delete = [vector_id for vector_id in previous if vector_id not in current_ids]
+    unchanged = len(records) - len(to_upsert)
+    return to_upsert, to_delete, unchanged
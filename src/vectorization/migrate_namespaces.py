@@ -0,0 +1,147 @@
+"""
+Migration des vecteurs du namespace unique vers un namespace par assureur et produit.
+
+Les vecteurs du namespace par défaut sont lus page par page, regroupés selon
+leurs métadonnées (insurer, product), réécrits dans leur namespace
+(ex : "axa-car") puis supprimés de la source. Les manifestes locaux sont
+mis à jour avec leur nouveau namespace : l'upsert suivant reste incrémental.
+
+Usage :
+    python -m src.vectorization.migrate_namespaces [--dry-run] [--keep-source]
+    python -m src.vectorization.migrate_namespaces --benchmark
+"""
+import os
+import time
+import argparse
+import numpy as np
+from dotenv import load_dotenv
+from pinecone import Pinecone
+
+from src.vectorization.index_settings import IndexSettings, namespace_for
+from src.vectorization.manifest import retarget_manifest
+from src.vectorization.upsert_to_pinecone import list_vector_ids
+from src.vectorization.standins import InMemoryIndex
+
+load_dotenv()
+
+# Taille d'une page de `list` / `fetch`
+PAGE_SIZE = 100
+
+
+def migrate(index, source_namespace: str = '', dry_run: bool = False, keep_source: bool = False) -> dict:
+    """
+    Déplace tous les vecteurs de `source_namespace` vers leur namespace
+    assureur-produit et met à jour la cible des manifestes concernés.
+    Retourne le nombre de vecteurs déplacés par namespace cible.
+    """
+    moved = {}
+    partitions = set()
+    # Lister tous les ids avant de supprimer quoi que ce soit de la source
+    source_ids = list_vector_ids(index, namespace=source_namespace, limit=PAGE_SIZE)
+    for i in range(0, len(source_ids), PAGE_SIZE):
+        page = source_ids[i:i + PAGE_SIZE]
+        fetched = index.fetch(ids=page, namespace=source_namespace).vectors
+
+        by_namespace = {}
+        skipped = []
+        for vector_id, vector in fetched.items():
+            metadata = vector.metadata or {}
+            if not metadata.get('insurer') or not metadata.get('product'):
+                skipped.append(vector_id)
+                continue
+            target = namespace_for(metadata['insurer'], metadata['product'])
+            partitions.add((metadata['insurer'].lower(), metadata['product'].lower()))
+            by_namespace.setdefault(target, []).append((vector_id, vector.values, metadata))
+        if skipped:
+            print(f"{len(skipped)} vecteurs sans métadonnées insurer/product laissés en place : {skipped[:5]}...")
+
+        for target, vectors in by_namespace.items():
+            if not dry_run:
+                index.upsert(vectors=vectors, namespace=target)
+            moved[target] = moved.get(target, 0) + len(vectors)
+
+        if not dry_run and not keep_source:
+            migrated_ids = [vector_id for vectors in by_namespace.values() for vector_id, _, _ in vectors]
+            if migrated_ids:
+                index.delete(ids=migrated_ids, namespace=source_namespace)
+
+    if not dry_run:
+        for insurer, product in sorted(partitions):
+            if retarget_manifest(insurer, product, namespace_for(insurer, product), source_namespace):
+                print(f"Manifeste {insurer}/{product} : namespace '{namespace_for(insurer, product)}'")
+    return moved
+
+
+def _mean_query_ms(index, settings: IndexSettings, queries, targets, top_k: int = 4) -> float:
+    t0 = time.perf_counter()
+    for query, (insurer, product) in zip(queries, targets):
+        params = {'vector': query, 'top_k': top_k, 'include_metadata': True}
+        if settings.namespace_layout == 'shared':
+            params['filter'] = {'insurer': insurer, 'product': product}
+        else:
+            params['namespace'] = settings.namespace(insurer, product)
+        index.query(**params)
+    return (time.perf_counter() - t0) * 1000 / len(queries)
+
+
+def benchmark(insurers: int = 5, products: int = 2, vectors_per_partition: int = 2000, dimensions: int = 256,
+              queries: int = 50) -> dict:
+    """
+    Latence moyenne d'une requête avant (namespace unique + filtre) et après
+    migration (namespace dédié), sur un index local de substitution.
+    """
+    rng = np.random.default_rng(0)
+    index = InMemoryIndex()
+    partitions = [(f"Insurer{i}", f"product{p}") for i in range(insurers) for p in range(products)]
+    for insurer, product in partitions:
+        vectors = rng.standard_normal((vectors_per_partition, dimensions)).astype(np.float32)
+        index.upsert(vectors=[
+            (f"{insurer.lower()}-{product}-{i}", vector, {'insurer': insurer, 'product': product})
+            for i, vector in enumerate(vectors)
+        ])
+    query_vectors = rng.standard_normal((queries, dimensions)).astype(np.float32)
+    targets = [partitions[i % len(partitions)] for i in range(queries)]
+
+    before = _mean_query_ms(index, IndexSettings(namespace_layout='shared'), query_vectors, targets)
+    migrate(index)
+    after = _mean_query_ms(index, IndexSettings(namespace_layout='partitioned'), query_vectors, targets)
+    return {
+        'vectors': len(partitions) * vectors_per_partition,
+        'partitions': len(partitions),
+        'shared_filtered_ms': round(before, 3),
+        'partitioned_ms': round(after, 3)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move vectors from the shared namespace to one namespace per insurer/product.")
+    parser.add_argument('--source-namespace', type=str, default='', help='Namespace to migrate from (default namespace by default).')
+    parser.add_argument('--dry-run', action='store_true', help='Only count the vectors that would be moved.')
+    parser.add_argument('--keep-source', action='store_true', help='Copy the vectors without deleting them from the source namespace.')
+    parser.add_argument('--benchmark', action='store_true', help='Measure query latency before/after migration on a local stand-in index.')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        results = benchmark()
+        print(f"Index local : {results['vectors']} vecteurs, {results['partitions']} partitions assureur/produit")
+        print(f"Avant (namespace unique + filtre) : {results['shared_filtered_ms']} ms/requête")
+        print(f"Après (namespace dédié)            : {results['partitioned_ms']} ms/requête")
+        return
+
+    index_name = os.getenv("PINECONE_INDEX_NAME")
+    if not os.getenv("PINECONE_API_KEY") or not index_name:
+        print("Erreur : PINECONE_API_KEY et PINECONE_INDEX_NAME doivent être définies dans le fichier .env")
+        return
+    index = Pinecone(api_key=os.getenv("PINECONE_API_KEY")).Index(index_name)
+
+    print(f"Migration du namespace '{args.source_namespace}' de l'index '{index_name}'{' (dry run)' if args.dry_run else ''}...")
+    moved = migrate(index, args.source_namespace, dry_run=args.dry_run, keep_source=args.keep_source)
+    for namespace, count in sorted(moved.items()):
+        print(f"  {namespace:<30} {count} vecteurs")
+    print(f"Total : {sum(moved.values())} vecteurs")
+    if not args.dry_run:
+        print("Pensez à définir PINECONE_NAMESPACE_LAYOUT=partitioned pour l'upsert et la recherche.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Pipeline producteur/consommateur pour l'embedding et l'upsert par lots.
+
+Pendant que le lot k est upserté, les embeddings des lots k+1..k+n sont déjà
+en cours de calcul. Des files bornées limitent le nombre de lots en vol
+(backpressure) et chaque étape est chronométrée.
+"""
+import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class StageMetrics:
+    """Durées cumulées d'une étape du pipeline."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.items = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float, items: int = 0):
+        with self._lock:
+            self.calls += 1
+            self.items += items
+            self.seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+
+    def as_dict(self) -> dict:
+        return {
+            'calls': self.calls,
+            'items': self.items,
+            'seconds': round(self.seconds, 4),
+            'mean_seconds': round(self.seconds / self.calls, 4) if self.calls else 0.0,
+            'max_seconds': round(self.max_seconds, 4)
+        }
+
+
+class PipelineReport:
+    """Résultat d'une exécution : lots écrits, lots en échec et métriques par étape."""
+
+    def __init__(self):
+        self.succeeded = []
+        self.failed = []
+        self.wall_seconds = 0.0
+        self.stages = {
+            'embed': StageMetrics('embed'),
+            'upsert': StageMetrics('upsert'),
+            # Temps où l'upsert attend un lot d'embeddings (embedding trop lent)
+            'upsert_wait': StageMetrics('upsert_wait'),
+            # Temps où un embedding terminé attend une place dans la file (upsert trop lent)
+            'queue_full': StageMetrics('queue_full')
+        }
+
+    @property
+    def ok(self) -> bool:
+        return not self.failed
+
+    def as_dict(self) -> dict:
+        return {
+            'succeeded_batches': len(self.succeeded),
+            'failed_batches': len(self.failed),
+            'failures': [{'stage': stage, 'items': len(batch), 'error': str(error)} for batch, stage, error in self.failed],
+            'wall_seconds': round(self.wall_seconds, 4),
+            'stages': {name: metrics.as_dict() for name, metrics in self.stages.items()}
+        }
+
+
+_DONE = object()
+
+
+class EmbedUpsertPipeline:
+    """
+    Enchaîne `embed_fn(batch) -> vecteurs` et `upsert_fn(batch, vecteurs)`.
+
+    `max_in_flight` borne le nombre de lots dont l'embedding est lancé mais pas
+    encore upserté ; `embed_workers` fixe le nombre de requêtes d'embedding
+    simultanées. Un lot en échec est reporté dans `PipelineReport.failed`,
+    jamais ignoré silencieusement.
+    """
+
+    def __init__(self, embed_fn, upsert_fn, embed_workers: int = 4, max_in_flight: int = 8):
+        self.embed_fn = embed_fn
+        self.upsert_fn = upsert_fn
+        self.embed_workers = embed_workers
+        self.max_in_flight = max(max_in_flight, embed_workers)
+
+    def run(self, batches, on_batch_done=None) -> PipelineReport:
+        report = PipelineReport()
+        results = queue.Queue(maxsize=self.max_in_flight)
+        slots = threading.BoundedSemaphore(self.max_in_flight)
+        start = time.perf_counter()
+
+        def embed_stage(batch):
+            try:
+                t0 = time.perf_counter()
+                vectors = self.embed_fn(batch)
+                report.stages['embed'].record(time.perf_counter() - t0, len(batch))
+                item = (batch, vectors, None)
+            except Exception as e:
+                item = (batch, None, e)
+            t0 = time.perf_counter()
+            results.put(item)
+            report.stages['queue_full'].record(time.perf_counter() - t0)
+
+        producer_errors = []
+
+        def produce():
+            try:
+                with ThreadPoolExecutor(max_workers=self.embed_workers) as executor:
+                    for batch in batches:
+                        slots.acquire()
+                        executor.submit(embed_stage, batch)
+            except Exception as e:
+                producer_errors.append(e)
+            finally:
+                results.put(_DONE)
+
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+
+        # Consommateur : upsert des lots dans l'ordre où leurs embeddings arrivent.
+        # La sortie du `with` du producteur attend la fin de tous les embeddings,
+        # donc _DONE arrive toujours après le dernier lot.
+        while True:
+            t0 = time.perf_counter()
+            item = results.get()
+            report.stages['upsert_wait'].record(time.perf_counter() - t0)
+            if item is _DONE:
+                break
+            batch, vectors, error = item
+            try:
+                if error is not None:
+                    report.failed.append((batch, 'embed', error))
+                    continue
+                try:
+                    t0 = time.perf_counter()
+                    self.upsert_fn(batch, vectors)
+                    report.stages['upsert'].record(time.perf_counter() - t0, len(batch))
+                    report.succeeded.append(batch)
+                except Exception as e:
+                    report.failed.append((batch, 'upsert', e))
+            finally:
+                slots.release()
+                if on_batch_done is not None:
+                    on_batch_done(batch)
+
+        producer.join()
+        if producer_errors:
+            raise producer_errors[0]
+        report.wall_seconds = time.perf_counter() - start
+        return report
@@ -0,0 +1,188 @@
+"""
+Substituts locaux du serveur d'embeddings OpenAI et d'un index Pinecone.
+
+Ils reproduisent le sous-ensemble d'API utilisé par le pipeline d'upsert et par
+RAGChain, avec une latence configurable, pour valider et mesurer les
+traitements sans accès réseau.
+"""
+import time
+import hashlib
+import threading
+from types import SimpleNamespace
+import numpy as np
+
+
+class LocalEmbeddingServer:
+    """
+    Imite `openai_client.embeddings` : vecteurs déterministes dérivés du texte.
+    `max_tokens_per_request` permet de simuler la limite de tokens de l'API.
+    """
+
+    def __init__(self, dimensions: int = 1536, latency: float = 0.0, max_tokens_per_request: int = None):
+        self.dimensions = dimensions
+        self.latency = latency
+        self.max_tokens_per_request = max_tokens_per_request
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self.embeddings = self
+
+    def vector(self, text: str, dimensions: int = None) -> list:
+        seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'little')
+        vector = np.random.default_rng(seed).standard_normal(dimensions or self.dimensions)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def create(self, input, model: str = None, dimensions: int = None):
+        texts = [input] if isinstance(input, str) else list(input)
+        with self._lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            tokens = sum(len(text) // 4 + 1 for text in texts)
+            if self.max_tokens_per_request and tokens > self.max_tokens_per_request:
+                raise ValueError(
+                    f"This model's maximum context length is {self.max_tokens_per_request} tokens, "
+                    f"however you requested {tokens} tokens"
+                )
+            data = [SimpleNamespace(index=i, embedding=self.vector(text, dimensions)) for i, text in enumerate(texts)]
+            return SimpleNamespace(data=data, usage=SimpleNamespace(prompt_tokens=tokens, total_tokens=tokens))
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+def _matches_filter(metadata: dict, filter_dict: dict) -> bool:
+    for field, condition in (filter_dict or {}).items():
+        value = metadata.get(field)
+        if isinstance(condition, dict):
+            if '$in' in condition and value not in condition['$in']:
+                return False
+            if '$eq' in condition and value != condition['$eq']:
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+class ListPage:
+    """
+    Page de `InMemoryIndex.list`, à la forme du `ListResponse` du SDK :
+    `vectors` contient des objets `ListItem` (attribut `id`) et l'itération
+    parcourt ces objets, pas des chaînes.
+    """
+
+    def __init__(self, ids, namespace: str = ''):
+        self.vectors = [SimpleNamespace(id=vector_id) for vector_id in ids]
+        self.namespace = namespace
+        self.pagination = None
+
+    def __iter__(self):
+        return iter(self.vectors)
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+
+class InMemoryIndex:
+    """Imite un `pinecone.Index` (upsert, delete, fetch, list, query, stats) en mémoire."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.namespaces = {}
+        self.upsert_calls = 0
+        self.delete_calls = 0
+        self.query_calls = 0
+        self._lock = threading.Lock()
+
+    def _wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def upsert(self, vectors, namespace: str = ''):
+        self._wait()
+        with self._lock:
+            self.upsert_calls += 1
+            store = self.namespaces.setdefault(namespace, {})
+            for vector in vectors:
+                if isinstance(vector, dict):
+                    vector_id, values, metadata = vector['id'], vector['values'], vector.get('metadata', {})
+                else:
+                    vector_id, values, metadata = vector
+                store[vector_id] = (np.asarray(values, dtype=np.float32), dict(metadata or {}))
+        return {'upserted_count': len(vectors)}
+
+    def delete(self, ids=None, namespace: str = '', delete_all: bool = False):
+        self._wait()
+        with self._lock:
+            self.delete_calls += 1
+            store = self.namespaces.setdefault(namespace, {})
+            if delete_all:
+                store.clear()
+            for vector_id in ids or []:
+                store.pop(vector_id, None)
+        return {}
+
+    def fetch(self, ids, namespace: str = ''):
+        self._wait()
+        store = self.namespaces.get(namespace, {})
+        vectors = {
+            vector_id: SimpleNamespace(id=vector_id, values=store[vector_id][0].tolist(), metadata=store[vector_id][1])
+            for vector_id in ids if vector_id in store
+        }
+        return SimpleNamespace(vectors=vectors, namespace=namespace)
+
+    def list(self, *, prefix: str = None, limit: int = None, namespace: str = ''):
+        prefix, limit = prefix or '', limit or 100
+        ids = sorted(vector_id for vector_id in self.namespaces.get(namespace, {}) if vector_id.startswith(prefix))
+        for i in range(0, len(ids), limit):
+            yield ListPage(ids[i:i + limit], namespace)
+
+    def query(self, vector, top_k: int = 10, filter: dict = None, include_metadata: bool = False,
+              include_values: bool = False, namespace: str = ''):
+        self._wait()
+        with self._lock:
+            self.query_calls += 1
+        store = self.namespaces.get(namespace, {})
+        candidates = [
+            (vector_id, values, metadata)
+            for vector_id, (values, metadata) in store.items()
+            if _matches_filter(metadata, filter)
+        ]
+        if not candidates:
+            return SimpleNamespace(matches=[], namespace=namespace)
+        query = np.asarray(vector, dtype=np.float32)
+        matrix = np.stack([values for _, values, _ in candidates])
+        scores = matrix @ query / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(query) + 1e-12)
+        order = np.argsort(-scores)[:top_k]
+        matches = [
+            SimpleNamespace(
+                id=candidates[i][0],
+                score=float(scores[i]),
+                values=candidates[i][1].tolist() if include_values else [],
+                metadata=candidates[i][2] if include_metadata else None
+            )
+            for i in order
+        ]
+        return SimpleNamespace(matches=matches, namespace=namespace)
+
+    def query_namespaces(self, vector, namespaces, metric: str = 'cosine', top_k: int = 10, filter: dict = None,
+                         include_metadata: bool = False, include_values: bool = False):
+        """Une requête par namespace puis fusion en un seul classement, comme le SDK Pinecone."""
+        matches = [
+            match
+            for namespace in dict.fromkeys(namespaces)
+            for match in self.query(vector, top_k=top_k, filter=filter, include_metadata=include_metadata,
+                                    include_values=include_values, namespace=namespace).matches
+        ]
+        matches.sort(key=lambda match: match.score, reverse=True)
+        return SimpleNamespace(matches=matches[:top_k])
+
+    def describe_index_stats(self):
+        return {
+            'namespaces': {name: {'vector_count': len(store)} for name, store in self.namespaces.items()},
+            'total_vector_count': sum(len(store) for store in self.namespaces.values())
+        }
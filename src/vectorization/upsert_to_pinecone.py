@@ -6,30 +6,94 @@ from openai import OpenAI
 from pinecone import Pinecone, ServerlessSpec
 from tqdm import tqdm
 import argparse
+from src.vectorization.embedding_cache import EmbeddingCache, SUPPORTED_DTYPES, supports_dimensions
+from src.vectorization.batching import (
+    TokenBatcher,
+    EmbeddingStats,
+    embed_with_split,
+    estimate_tokens,
+    DEFAULT_MAX_TOKENS_PER_REQUEST,
+    DEFAULT_MAX_ITEMS_PER_REQUEST,
+)
+from src.vectorization.index_settings import IndexSettings, get_index_settings
+from src.vectorization.pipeline import EmbedUpsertPipeline
+from src.vectorization.doc_store import DocStore
+from src.vectorization.manifest import build_records, load_manifest, save_manifest, diff_manifest, manifest_target, source_document
 
 # Charger les variables d'environnement dès le début du script
 load_dotenv()
 
+# Pinecone accepte au plus 1000 ids par requête de suppression
+DELETE_BATCH_SIZE = 1000
+
 def get_latest_categorized_file(insurer: str) -> str:
-    """Trouve le fichier de chunks le plus récent pour un assureur donné."""
-    search_path = f'data/processed/{insurer}/chunks/*.json'
-    list_of_files = glob.glob(search_path)
-    if not list_of_files:
-        raise FileNotFoundError(f"Aucun fichier de chunks trouvé pour {insurer} dans {search_path}")
-    latest_file = max(list_of_files, key=os.path.getctime)
-    return latest_file
+    """
+    Trouve le fichier de chunks le plus récent pour un assureur donné : les
+    chunks catégorisés (categorize_chunks) en priorité, pour que la catégorie
+    arrive dans les métadonnées des vecteurs, sinon les chunks bruts.
+    """
+    for search_path in (f'data/processed/{insurer}/categorized_chunks/*.json', f'data/processed/{insurer}/chunks/*.json'):
+        list_of_files = glob.glob(search_path)
+        if list_of_files:
+            return max(list_of_files, key=os.path.getctime)
+    raise FileNotFoundError(f"Aucun fichier de chunks trouvé pour {insurer} dans data/processed/{insurer}/(categorized_)chunks")
 
 def load_chunks(file_path: str) -> list:
     """Charge les chunks depuis un fichier JSON."""
     with open(file_path, 'r', encoding='utf-8') as f:
         return json.load(f)
 
+def infer_product(chunk_file: str, product: str = None) -> str:
+    """Produit explicite, sinon déduit du chemin du fichier de chunks."""
+    if product:
+        return product
+    return 'travel' if 'travel' in chunk_file.lower() else 'car'
+
 def initialize_pinecone(api_key: str):
     """Initialise et retourne le client Pinecone."""
     return Pinecone(api_key=api_key)
 
-def process_insurer_upsert(insurer: str, pc, openai_client, index, embedding_model_name, product: str = None):
-    """Traite l'upsert pour un assureur spécifique."""
+def list_vector_ids(index, namespace: str = '', prefix: str = None, limit: int = None) -> list:
+    """
+    Ids (str) de tous les vecteurs d'un namespace, page par page. Le SDK
+    Pinecone renvoie des pages d'objets `ListItem` (attribut `id`), pas des
+    chaînes.
+    """
+    params = {'namespace': namespace}
+    if prefix:
+        params['prefix'] = prefix
+    if limit:
+        params['limit'] = limit
+    return [str(getattr(item, 'id', item)) for page in index.list(**params) for item in page]
+
+def purge_legacy_vectors(index, insurer: str, product: str, namespace: str = ''):
+    """
+    Supprime les anciens vecteurs à ids positionnels (ex : axa-car-42) du
+    namespace par défaut et du namespace cible (copiés par migrate_namespaces).
+    """
+    prefix = f"{insurer}-{product}-"
+    purged = 0
+    for target in dict.fromkeys(('', namespace)):
+        legacy_ids = [
+            vector_id
+            for vector_id in list_vector_ids(index, namespace=target, prefix=prefix)
+            if vector_id[len(prefix):].isdigit()
+        ]
+        for i in range(0, len(legacy_ids), DELETE_BATCH_SIZE):
+            index.delete(ids=legacy_ids[i:i + DELETE_BATCH_SIZE], namespace=target)
+        purged += len(legacy_ids)
+    print(f"{purged} vecteurs à ids positionnels supprimés")
+
+def process_insurer_upsert(insurer: str, pc, openai_client, index, embedding_model_name, product: str = None, cache: EmbeddingCache = None, full_refresh: bool = False, purge_legacy_ids: bool = False, embed_workers: int = 4, max_in_flight: int = 8, max_batch_tokens: int = DEFAULT_MAX_TOKENS_PER_REQUEST, max_batch_items: int = DEFAULT_MAX_ITEMS_PER_REQUEST, doc_store: DocStore = None, embedding_dimensions: int = None, settings: IndexSettings = None, index_name: str = None):
+    """
+    Traite l'upsert pour un assureur spécifique.
+    Si un cache est fourni, seuls les chunks absents du cache sont envoyés à l'API d'embeddings.
+    Seuls les chunks nouveaux ou modifiés depuis le dernier manifeste sont upsertés,
+    et les vecteurs des chunks disparus sont supprimés de l'index. Un manifeste
+    écrit pour un autre index (`index_name`, PINECONE_INDEX_NAME par défaut),
+    modèle ou dimension est ignoré : tous les chunks sont alors upsertés.
+    Les vecteurs ne portent que des métadonnées compactes ; le texte est écrit dans le DocStore.
+    """
     try:
         print(f"\n--- Traitement de {insurer.capitalize()} ---")
         chunk_file = get_latest_categorized_file(insurer)
@@ -37,54 +101,147 @@ def process_insurer_upsert(insurer: str, pc, openai_client, index, embedding_mod
         print(f"{len(chunks)} chunks chargés depuis {chunk_file}")
 
         # Déduire le produit si non fourni
-        inferred_product = product
-        if not inferred_product:
-            if 'travel' in chunk_file.lower():
-                inferred_product = 'travel'
-            else:
-                inferred_product = 'car'
+        inferred_product = infer_product(chunk_file, product)
         print(f"Produit utilisé pour l'upsert : {inferred_product}")
+
+        # Un namespace par assureur et produit (sauf organisation "shared")
+        settings = settings or get_index_settings()
+        namespace = settings.namespace(insurer, inferred_product)
+        print(f"Namespace Pinecone : '{namespace}'")
         
-        # Préparer et envoyer les données par lots (batch)
-        batch_size = 100
-        print(f"Début de l'upsert par lots de {batch_size}...")
-        
-        for i in tqdm(range(0, len(chunks), batch_size), desc=f"Upsert {insurer.capitalize()} vers Pinecone"):
-            batch = chunks[i:i + batch_size]
-            
-            ids = [f"{insurer}-{inferred_product}-{i+j}" for j, _ in enumerate(batch)]
-            
+        # Calculer le diff entre les chunks courants et ce que l'index contient déjà
+        records = build_records(chunks, insurer, inferred_product)
+        target = manifest_target(settings, index_name, namespace)
+        previous = load_manifest(insurer, inferred_product, target=target)
+        to_upsert, to_delete, unchanged = diff_manifest(previous, records)
+        if full_refresh:
+            to_upsert, unchanged = records, 0
+        print(f"Diff : {len(to_upsert)} à upserter, {len(to_delete)} à supprimer, {unchanged} inchangés")
+
+        # Le manifeste ne retient que ce qui a effectivement été écrit dans l'index
+        manifest = dict(previous)
+
+        # Le texte complet des chunks vit dans le stockage local, pas dans les
+        # métadonnées. Il n'y est écrit qu'une fois le vecteur dans l'index : un
+        # lancement en échec ne laisse pas le DocStore en avance sur l'index.
+        doc_store = doc_store or DocStore()
+
+        def doc_rows(records_to_store):
+            return [
+                {
+                    "id": record['id'],
+                    "insurer": insurer.lower(),
+                    "product": inferred_product,
+                    "section": record['chunk'].get("section", ""),
+                    "subsection": record['chunk'].get("subsection", ""),
+                    "category": record['chunk'].get("category", ""),
+                    "content": record['chunk'].get("content", ""),
+                    "content_hash": record['content_hash']
+                } for record in records_to_store
+            ]
+
+        pending_ids = {record['id'] for record in to_upsert}
+        doc_store.upsert_many(doc_rows([record for record in records if record['id'] not in pending_ids]))
+
+        stats = EmbeddingStats()
+
+        def request_embeddings(texts):
+            params = {'input': texts, 'model': embedding_model_name}
+            dimensions = embedding_dimensions or (cache.dimensions if cache is not None else None)
+            if dimensions and supports_dimensions(embedding_model_name):
+                params['dimensions'] = dimensions
+            res = openai_client.embeddings.create(**params)
+            usage = getattr(res, 'usage', None)
+            tokens = usage.prompt_tokens if usage else sum(estimate_tokens(text) for text in texts)
+            return [record.embedding for record in res.data], tokens
+
+        def embed_batch(batch):
+            # Créer les embeddings avec le client OpenAI ; avec le cache, seuls les
+            # chunks absents sont envoyés. Les chunks impossibles à embedder valent None.
+            contents = [record['chunk']['content'] for record in batch]
+            if cache is None:
+                return embed_with_split(contents, request_embeddings, stats,
+                                        ids=[record['id'] for record in batch],
+                                        documents=[source_document(record['chunk']) for record in batch])
+
+            keys = [cache.key(content) for content in contents]
+            missing = {}
+            for key, record in zip(keys, batch):
+                if key not in cache and key not in missing:
+                    missing[key] = record
+            if missing:
+                vectors = embed_with_split([record['chunk']['content'] for record in missing.values()], request_embeddings, stats,
+                                           ids=[record['id'] for record in missing.values()],
+                                           documents=[source_document(record['chunk']) for record in missing.values()])
+                embedded = [(key, vector) for key, vector in zip(missing, vectors) if vector is not None]
+                if embedded:
+                    cache.put_many([key for key, _ in embedded], [vector for _, vector in embedded])
+            return [cache.get(key).tolist() if key in cache else None for key in keys]
+
+        def upsert_batch(batch, embeddings):
             metadata = [
                 {
                     "insurer": insurer.capitalize(),
-                    "section": chunk.get("section", ""),
-                    "content": chunk.get("content", ""),
+                    "section": record['chunk'].get("section", ""),
+                    "subsection": record['chunk'].get("subsection", ""),
+                    "category": record['chunk'].get("category", ""),
+                    "content_hash": record['content_hash'],
                     "product": inferred_product
-                } for chunk in batch
+                } for record in batch
             ]
+            to_write = [
+                (record, (record['id'], embedding, meta))
+                for record, embedding, meta in zip(batch, embeddings, metadata)
+                if embedding is not None
+            ]
+            if not to_write:
+                return
+            index.upsert(vectors=[vector for _, vector in to_write], namespace=namespace)
+            doc_store.upsert_many(doc_rows([record for record, _ in to_write]))
+            for record, _ in to_write:
+                manifest[record['id']] = record['content_hash']
 
-            # Créer les embeddings avec le client OpenAI
-            contents = [chunk['content'] for chunk in batch]
-            try:
-                res = openai_client.embeddings.create(input=contents, model=embedding_model_name)
-                embeddings = [record.embedding for record in res.data]
-            except Exception as e:
-                print(f"Erreur lors de la création des embeddings pour le lot {i//batch_size + 1}: {e}")
-                continue
-            
-            to_upsert = list(zip(ids, embeddings, metadata))
-            
-            # Debug : affiche un exemple de vecteur à upserter
-            if to_upsert:
-                print("Exemple de vecteur à upserter :", to_upsert[0])
-            
+        # Préparer et envoyer les données par lots (batch) remplis selon un budget
+        # de tokens : les embeddings des lots suivants sont calculés pendant
+        # l'upsert du lot courant
+        batcher = TokenBatcher(max_tokens=max_batch_tokens, max_items=max_batch_items)
+        batches = batcher.batches(to_upsert, text=lambda record: record['chunk']['content'])
+        if batches:
+            print(f"Début de l'upsert de {len(to_upsert)} chunks en {len(batches)} lots (≤ {max_batch_tokens} tokens)...")
+        pipeline = EmbedUpsertPipeline(embed_batch, upsert_batch, embed_workers=embed_workers, max_in_flight=max_in_flight)
+        with tqdm(total=len(to_upsert), desc=f"Upsert {insurer.capitalize()} vers Pinecone") as pbar:
+            report = pipeline.run(batches, on_batch_done=lambda batch: pbar.update(len(batch)))
+
+        for batch, stage, error in report.failed:
+            print(f"Erreur ({stage}) sur un lot de {len(batch)} chunks : {error}")
+        for failure in stats.failures:
+            print(f"Chunk {failure['id']} non embeddé : {failure['error']}")
+        print("Métriques du pipeline :", json.dumps(report.as_dict()['stages']))
+        print("Métriques des embeddings :", json.dumps(stats.as_dict(), ensure_ascii=False))
+
+        # Supprimer les vecteurs des chunks qui n'existent plus
+        for i in range(0, len(to_delete), DELETE_BATCH_SIZE):
+            batch_ids = to_delete[i:i + DELETE_BATCH_SIZE]
             try:
-                upsert_response = index.upsert(vectors=to_upsert)
-                print("Réponse Pinecone upsert:", upsert_response)
+                index.delete(ids=batch_ids, namespace=namespace)
             except Exception as e:
-                print(f"Erreur lors de l'upsert du lot {i//batch_size + 1}: {e}")
+                print(f"Erreur lors de la suppression du lot {i//DELETE_BATCH_SIZE + 1}: {e}")
                 continue
+            for vector_id in batch_ids:
+                manifest.pop(vector_id, None)
+            doc_store.delete_many(batch_ids)
+        if to_delete:
+            print(f"{len(to_delete)} vecteurs obsolètes supprimés")
 
+        if purge_legacy_ids:
+            purge_legacy_vectors(index, insurer, inferred_product, namespace)
+
+        manifest_file = save_manifest(insurer, inferred_product, manifest, chunk_file=chunk_file, target=target)
+        print(f"Manifeste mis à jour : {manifest_file}")
+
+        if not report.ok or stats.failures:
+            print(f"⚠️ {insurer.capitalize()} traité avec {len(report.failed)} lot(s) et {len(stats.failures)} chunk(s) en échec (ils seront repris au prochain lancement)")
+            return False
         print(f"✅ {insurer.capitalize()} traité avec succès")
         return True
 
@@ -102,6 +259,15 @@ def main():
     parser = argparse.ArgumentParser(description="Upsert insurance chunks to Pinecone.")
     parser.add_argument('--insurer', type=str, default='axa', help='Insurer to process (axa, generali, etc.)')
     parser.add_argument('--product', type=str, default=None, help='Insurance product (car, travel, etc.). If not provided, will be inferred from chunk file path.')
+    parser.add_argument('--dimensions', type=int, default=None, help='Embedding dimensions (defaults to EMBEDDING_DIMENSIONS, then 1536).')
+    parser.add_argument('--no-cache', action='store_true', help='Disable the on-disk embedding cache and always call the embeddings API.')
+    parser.add_argument('--full', action='store_true', help='Ignore the local manifest and re-upsert every chunk.')
+    parser.add_argument('--purge-legacy-ids', action='store_true', help='Delete vectors that still use the old positional ids (insurer-product-N).')
+    parser.add_argument('--embed-workers', type=int, default=4, help='Number of concurrent embedding requests.')
+    parser.add_argument('--max-in-flight', type=int, default=8, help='Maximum number of batches embedded but not yet upserted.')
+    parser.add_argument('--max-batch-tokens', type=int, default=DEFAULT_MAX_TOKENS_PER_REQUEST, help='Token ceiling for a single embeddings request.')
+    parser.add_argument('--max-batch-items', type=int, default=DEFAULT_MAX_ITEMS_PER_REQUEST, help='Maximum number of chunks in a single embeddings request.')
+    parser.add_argument('--cache-dtype', type=str, default='float32', choices=SUPPORTED_DTYPES, help='Storage dtype of the embedding cache matrix.')
     args = parser.parse_args()
 
     print("--- Début du script d'upsert vers Pinecone (avec OpenAI Embeddings) ---")
@@ -131,8 +297,10 @@ def main():
         return
 
     # 3. Vérifier et préparer l'index Pinecone
-    embedding_model_name = "text-embedding-3-small"
-    dimension = 1536  # Dimension pour le modèle text-embedding-3-small
+    # Modèle et dimension partagés avec la recherche (EMBEDDING_MODEL / EMBEDDING_DIMENSIONS)
+    settings = get_index_settings(dimensions=args.dimensions)
+    embedding_model_name = settings.model
+    dimension = settings.dimensions
     print(f"Utilisation du modèle d'embedding '{embedding_model_name}' (dimension : {dimension})")
 
     if PINECONE_INDEX_NAME not in pc.list_indexes().names():
@@ -150,13 +318,23 @@ def main():
             return
     else:
         print(f"L'index '{PINECONE_INDEX_NAME}' existe déjà. Connexion...")
+        index_dimension = pc.describe_index(PINECONE_INDEX_NAME).dimension
+        if index_dimension != dimension:
+            print(f"Erreur : l'index '{PINECONE_INDEX_NAME}' a une dimension de {index_dimension}, "
+                  f"mais EMBEDDING_DIMENSIONS vaut {dimension}. Utilisez un autre index ou la même dimension.")
+            return
 
     index = pc.Index(PINECONE_INDEX_NAME)
+
+    cache = None
+    if not args.no_cache:
+        cache = EmbeddingCache(embedding_model_name, dimension, dtype=args.cache_dtype)
+        print(f"Cache d'embeddings : {cache.directory} ({len(cache)} vecteurs)")
     
     # 4. Traiter l'assureur choisi
     insurer_to_process = args.insurer
     product_to_use = args.product
-    success = process_insurer_upsert(insurer_to_process, pc, openai_client, index, embedding_model_name, product=product_to_use)
+    success = process_insurer_upsert(insurer_to_process, pc, openai_client, index, embedding_model_name, product=product_to_use, embedding_dimensions=dimension, settings=settings, cache=cache, full_refresh=args.full, index_name=PINECONE_INDEX_NAME, purge_legacy_ids=args.purge_legacy_ids, embed_workers=args.embed_workers, max_in_flight=args.max_in_flight, max_batch_tokens=args.max_batch_tokens, max_batch_items=args.max_batch_items)
     
     if success:
         print("\n--- Script terminé avec succès ---")
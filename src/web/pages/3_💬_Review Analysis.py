@@ -4,11 +4,18 @@ import os
 import json
 import subprocess
 import pandas as pd
-import openai
+import sys
+from pathlib import Path
 from dotenv import load_dotenv
 import re
 import altair as alt
 
+# Add root directory to path for module imports
+root_path = Path(__file__).parent.parent.parent.parent
+sys.path.append(str(root_path))
+
+from agent.clients import get_openai_client
+
 load_dotenv()
 
 PRODUCTS = ["car", "travel"]
@@ -20,7 +27,7 @@ def extract_score_with_llm(raw_text):
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         return "No API key found."
-    client = openai.OpenAI(api_key=api_key)
+    client = get_openai_client()
     prompt = (
         "Extract the global review score (out of 5) from the following text. "
         "The text may be in French. Return only the number (with a dot or comma) or 'N/A'.\n\n"
@@ -1,7 +1,14 @@
 import streamlit as st
 import pandas as pd
 import os
-from openai import OpenAI
+import sys
+from pathlib import Path
+
+# Add root directory to path for module imports
+root_path = Path(__file__).parent.parent.parent.parent
+sys.path.append(str(root_path))
+
+from agent.clients import get_openai_client
 
 st.set_page_config(page_title="High Level Comparison", page_icon="🏆", initial_sidebar_state="expanded")
 st.title("🏆 High Level Comparison: Generali Strengths & Weaknesses")
@@ -26,7 +33,7 @@ else:
 if os.path.exists(data_path):
     if st.button("Compare"):
         df = pd.read_excel(data_path)
-        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        client = get_openai_client()
 
         if product == "car":
             tc_prompt = (
@@ -8,22 +8,135 @@ from pathlib import Path
 root_path = Path(__file__).parent.parent.parent.parent
 sys.path.append(str(root_path))
 
-from agent.graph import compile_agent
+from agent.graph import astream_agent
+from agent.clients import iterate_async
 from agent.state import CompareState
+from agent.insurers import INSURERS, DEFAULT_INSURERS, insurer_label
+from agent.tracing import Trace, trace_request, export_trace
+from src.vectorization.align_clauses import DEFAULT_ALIGNMENT_DIR, load_alignment_index
+
+INSURER_COLORS = {
+    "axa": "#0066cc",
+    "generali": "#00cc66",
+    "allianz": "#003781",
+    "zurich": "#2167ae",
+    "baloise": "#d9304c",
+}
 
 st.set_page_config(initial_sidebar_state="expanded")
 
+def display_agent_results(results: dict, insurers: list):
+    """
+    Display the retrieved chunks of every insurer side by side.
+    """
+    st.header("📊 Agent Results")
+    columns = st.columns(len(insurers))
+    for column, insurer in zip(columns, insurers):
+        with column:
+            display_chunk_results(
+                f"{insurer_label(insurer)} Agent",
+                results['insurer_results'].get(insurer, f"No results found for {insurer_label(insurer)}"),
+                INSURER_COLORS.get(insurer, "#888888")
+            )
+
 def run_agent_comparison(initial_state: CompareState):
     """
-    Run the comparison agent and return results.
+    Run the comparison agent, rendering retrieval results as soon as they are
+    available and the comparison token by token. Returns the final state and
+    the trace of the request. The cached compiled graph runs asynchronously on
+    the shared event loop.
     """
+    results_area = st.container()
+    st.markdown("---")
+    st.subheader("📋 Comparison Table")
+    comparison_placeholder = st.empty()
+    comparison_placeholder.info("🔄 Running comparison agent...")
+    final_state, streamed, results_shown = None, "", False
+    with trace_request(query=initial_state['user_input'], product=initial_state['product'],
+                       insurers=initial_state['insurers']) as trace:
+        try:
+            for kind, payload in iterate_async(astream_agent(initial_state)):
+                if kind == "token":
+                    streamed += payload
+                    comparison_placeholder.markdown(streamed + "▌")
+                    continue
+                final_state = payload
+                if not results_shown and payload.get('insurer_results'):
+                    with results_area:
+                        display_agent_results(payload, initial_state['insurers'])
+                    results_shown = True
+        except Exception as e:
+            st.error(f"Error running the agent: {str(e)}")
+            return None, trace
     try:
-        agent = compile_agent()
-        final_state = agent.invoke(initial_state)
-        return final_state
-    except Exception as e:
-        st.error(f"Error running the agent: {str(e)}")
-        return None
+        export_trace(trace)
+    except OSError as e:
+        print(f"Error while exporting the trace: {e}")
+    if final_state and final_state.get('comparison'):
+        comparison_placeholder.markdown(final_state['comparison'])
+    else:
+        comparison_placeholder.warning("No comparison generated.")
+    return final_state, trace
+
+def display_trace(trace: Trace):
+    """
+    Show the per-node and per-call timings of a request, with a JSON lines export.
+    """
+    totals = trace.totals()
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Total time", f"{trace.duration_ms / 1000:.2f} s")
+    col2.metric("Tokens in / out", f"{totals['tokens_in']} / {totals['tokens_out']}")
+    col3.metric("Cache hits", totals['cache_hits'])
+    col4.metric("Errors", totals['errors'])
+    st.dataframe(
+        [
+            {
+                "Span": record['name'],
+                "Kind": record['kind'],
+                "Start (ms)": record['start_ms'],
+                "Duration (ms)": record['duration_ms'],
+                "Tokens in": record.get('tokens_in'),
+                "Tokens out": record.get('tokens_out'),
+                "Cache hit": record.get('cache_hit'),
+                "Error": record.get('error', "")
+            }
+            for record in trace.as_dict()['spans']
+        ],
+        use_container_width=True
+    )
+    st.download_button(
+        "⬇️ Download trace (JSON lines)",
+        data=trace.to_json() + "\n",
+        file_name=f"agent_trace_{trace.request_id}.jsonl",
+        mime="application/jsonl"
+    )
+
+def display_aligned_clauses(results: dict, product: str, insurers: list):
+    """
+    Show, for each retrieved chunk, the clauses of the other selected insurers
+    aligned with it in the precomputed alignment index.
+    """
+    alignments = load_alignment_index(product, os.getenv("ALIGNMENT_DIR", DEFAULT_ALIGNMENT_DIR))
+    if alignments is None:
+        st.info(f"No alignment index for {product}: run `python -m src.vectorization.align_clauses --product {product}`.")
+        return
+    rows = []
+    for insurer in insurers:
+        for chunk_id in results.get('insurer_evidence', {}).get(insurer, []):
+            clause = alignments.clause(insurer, chunk_id)
+            for match in alignments.aligned(insurer, chunk_id):
+                if match['insurer'] not in insurers:
+                    continue
+                rows.append({
+                    "Clause": f"{insurer_label(insurer)} {clause.get('subsection') or clause.get('section', '')}",
+                    "Aligned clause": f"{insurer_label(match['insurer'])} {match['subsection'] or match['section']}",
+                    "Similarity": round(match['score'], 3),
+                    "Mutual best": match['mutual']
+                })
+    if rows:
+        st.dataframe(rows, use_container_width=True)
+    else:
+        st.info("No aligned clauses for the retrieved chunks.")
 
 def display_chunk_results(title: str, result_text: str, color: str):
     """
@@ -48,14 +161,14 @@ def display_chunk_results(title: str, result_text: str, color: str):
 
 def main():
     st.set_page_config(
-        page_title="AXA vs Generali Document Search",
+        page_title="Insurance Document Search",
         page_icon="🔍",
         layout="wide"
     )
     st.title("🔍 Search Insurance Documents")
 
     st.markdown("""
-    Easily find and compare specific information from two insurance documents, side by side. 
+    Easily find and compare specific information from several insurance documents, side by side. 
 
     This tool helps you quickly locate key details, clauses, or coverage points across different insurers—saving you time and making analysis effortless.
     """)
@@ -64,6 +177,12 @@ def main():
     st.header("1. Please select insurance type")
     insurance_type = st.radio("Select Insurance Type:", ("Car", "Travel"))
     product_type = insurance_type.lower()
+    insurers = st.multiselect(
+        "Select insurers to compare:",
+        options=list(INSURERS),
+        default=DEFAULT_INSURERS,
+        format_func=insurer_label
+    )
 
     # Section 2: User input and button
     st.header(f"2. What do you want to compare?")
@@ -73,36 +192,29 @@ def main():
         height=100,
         label_visibility="collapsed"
     )
+    use_cache = st.sidebar.checkbox(
+        "Reuse answers to similar questions",
+        value=True,
+        help="Semantic cache: a near-duplicate question on the same product and insurers returns the cached results."
+    )
     run_button = st.button(
         "🚀 Run Comparison",
         type="secondary"
     )
 
     # Section 3: Run and display results
-    if run_button and user_query.strip():
+    if run_button and user_query.strip() and insurers:
         st.markdown("---")
-        with st.spinner("🔄 Running comparison agent..."):
-            initial_state = CompareState(
-                user_input=user_query,
-                product=product_type,
-                axa_result="",
-                generali_result="",
-                comparison=""
-            )
-            results = run_agent_comparison(initial_state)
+        initial_state = CompareState(
+            user_input=user_query,
+            product=product_type,
+            insurers=insurers,
+            insurer_results={},
+            comparison="",
+            use_cache=use_cache
+        )
+        results, trace = run_agent_comparison(initial_state)
         if results:
-            st.header("📊 Agent Results")
-            col1, col2 = st.columns(2)
-            with col1:
-                display_chunk_results("🔵 AXA Agent", results['axa_result'], "#0066cc")
-            with col2:
-                display_chunk_results("🟢 Generali Agent", results['generali_result'], "#00cc66")
-            st.markdown("---")
-            st.subheader("📋 Comparison Table")
-            if results['comparison']:
-                st.markdown(results['comparison'])
-            else:
-                st.warning("No comparison generated.")
             st.markdown("---")
             st.header("ℹ️ Technical Information")
             col1, col2 = st.columns(2)
@@ -110,8 +222,21 @@ def main():
                 st.info(f"**Query:** {user_query}")
             with col2:
                 st.info("**Status:** ✅ Completed")
+            if results.get('cache_hit'):
+                st.info(
+                    f"**Cache:** answered from a similar question "
+                    f"(\"{results['cache_hit']['query']}\", similarity {results['cache_hit']['similarity']:.3f})"
+                )
+            elif results.get('comparison_cached'):
+                st.info("**Cache:** comparison reused from an earlier question that retrieved the same chunks for every insurer")
+            with st.expander("🔗 Aligned clauses across insurers"):
+                display_aligned_clauses(results, product_type, insurers)
+            with st.expander("⏱️ Trace (per-node latency and tokens)"):
+                display_trace(trace)
     elif run_button and not user_query.strip():
         st.error("❌ Please enter a question before running the comparison.")
+    elif run_button and not insurers:
+        st.error("❌ Please select at least one insurer.")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -1,10 +1,17 @@
 import streamlit as st
 import os
 import requests
-import openai
+import sys
+from pathlib import Path
 from dotenv import load_dotenv
 from datetime import datetime
 
+# Add root directory to path for module imports
+root_path = Path(__file__).parent.parent.parent.parent
+sys.path.append(str(root_path))
+
+from agent.clients import get_openai_client
+
 load_dotenv()
 
 st.title("📰 Market News Analysis")
@@ -63,7 +70,7 @@ def summarize_with_llm(perplexity_response, product, current_date):
     if not api_key:
         st.error("No OpenAI API key found in environment variable OPENAI_API_KEY.")
         return None
-    client = openai.OpenAI(api_key=api_key)
+    client = get_openai_client()
     prompt = (
         f"Today is {current_date}. You are an expert in insurance market positioning working for Generali.\n\n"
         f"Based on the news below, write a concise market news summary for Generali Switzerland ({product} insurance). "
@@ -5,12 +5,13 @@ Script de test pour l'agent LangGraph de comparaison d'assurances.
 
 from agent.graph import compile_agent
 from agent.state import CompareState
+from agent.insurers import DEFAULT_INSURERS, insurer_label
 
 def run_agent_test():
     """
     Teste l'agent avec une requête utilisateur.
     """
-    print("🤖 Agent de comparaison d'assurances AXA vs Generali")
+    print(f"🤖 Agent de comparaison d'assurances {' vs '.join(insurer_label(i) for i in DEFAULT_INSURERS)}")
     print("=" * 60)
     
     # Demander la requête à l'utilisateur
@@ -26,9 +27,9 @@ def run_agent_test():
     # Initialiser l'état
     initial_state = CompareState(
         user_input=user_query,
-        detected_category="",
-        axa_result="",
-        generali_result="",
+        product="car",
+        insurers=DEFAULT_INSURERS,
+        insurer_results={},
         comparison=""
     )
     
@@ -48,21 +49,13 @@ def run_agent_test():
         print("📊 RÉSULTATS DE L'AGENT")
         print("=" * 60)
         
-        # 1. Catégorie détectée
-        print(f"\n🏷️  CATÉGORIE DÉTECTÉE:")
-        print(f"   {final_state['detected_category']}")
-        
-        # 2. Résultats AXA
-        print(f"\n🔵 RÉSULTATS AXA:")
-        print("-" * 30)
-        print(final_state['axa_result'])
-        
-        # 3. Résultats Generali
-        print(f"\n🟢 RÉSULTATS GENERALI:")
-        print("-" * 30)
-        print(final_state['generali_result'])
+        # 1. Résultats par assureur
+        for insurer in DEFAULT_INSURERS:
+            print(f"\n🔎 RÉSULTATS {insurer_label(insurer).upper()}:")
+            print("-" * 30)
+            print(final_state['insurer_results'].get(insurer, ''))
         
-        # 4. Comparaison finale
+        # 2. Comparaison finale
         print(f"\n⚖️  COMPARAISON FINALE:")
         print("-" * 30)
         print(final_state['comparison'])
@@ -77,8 +70,7 @@ def run_agent_test():
         traceback.print_exc()
 
 if __name__ == "__main__":
-    from agent.nodes.axa_rag import run_axa
-    from agent.nodes.generali_rag import run_generali
+    from agent.nodes.insurer_rag import make_insurer_node
 
     # Test query
     query = "what are the deductibles"
@@ -87,20 +79,16 @@ if __name__ == "__main__":
     state = CompareState(
         user_input=query,
         product="car",
-        axa_result="",
-        generali_result="",
+        insurers=DEFAULT_INSURERS,
+        insurer_results={},
         comparison=""
     )
 
-    # Run AXA agent
-    axa_state = run_axa(state.copy())
-    print("AXA Agent Result:")
-    print(axa_state["axa_result"])
-    print("\n" + "-"*60 + "\n")
-
-    # Run Generali agent
-    generali_state = run_generali(state.copy())
-    print("Generali Agent Result:")
-    print(generali_state["generali_result"])
+    # Run each insurer agent on its own
+    for insurer in DEFAULT_INSURERS:
+        update = make_insurer_node(insurer)(state.copy())
+        print(f"{insurer_label(insurer)} Agent Result:")
+        print(update["insurer_results"][insurer])
+        print("\n" + "-"*60 + "\n")
 
     run_agent_test() 
\ No newline at end of file
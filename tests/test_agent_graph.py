@@ -0,0 +1,560 @@
+import os
+import time
+import asyncio
+import shutil
+import tempfile
+import threading
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import numpy as np
+
+from agent import clients
+from agent.chains.backends import LocalBackend, PineconeBackend
+from agent.chains.rag import RAGChain
+from agent.chains.context import pack_context
+from agent.chains.quantization import QuantizedMatrix
+from agent.chains.expansion import QueryExpander, synonym_variants
+from agent.chains.router import CategoryRouter
+from agent.caching import index_version
+from agent.graph import compile_agent, stream_agent, astream_agent
+from agent.insurers import INSURERS
+from agent.tracing import trace_request, export_trace, summarize_traces
+from src.vectorization.align_clauses import build_alignments, save_alignments, load_alignment_index
+from src.vectorization.doc_store import DocStore
+from src.vectorization.index_settings import IndexSettings
+from src.vectorization.manifest import save_manifest
+from src.vectorization.standins import LocalEmbeddingServer, InMemoryIndex
+from src.processors.categorize_chunks import TAXONOMY
+
+
+class SlowBackend(LocalBackend):
+    """Local backend with a fixed per-query latency, like a remote index."""
+
+    def __init__(self, latency):
+        super().__init__()
+        self.latency = latency
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def query(self, vector, insurer, product, top_k=10, categories=None):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.latency)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+        return super().query(vector, insurer, product, top_k=top_k, categories=categories)
+
+    async def aquery(self, vector, insurer, product, top_k=10, categories=None):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+        return LocalBackend.query(self, vector, insurer, product, top_k=top_k, categories=categories)
+
+
+class StandInChat:
+    """Records the prompts sent to the comparison model."""
+
+    def __init__(self):
+        self.prompts = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, messages, stream=False, **kwargs):
+        self.prompts.append(messages[-1]['content'])
+        if stream:
+            return iter([
+                SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=token))])
+                for token in ('compa', 'rison')
+            ])
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content='comparison'))])
+
+
+class AsyncStandIn:
+    """Async facade over the sync stand-ins, like AsyncOpenAI over OpenAI."""
+
+    def __init__(self, embeddings=None, chat=None):
+        self.calls = 0
+        self._embeddings = embeddings
+        self._chat = chat
+        self.embeddings = SimpleNamespace(create=self.create_embedding)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create_completion))
+
+    async def create_embedding(self, **kwargs):
+        self.calls += 1
+        return self._embeddings.embeddings.create(**kwargs)
+
+    async def create_completion(self, **kwargs):
+        chunks = self._chat.create(**kwargs)
+
+        async def stream():
+            for chunk in chunks:
+                yield chunk
+        return stream()
+
+
+class TestAgentGraph(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.server = LocalEmbeddingServer(dimensions=8)
+        self.backend = SlowBackend(latency=0.2)
+        self.doc_store = DocStore(os.path.join(self.workdir, 'doc_store.sqlite'))
+        for insurer in INSURERS:
+            texts = [f'{insurer} franchise', f'{insurer} bris de glace']
+            ids = [f'{insurer}-car-{i}' for i in range(len(texts))]
+            vectors = np.array([self.server.embeddings.create(input=[text], model='m').data[0].embedding for text in texts])
+            metadata = [{'section': 'B', 'subsection': f'B{i}', 'insurer': insurer.capitalize(), 'product': 'car'}
+                        for i in range(len(texts))]
+            self.backend.add_partition(insurer, 'car', ids, vectors, metadata)
+            self.doc_store.upsert_many([
+                {'id': vector_id, 'insurer': insurer, 'product': 'car', 'section': 'B', 'subsection': '',
+                 'category': '', 'content': text, 'content_hash': ''}
+                for vector_id, text in zip(ids, texts)
+            ])
+        self.chat = StandInChat()
+        self.async_server = AsyncStandIn(embeddings=self.server)
+        self.chain = RAGChain(backend=self.backend, openai_client=self.server, doc_store=self.doc_store,
+                              settings=IndexSettings(dimensions=8), async_openai_client=self.async_server)
+        clients._registry._instances.update({
+            'rag_chain': self.chain, 'openai': self.chat, 'async_openai': AsyncStandIn(chat=self.chat)
+        })
+
+    def tearDown(self):
+        clients.reset_clients()
+        shutil.rmtree(self.workdir)
+
+    def _invoke(self, insurers, **state):
+        return compile_agent().invoke(dict({
+            'user_input': 'franchise', 'product': 'car', 'insurers': insurers,
+            'insurer_results': {}, 'comparison': ''
+        }, **state))
+
+    def test_insurers_are_searched_in_parallel(self):
+        state = self._invoke(list(INSURERS))
+
+        self.assertEqual(set(state['insurer_results']), set(INSURERS))
+        self.assertIn('franchise', state['insurer_results']['zurich'])
+        self.assertGreater(self.backend.max_in_flight, 1)
+        self.assertEqual(state['comparison'], 'comparison')
+        self.assertTrue(all(label in self.chat.prompts[-1] for label in INSURERS.values()))
+
+    def test_async_path_runs_on_the_shared_loop(self):
+        state = clients.run_async(compile_agent().ainvoke({
+            'user_input': 'franchise', 'product': 'car', 'insurers': list(INSURERS),
+            'insurer_results': {}, 'comparison': ''
+        }))
+        self.assertEqual(set(state['insurer_results']), set(INSURERS))
+        self.assertEqual(state['comparison'], 'comparison')
+        self.assertEqual(self.async_server.calls, 1)
+        self.assertGreater(self.backend.max_in_flight, 1)
+        self.assertIs(compile_agent(), compile_agent())
+
+        events = list(clients.iterate_async(astream_agent({'user_input': 'glass', 'product': 'car', 'insurers': ['axa'],
+                                                           'insurer_results': {}, 'comparison': ''})))
+        self.assertEqual([payload for kind, payload in events if kind == 'token'], ['compa', 'rison'])
+
+    def test_query_is_embedded_once(self):
+        calls = self.server.calls
+        self._invoke(['axa', 'generali'])
+        self._invoke(['axa', 'generali'])
+        self.assertEqual(self.server.calls - calls, 1)
+
+    def test_only_selected_insurers_run(self):
+        state = self._invoke(['generali', 'unknown'])
+        self.assertEqual(list(state['insurer_results']), ['generali'])
+
+    def test_unknown_insurers_only_report_an_error(self):
+        state = self._invoke(['unknown'])
+        self.assertEqual(state['insurer_results'], {})
+        self.assertTrue(state['comparison'].startswith('Error'))
+        self.assertIn('unknown', state['comparison'])
+        self.assertEqual(self.chat.prompts, [])
+
+    def test_comparison_tokens_are_streamed(self):
+        events = list(stream_agent({'user_input': 'franchise', 'product': 'car', 'insurers': ['axa'],
+                                    'insurer_results': {}, 'comparison': ''}))
+        tokens = [payload for kind, payload in events if kind == 'token']
+        self.assertEqual(tokens, ['compa', 'rison'])
+        states = [payload for kind, payload in events if kind == 'state']
+        self.assertEqual(states[-1]['comparison'], 'comparison')
+        # Retrieval results are available before the first token
+        first_token = next(i for i, (kind, _) in enumerate(events) if kind == 'token')
+        self.assertTrue(any(kind == 'state' and payload.get('insurer_results') for kind, payload in events[:first_token]))
+
+    def test_semantic_cache_reuses_answers_until_the_index_changes(self):
+        previous_cwd = os.getcwd()
+        os.chdir(self.workdir)
+        try:
+            first = self._invoke(['axa', 'generali'], use_cache=True)
+            second = self._invoke(['generali', 'axa'], use_cache=True)
+            self.assertEqual(len(self.chat.prompts), 1)
+            self.assertAlmostEqual(second['cache_hit']['similarity'], 1.0, places=5)
+            self.assertEqual(second['insurer_results'], first['insurer_results'])
+
+            self._invoke(['axa'], use_cache=True)
+            self.assertEqual(len(self.chat.prompts), 2)
+
+            save_manifest('axa', 'car', {'axa-car-0': 'hash'})
+            third = self._invoke(['axa', 'generali'], use_cache=True)
+            self.assertIsNone(third['cache_hit'])
+            self.assertEqual(len(self.chat.prompts), 3)
+        finally:
+            os.chdir(previous_cwd)
+
+    def test_index_version_can_be_pinned_without_local_manifests(self):
+        with patch.dict(os.environ, {'INDEX_VERSION': '2026-10-19'}):
+            pinned = index_version()
+        self.assertTrue(pinned.endswith('-2026-10-19'))
+        self.assertNotEqual(index_version(), pinned)
+
+    def test_comparison_is_reused_across_phrasings(self):
+        previous_cwd = os.getcwd()
+        os.chdir(self.workdir)
+        try:
+            first = self._invoke(['axa', 'generali'], use_cache=True)
+            second = self._invoke(['axa', 'generali'], use_cache=True, user_input='bris de glace')
+            self.assertIsNone(second['cache_hit'])
+            # Same chunks, possibly ranked differently
+            self.assertEqual({insurer: sorted(ids) for insurer, ids in second['insurer_evidence'].items()},
+                             {insurer: sorted(ids) for insurer, ids in first['insurer_evidence'].items()})
+            self.assertTrue(second['comparison_cached'])
+            self.assertEqual(second['comparison'], first['comparison'])
+            self.assertEqual(len(self.chat.prompts), 1)
+            self.assertEqual(len(clients.get_comparison_cache()), 1)
+            # Nothing phrasing-dependent like retrieval scores goes into the cached prompt
+            self.assertNotIn('Score:', self.chat.prompts[0])
+        finally:
+            os.chdir(previous_cwd)
+
+    def test_checklist_answers_every_criterion_with_one_embedding_call(self):
+        from agent.checklist import run_checklist, criteria_questions, CRITERIA_MODELS
+        self.backend.latency = 0.005
+        calls = self.server.calls
+        rows = run_checklist('car', ['axa', 'generali'], rag_chain=self.chain, openai_client=self.chat, max_workers=4)
+        criteria = criteria_questions(CRITERIA_MODELS['car'])
+        self.assertEqual(self.server.calls - calls, 1)
+        self.assertEqual([row['Key'] for row in rows], [criterion['key'] for criterion in criteria])
+        self.assertEqual(rows[0]['Section'], 'General')
+        self.assertEqual(rows[0]['Criterion'], 'Payment frequency')
+        self.assertTrue(all(row['AXA'] == 'comparison' and row['Generali'] == 'comparison' for row in rows))
+        self.assertEqual(len(self.chat.prompts), 2 * len(criteria))
+
+    def test_nodes_and_external_calls_are_traced(self):
+        state = {'user_input': 'franchise', 'product': 'car', 'insurers': ['axa', 'generali'],
+                 'insurer_results': {}, 'comparison': ''}
+        with trace_request(query='franchise') as sync_trace:
+            list(stream_agent(state))
+        with trace_request(query='franchise') as async_trace:
+            list(clients.iterate_async(astream_agent(state)))
+
+        for trace in (sync_trace, async_trace):
+            spans = {(record['kind'], record['name']) for record in trace.spans}
+            self.assertTrue({('node', 'embed_query'), ('node', 'axa_search'), ('node', 'generali_search'),
+                             ('node', 'compare'), ('embedding', 'embed_query'), ('vector', 'vector_query'),
+                             ('chat', 'chat_completion')} <= spans)
+            searches = [record for record in trace.spans if record['name'] == 'axa_search']
+            self.assertGreaterEqual(searches[0]['duration_ms'], 1000 * self.backend.latency * 0.9)
+        # The second request reuses the cached query embedding
+        self.assertTrue(next(record for record in async_trace.spans if record['kind'] == 'embedding')['cache_hit'])
+
+        path = os.path.join(self.workdir, 'traces.jsonl')
+        export_trace(sync_trace, path)
+        export_trace(async_trace, path)
+        summary = {row['span']: row for row in summarize_traces(path)}
+        self.assertEqual(summary['request']['count'], 2)
+        self.assertGreaterEqual(summary['node:axa_search']['p95_ms'], summary['node:axa_search']['p50_ms'])
+
+
+class TestGroupedSearch(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.doc_store = DocStore(os.path.join(self.workdir, 'doc_store.sqlite'))
+        self.index = InMemoryIndex()
+        rng = np.random.default_rng(0)
+        self.query = np.eye(8)[0]
+        # AXA chunks are all closer to the query than Generali's
+        for insurer, closeness in (('axa', 1.0), ('generali', 0.3)):
+            vectors = closeness * self.query + 0.1 * rng.standard_normal((10, 8))
+            self.index.upsert(vectors=[
+                (f'{insurer}-car-{i}', vector, {'insurer': insurer.capitalize(), 'product': 'car', 'section': 'B'})
+                for i, vector in enumerate(vectors)
+            ])
+            self.doc_store.upsert_many([
+                {'id': f'{insurer}-car-{i}', 'insurer': insurer, 'product': 'car', 'section': 'B', 'subsection': '',
+                 'category': '', 'content': f'{insurer} {i}', 'content_hash': ''}
+                for i in range(10)
+            ])
+
+    def tearDown(self):
+        self.doc_store.close()
+        shutil.rmtree(self.workdir)
+
+    def _chain(self, layout):
+        settings = IndexSettings(dimensions=8, namespace_layout=layout)
+        return RAGChain(backend=PineconeBackend(self.index, settings=settings), openai_client=LocalEmbeddingServer(8),
+                        doc_store=self.doc_store, settings=settings)
+
+    def test_one_query_with_in_filter(self):
+        results = self._chain('shared').search_many('q', ['axa', 'generali'], 'car', top_k=2, embedding=self.query, overfetch=5)
+        self.assertEqual(self.index.query_calls, 1)
+        self.assertEqual([len(results['axa']), len(results['generali'])], [2, 2])
+        self.assertTrue(all(result['content'].startswith('generali') for result in results['generali']))
+
+    def test_under_represented_insurer_gets_fallback_query(self):
+        results = self._chain('shared').search_many('q', ['axa', 'generali'], 'car', top_k=2, embedding=self.query, overfetch=1)
+        self.assertEqual(self.index.query_calls, 2)
+        self.assertEqual(len(results['generali']), 2)
+        expected = self.index.query(self.query, top_k=2, filter={'insurer': 'Generali'}).matches
+        self.assertEqual([result['id'] for result in results['generali']], [match.id for match in expected])
+
+
+class TestHybridSearch(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.server = LocalEmbeddingServer(dimensions=8)
+        self.doc_store = DocStore(os.path.join(self.workdir, 'doc_store.sqlite'))
+        texts = [f'Allgemeine Bestimmung Nummer {i}' for i in range(30)]
+        texts[17] = 'Parkschäden sind bei Grobfahrlässigkeit nicht versichert.'
+        chunks = [
+            {'id': f'axa-car-{i}', 'insurer': 'axa', 'product': 'car', 'section': 'B', 'subsection': f'B{i} - Titel',
+             'category': '', 'content': text, 'content_hash': ''}
+            for i, text in enumerate(texts)
+        ]
+        self.doc_store.upsert_many(chunks)
+        backend = LocalBackend()
+        vectors = np.array([self.server.vector(text) for text in texts])
+        backend.add_partition('axa', 'car', [chunk['id'] for chunk in chunks], vectors,
+                              [{'insurer': 'Axa', 'product': 'car', 'subsection': chunk['subsection']} for chunk in chunks])
+        self.chain = RAGChain(backend=backend, openai_client=self.server, doc_store=self.doc_store,
+                              settings=IndexSettings(dimensions=8))
+
+    def tearDown(self):
+        self.doc_store.close()
+        shutil.rmtree(self.workdir)
+
+    def test_exact_terms_are_fused_into_vector_results(self):
+        vector_only = RAGChain(backend=self.chain.backend, openai_client=self.server, doc_store=self.doc_store,
+                               settings=self.chain.settings, hybrid=False)
+        self.assertNotIn('axa-car-17', [r['id'] for r in vector_only.search('Parkschaden Grobfahrlassigkeit', 'Axa', 'car', top_k=3)])
+        results = self.chain.search('Parkschaden Grobfahrlassigkeit', 'Axa', 'car', top_k=3)
+        self.assertIn('axa-car-17', [result['id'] for result in results])
+        # The fused score is kept apart from the vector similarity
+        cosine = {r['id']: r['score'] for r in vector_only.search('Parkschaden Grobfahrlassigkeit', 'Axa', 'car', top_k=6)}
+        self.assertTrue(any(result['id'] in cosine for result in results))
+        for result in results:
+            if result['id'] in cosine:
+                self.assertAlmostEqual(result['score'], cosine[result['id']], places=6)
+        self.assertEqual([r['rrf_score'] for r in results], sorted((r['rrf_score'] for r in results), reverse=True))
+        # axa-car-17 is only found by BM25: no cosine score to report
+        lexical_only = next(result for result in results if result['id'] == 'axa-car-17')
+        self.assertNotIn('axa-car-17', cosine)
+        self.assertIsNone(lexical_only['score'])
+        self.assertGreater(lexical_only['bm25_score'], 0)
+
+    def test_section_lookup_skips_the_embedding(self):
+        calls = self.server.calls
+        results = self.chain.search('section B12', 'Axa', 'car', top_k=3)
+        self.assertEqual(self.server.calls, calls)
+        self.assertEqual([result['subsection'] for result in results], ['B12 - Titel'])
+        # A bare number is an amount or a duration, not a section
+        self.chain.search('12', 'Axa', 'car', top_k=3)
+        self.assertEqual(self.server.calls, calls + 1)
+
+    def test_query_variants_are_embedded_together_and_fused(self):
+        self.assertEqual(synonym_variants('Parking damage'), ['parkschaden', 'dommages de parking'])
+        # The German clause is only close to the German wording of the query
+        backend = LocalBackend()
+        ids = [f'axa-car-{i}' for i in range(30)]
+        vectors = np.array([self.server.vector(f'Allgemeine Bestimmung Nummer {i}') for i in range(30)])
+        vectors[17] = self.server.vector('parkschaden')
+        backend.add_partition('axa', 'car', ids, vectors, [{'insurer': 'Axa', 'product': 'car'} for _ in ids])
+        self.chain.backend = backend
+        vector_only = RAGChain(backend=self.chain.backend, openai_client=self.server, doc_store=self.doc_store,
+                               settings=self.chain.settings, hybrid=False)
+        self.assertNotIn('axa-car-17', [r['id'] for r in vector_only.search('Parking damage', 'Axa', 'car', top_k=3)])
+
+        expanded = RAGChain(backend=self.chain.backend, openai_client=self.server, doc_store=self.doc_store,
+                            settings=self.chain.settings, hybrid=False, expander=QueryExpander('synonyms'))
+        calls = self.server.calls
+        results = expanded.search('Parking damage', 'Axa', 'car', top_k=3)
+        self.assertEqual(self.server.calls - calls, 1)
+        self.assertIn('axa-car-17', [result['id'] for result in results])
+        self.assertEqual(len({result['id'] for result in results}), 3)
+
+    def test_model_expansion_has_its_own_timeout(self):
+        options = {}
+
+        class StandInExpansionModel:
+            def with_options(self, **kwargs):
+                options.update(kwargs)
+                return self
+
+            @property
+            def chat(self):
+                message = SimpleNamespace(content='- Selbstbehalt\n- deductible')
+                response = SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+                return SimpleNamespace(completions=SimpleNamespace(create=lambda **kwargs: response))
+
+        expander = QueryExpander('model', budget_ms=50, openai_client=StandInExpansionModel(), model_timeout_ms=1500)
+        self.assertEqual(expander.expand('franchise'), ['Selbstbehalt', 'deductible'])
+        self.assertEqual(options, {'timeout': 1.5, 'max_retries': 0})
+
+    def test_routed_categories_restrict_the_search(self):
+        router = CategoryRouter('keywords')
+        self.assertEqual(router.route('Selbstbehalt bei Diebstahl'), [TAXONOMY[2], TAXONOMY[5]])
+        self.assertEqual(router.route('Wie lange dauert es?'), [])
+
+        categories = [TAXONOMY[5] if i == 17 else TAXONOMY[0] for i in range(30)]
+        self.doc_store.upsert_many([
+            dict(chunk, category=category)
+            for chunk, category in zip(self.doc_store.partition('axa', 'car'), categories)
+        ])
+        backend = LocalBackend(quantization='int8')
+        ids = [f'axa-car-{i}' for i in range(30)]
+        vectors = np.array([self.server.vector(f'Allgemeine Bestimmung Nummer {i}') for i in range(30)])
+        backend.add_partition('axa', 'car', ids, vectors,
+                              [{'insurer': 'Axa', 'product': 'car', 'category': category} for category in categories])
+        routed = RAGChain(backend=backend, openai_client=self.server, doc_store=self.doc_store,
+                          settings=self.chain.settings, router=router)
+        self.assertEqual([result['id'] for result in routed.search('Parkschaden', 'Axa', 'car', top_k=3)], ['axa-car-17'])
+
+        # A partition without chunks of the routed categories is searched whole
+        self.assertEqual(len(self.chain.search('Parkschaden', 'Axa', 'car', top_k=3)), 3)
+        uncategorized = RAGChain(backend=self.chain.backend, openai_client=self.server, doc_store=self.doc_store,
+                                 settings=self.chain.settings, hybrid=False, router=router)
+        self.assertEqual(len(uncategorized.search('Parkschaden', 'Axa', 'car', top_k=3)), 3)
+
+
+class TestClauseAlignment(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.doc_store = DocStore(os.path.join(self.workdir, 'doc_store.sqlite'))
+        rng = np.random.default_rng(0)
+        topics = rng.standard_normal((4, 8))
+        self.partitions = {}
+        # Generali numbers the same clauses differently and in another order
+        for insurer, order, name in (('axa', [0, 1, 2, 3], 'B{}'), ('generali', [2, 0, 3, 1], '{}.')):
+            chunks = [
+                {'id': f'{insurer}-car-{i}', 'insurer': insurer, 'product': 'car', 'section': 'B',
+                 'subsection': f'{name.format(i + 20 if insurer == "generali" else i)} - Titel', 'category': '',
+                 'content': f'{insurer} {i}', 'content_hash': ''}
+                for i in range(4)
+            ]
+            self.doc_store.upsert_many(chunks)
+            vectors = topics[order] + 0.05 * rng.standard_normal((4, 8))
+            self.partitions[insurer] = (chunks, vectors / np.linalg.norm(vectors, axis=1, keepdims=True))
+
+    def tearDown(self):
+        self.doc_store.close()
+        shutil.rmtree(self.workdir)
+
+    def test_clauses_are_aligned_across_insurers(self):
+        save_alignments(build_alignments(self.partitions, 'car', top_k=2, min_score=0.0), self.workdir)
+        index = load_alignment_index('car', self.workdir)
+        best = index.aligned('axa', 'axa-car-0', 'generali')[0]
+        self.assertEqual((best['id'], best['subsection'], best['mutual']), ('generali-car-1', '21. - Titel', True))
+        self.assertEqual(index.aligned('generali', 'generali-car-1')[0]['id'], 'axa-car-0')
+
+        # A section Generali does not have resolves to its aligned clause, without any embedding
+        server = LocalEmbeddingServer(8)
+        backend = LocalBackend()
+        for insurer, (chunks, vectors) in self.partitions.items():
+            backend.add_partition(insurer, 'car', [chunk['id'] for chunk in chunks], vectors, [{} for _ in chunks])
+        chain = RAGChain(backend=backend, openai_client=server, doc_store=self.doc_store,
+                         settings=IndexSettings(dimensions=8))
+        with patch.dict(os.environ, {'ALIGNMENT_DIR': self.workdir}):
+            results = chain.search_many('section B0', ['axa', 'generali'], 'car', top_k=1)
+        self.assertEqual(server.calls, 0)
+        self.assertEqual([results['axa'][0]['id'], results['generali'][0]['id']], ['axa-car-0', 'generali-car-1'])
+        self.assertEqual(results['generali'][0]['content'], 'generali 1')
+
+
+class TestQuantization(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        centers = rng.standard_normal((20, 32))
+        corpus = centers[rng.integers(0, 20, 1000)] + 0.5 * rng.standard_normal((1000, 32))
+        self.corpus = (corpus / np.linalg.norm(corpus, axis=1, keepdims=True)).astype(np.float32)
+        self.queries = self.corpus[:50] + 0.05 * rng.standard_normal((50, 32)).astype(np.float32)
+
+    def test_scores_approximate_exact_inner_products(self):
+        exact = self.corpus @ self.queries[0]
+        for kind, tolerance in (('float16', 1e-3), ('int8', 0.05)):
+            quantized = QuantizedMatrix(self.corpus, kind)
+            np.testing.assert_allclose(quantized.scores(self.queries[0]), exact, atol=tolerance)
+        self.assertEqual(QuantizedMatrix(self.corpus, 'int8').bytes_per_vector, 32 + 4)
+
+    def test_recall_and_resident_bytes(self):
+        ids = [str(i) for i in range(len(self.corpus))]
+
+        def top_ids(backend):
+            return [{match['id'] for match in backend.query(query, 'axa', 'car', top_k=10)} for query in self.queries]
+
+        exact = LocalBackend()
+        exact.add_partition('axa', 'car', ids, self.corpus, [{} for _ in ids])
+        truth = top_ids(exact)
+        for rescore_factor, min_recall in ((0, 0.8), (4, 0.98)):
+            backend = LocalBackend(quantization='int8', rescore_factor=rescore_factor)
+            backend.add_partition('axa', 'car', ids, self.corpus, [{} for _ in ids],
+                                  exact_vectors=lambda rows: self.corpus[rows])
+            recall = np.mean([len(found & expected) / 10 for found, expected in zip(top_ids(backend), truth)])
+            self.assertGreaterEqual(recall, min_recall)
+            self.assertEqual(backend.partitions[('axa', 'car')].bytes_per_vector, 32 + 4)
+
+        # Without an external store of exact vectors, re-scoring keeps the float32 copy resident
+        resident = LocalBackend(quantization='int8')
+        resident.add_partition('axa', 'car', ids, self.corpus, [{} for _ in ids])
+        self.assertEqual(resident.partitions[('axa', 'car')].bytes_per_vector, 32 + 4 + 32 * 4)
+
+
+class TestContextPacking(unittest.TestCase):
+
+    def setUp(self):
+        self.results = [
+            {'id': 'a', 'score': 0.9, 'content': 'Allgemeine Bestimmungen gelten. Die Franchise beträgt CHF 500 bei Parkschaden. '
+                                                 'Der Versicherer zahlt innert 30 Tagen. ' + 'Füllsatz ohne Bezug. ' * 40},
+            {'id': 'b', 'score': 0.8, 'content': 'Die Franchise beträgt CHF 500 bei Parkschaden. Glasbruch ist ohne Franchise gedeckt.'}
+        ]
+
+    def test_relevant_sentences_fit_the_budget_with_tags(self):
+        packed = pack_context('axa', self.results, 'Franchise Parkschaden', token_budget=40)
+        self.assertEqual([result['tag'] for result in packed], ['AXA-1', 'AXA-2'])
+        self.assertIn('Franchise beträgt CHF 500 bei Parkschaden', packed[0]['excerpt'])
+        self.assertNotIn('Füllsatz', packed[0]['excerpt'])
+        # The sentence shared by both chunks is only kept once
+        self.assertNotIn('Parkschaden', packed[1]['excerpt'])
+        self.assertIn('Glasbruch', packed[1]['excerpt'])
+
+    def test_prompt_context_is_bounded(self):
+        from agent.nodes.insurer_rag import format_results
+        from src.vectorization.batching import estimate_tokens
+        long = [dict(result, content=result['content'] * 20, section='B', subsection='B1') for result in self.results]
+        self.assertLess(estimate_tokens(format_results('axa', long, 'Franchise')), 700)
+        self.assertIn('[AXA-1]', format_results('axa', long, 'Franchise'))
+
+    def test_hits_without_a_kept_sentence_are_still_listed(self):
+        from agent.nodes.insurer_rag import format_results
+        results = [dict(result, section='B', subsection=f'B{i}') for i, result in enumerate(self.results, 1)]
+        results.append({'id': 'c', 'score': 0.7, 'section': 'C', 'subsection': 'C1',
+                        'content': 'Die Franchise beträgt CHF 500 bei Parkschaden.'})
+        text = format_results('axa', results, 'Franchise Parkschaden')
+        self.assertIn('3. [AXA-3] Section: C', text)
+        self.assertIn('(no relevant excerpt)', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
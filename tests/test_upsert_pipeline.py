@@ -0,0 +1,228 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from src.vectorization.pipeline import EmbedUpsertPipeline
+from src.vectorization.doc_store import DocStore
+from src.vectorization.standins import LocalEmbeddingServer, InMemoryIndex
+from src.vectorization.upsert_to_pinecone import process_insurer_upsert
+from src.vectorization.check_consistency import run_checks, list_insurers
+from src.vectorization.migrate_namespaces import migrate
+from src.vectorization.index_settings import IndexSettings
+from src.vectorization.manifest import build_records
+from src.vectorization.batching import EmbeddingStats, MAX_TOKENS_PER_INPUT, embed_with_split
+
+
+class TestEmbedUpsertPipeline(unittest.TestCase):
+
+    def test_embeddings_overlap_with_upserts(self):
+        """Plusieurs lots sont embeddés pendant qu'un lot est upserté."""
+        server = LocalEmbeddingServer(dimensions=8, latency=0.02)
+        index = InMemoryIndex(latency=0.02)
+        batches = [[f"texte {i}-{j}" for j in range(5)] for i in range(12)]
+
+        def embed(batch):
+            return [record.embedding for record in server.embeddings.create(input=batch).data]
+
+        def upsert(batch, vectors):
+            index.upsert(vectors=[(text, vector, {}) for text, vector in zip(batch, vectors)])
+
+        report = EmbedUpsertPipeline(embed, upsert, embed_workers=4, max_in_flight=4).run(batches)
+
+        self.assertTrue(report.ok)
+        self.assertEqual(len(report.succeeded), 12)
+        self.assertEqual(index.describe_index_stats()['total_vector_count'], 60)
+        self.assertGreater(server.max_in_flight, 1)
+        self.assertLessEqual(server.max_in_flight, 4)
+        self.assertEqual(report.stages['upsert'].items, 60)
+
+    def test_failed_batches_are_reported(self):
+        def embed(batch):
+            if 'boom' in batch:
+                raise RuntimeError('embedding failed')
+            return [[0.0] * 4 for _ in batch]
+
+        report = EmbedUpsertPipeline(embed, lambda batch, vectors: None).run([['a'], ['boom'], ['b']])
+
+        self.assertFalse(report.ok)
+        self.assertEqual(len(report.succeeded), 2)
+        self.assertEqual(report.failed[0][1], 'embed')
+
+    def test_oversized_inputs_fail_without_an_api_call(self):
+        requests = []
+
+        def request(texts):
+            requests.append(texts)
+            return [[1.0] for _ in texts], len(texts)
+
+        stats = EmbeddingStats()
+        vectors = embed_with_split(['a', 'x' * (MAX_TOKENS_PER_INPUT * 8), 'b'], request, stats,
+                                   ids=['a', 'big', 'b'], documents=['avb.pdf'] * 3)
+
+        self.assertEqual(vectors, [[1.0], None, [1.0]])
+        self.assertEqual(requests, [['a', 'b']])
+        self.assertEqual([failure['id'] for failure in stats.failures], ['big'])
+        self.assertEqual(stats.requests_per_document, {'avb.pdf': 1})
+
+
+class TestBuildRecords(unittest.TestCase):
+
+    def test_generali_documents_get_distinct_stable_ids(self):
+        """Les chunks Generali portent leur PDF source sous `pdf` : mêmes sections, documents distincts."""
+        chunks = [
+            {'pdf': pdf, 'section': '2. Casco', 'subsection': '24. Franchise', 'content': f'Franchise {pdf}'}
+            for pdf in ('avb-de.pdf', 'avb-fr.pdf')
+        ]
+        ids = [record['id'] for record in build_records(chunks, 'generali', 'car')]
+        self.assertEqual(len(set(ids)), 2)
+        self.assertEqual(ids, [record['id'] for record in build_records(chunks[::-1], 'generali', 'car')][::-1])
+
+
+class TestProcessInsurerUpsert(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.previous_cwd = os.getcwd()
+        os.chdir(self.workdir)
+        os.makedirs('data/processed/axa/chunks')
+        self.chunks = [
+            {'pdf_name': 'avb.pdf', 'section': 'Partie B', 'subsection': f'B{i} - Titre', 'content': f'Contenu {i}'}
+            for i in range(1, 251)
+        ]
+        self.server = LocalEmbeddingServer(dimensions=8)
+        self.index = InMemoryIndex()
+
+    def tearDown(self):
+        os.chdir(self.previous_cwd)
+        shutil.rmtree(self.workdir)
+
+    def _run(self, **kwargs):
+        kwargs.setdefault('max_batch_items', 100)
+        kwargs.setdefault('settings', IndexSettings(dimensions=8, namespace_layout='partitioned'))
+        with open('data/processed/axa/chunks/axa_chunks.json', 'w', encoding='utf-8') as f:
+            json.dump(self.chunks, f)
+        upsert_calls = self.index.upsert_calls
+        ok = process_insurer_upsert('axa', None, self.server, self.index, 'text-embedding-3-small', product='car', **kwargs)
+        self.assertTrue(ok)
+        return self.index.upsert_calls - upsert_calls
+
+    def test_refresh_only_writes_the_diff(self):
+        self.assertEqual(self._run(), 3)
+        self.assertEqual(self.index.describe_index_stats()['total_vector_count'], 250)
+
+        self.assertEqual(self._run(), 0)
+
+        self.chunks[10]['content'] = 'Contenu modifié'
+        removed = self.chunks.pop(20)
+        self.assertEqual(self._run(), 1)
+
+        stored = self.index.namespaces['axa-car']
+        self.assertEqual(len(stored), 249)
+        self.assertFalse(any(meta['subsection'] == removed['subsection'] for _, meta in stored.values()))
+        self.assertFalse(any('content' in meta for _, meta in stored.values()))
+
+        doc_store = DocStore()
+        self.assertEqual(len(doc_store.partition('axa', 'car')), 249)
+        modified_id = next(vector_id for vector_id, (_, meta) in stored.items() if meta['subsection'] == self.chunks[10]['subsection'])
+        self.assertEqual(doc_store.get_many([modified_id])[modified_id]['content'], 'Contenu modifié')
+        doc_store.close()
+
+    def test_changed_index_settings_force_a_full_upsert(self):
+        """Un manifeste écrit pour un autre index, modèle ou dimension ne vaut pas pour la nouvelle cible."""
+        self.assertEqual(self._run(settings=IndexSettings(dimensions=8)), 3)
+        self.assertEqual(self._run(settings=IndexSettings(dimensions=8)), 0)
+        self.assertEqual(self._run(settings=IndexSettings(dimensions=16)), 3)
+        self.assertEqual(self._run(settings=IndexSettings(dimensions=16), index_name='autre-index'), 3)
+        self.assertEqual(self._run(settings=IndexSettings(dimensions=16), index_name='autre-index'), 0)
+
+    def test_changed_namespace_layout_forces_a_full_upsert(self):
+        """Passer de l'organisation "shared" à "partitioned" réécrit tout dans les namespaces dédiés."""
+        self.assertEqual(self._run(settings=IndexSettings(dimensions=8, namespace_layout='shared')), 3)
+        self.assertEqual(self._run(), 3)
+        self.assertEqual(len(self.index.namespaces['axa-car']), 250)
+
+    def test_migration_keeps_the_next_upsert_incremental(self):
+        """Après migrate_namespaces, les manifestes visent les nouveaux namespaces : rien n'est réécrit."""
+        self.assertEqual(self._run(settings=IndexSettings(dimensions=8, namespace_layout='shared')), 3)
+        self.assertEqual(migrate(self.index), {'axa-car': 250})
+        self.assertEqual(self.index.namespaces.get('', {}), {})
+        self.assertEqual(self._run(), 0)
+
+        self.chunks.pop(0)
+        self._run()
+        self.assertEqual(len(self.index.namespaces['axa-car']), 249)
+
+    def test_legacy_ids_are_purged_from_the_target_namespace(self):
+        """Les ids positionnels copiés par migrate_namespaces sont aussi supprimés du namespace cible."""
+        self.index.upsert(vectors=[('axa-car-1', [0.0] * 8, {})], namespace='')
+        self.index.upsert(vectors=[('axa-car-2', [0.0] * 8, {})], namespace='axa-car')
+        self._run(purge_legacy_ids=True)
+        self.assertNotIn('axa-car-1', self.index.namespaces.get('', {}))
+        self.assertNotIn('axa-car-2', self.index.namespaces['axa-car'])
+        self.assertEqual(len(self.index.namespaces['axa-car']), 250)
+
+    def test_chunk_store_is_written_only_for_upserted_vectors(self):
+        """Un upsert en échec ne laisse pas le DocStore en avance sur l'index."""
+        def failing_upsert(vectors, namespace=''):
+            raise RuntimeError('index indisponible')
+
+        self.index.upsert = failing_upsert
+        with open('data/processed/axa/chunks/axa_chunks.json', 'w', encoding='utf-8') as f:
+            json.dump(self.chunks, f)
+        self.assertFalse(process_insurer_upsert('axa', None, self.server, self.index, 'text-embedding-3-small',
+                                                product='car', max_batch_items=100))
+
+        doc_store = DocStore()
+        self.assertEqual(doc_store.partition('axa', 'car'), [])
+        doc_store.close()
+
+    def test_oversized_batches_are_split_not_dropped(self):
+        self.server.max_tokens_per_request = 400
+        for chunk in self.chunks[:5]:
+            chunk['content'] = 'x' * 1200
+
+        self._run(max_batch_items=500, max_batch_tokens=100000)
+
+        self.assertEqual(self.index.describe_index_stats()['total_vector_count'], 250)
+        self.assertGreater(self.server.calls, 1)
+
+    def test_consistency_check_repairs_only_discrepancies(self):
+        self._run()
+        stored = self.index.namespaces['axa-car']
+        ids = sorted(stored)
+        self.index.delete(ids=ids[:2], namespace='axa-car')
+        vector, meta = stored[ids[2]]
+        stored[ids[2]] = (vector, dict(meta, content_hash='0' * 16))
+        self.index.upsert(vectors=[('axa-car-stale', vector, meta)], namespace='axa-car')
+
+        settings = IndexSettings(dimensions=8, namespace_layout='partitioned')
+        report = run_checks(self.index, ['axa'], 'car', settings=settings)
+        counts = report['partitions'][0]['counts']
+        self.assertFalse(report['ok'])
+        self.assertEqual((counts['missing'], counts['stale'], counts['mismatched']), (2, 1, 1))
+
+        calls = self.server.calls
+        report = run_checks(self.index, ['axa'], 'car', settings=settings, doc_store=DocStore(),
+                            repair=True, openai_client=self.server)
+        self.assertTrue(report['ok'], report)
+        self.assertEqual(self.server.calls - calls, 1)
+        self.assertNotIn('axa-car-stale', self.index.namespaces['axa-car'])
+        self.assertEqual(len(self.index.namespaces['axa-car']), 250)
+
+    def test_stand_in_lists_ids_like_the_sdk(self):
+        """Comme `pinecone.Index.list`, les pages contiennent des ListItem et non des chaînes."""
+        self._run()
+        page = next(self.index.list(namespace='axa-car', limit=10))
+        self.assertEqual(len(page), 10)
+        self.assertTrue(all(isinstance(item.id, str) for item in page))
+        self.assertEqual([item.id for item in page], [item.id for item in page.vectors])
+
+    def test_insurers_with_only_categorized_chunks_are_checked(self):
+        os.makedirs('data/processed/generali/categorized_chunks')
+        self.assertEqual(list_insurers(), ['axa', 'generali'])
+
+
+if __name__ == '__main__':
+    unittest.main()